@@ -0,0 +1,52 @@
+from decimal import Decimal, InvalidOperation
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from store.models import Category
+from store.facets import get_category_facets
+from store.characteristics import PARAM_PREFIX, filter_by_characteristic
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Поиск товаров через полнотекстовый индекс PostgreSQL (Product.search_vector)
+    вместо icontains по полям. Результаты упорядочены по релевантности;
+    явный параметр ordering применяется после этого фильтра.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        return queryset.search(terms).order_by('-rank', '-id')
+
+
+class CharacteristicFilter(filters.BaseFilterBackend):
+    """
+    Фильтр по характеристикам с теми же параметрами, что и в каталоге:
+    ch_<параметр>=значение (можно повторять) и ch_<параметр>_min / _max для числовых.
+    Доступные параметры берутся из фасетов категории (category__slug) или всего каталога.
+    """
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if not any(key.startswith(PARAM_PREFIX) for key in params):
+            return queryset
+        category_slug = params.get('category__slug')
+        category = Category.objects.filter(slug=category_slug).first() if category_slug else None
+        for facet in get_category_facets(category).get('characteristics', []):
+            key = facet['key']
+            if facet['kind'] == 'range':
+                bounds = [self._parse_number(params, f'{key}_{suffix}') for suffix in ('min', 'max')]
+                if bounds != [None, None]:
+                    queryset = filter_by_characteristic(queryset, facet['name'], min_value=bounds[0], max_value=bounds[1])
+            elif params.getlist(key):
+                queryset = filter_by_characteristic(queryset, facet['name'], values=params.getlist(key))
+        return queryset
+
+    @staticmethod
+    def _parse_number(params, key):
+        raw = params.get(key)
+        if raw in (None, ''):
+            return None
+        try:
+            return Decimal(raw.replace(',', '.'))
+        except InvalidOperation:
+            raise ValidationError({key: 'Введите число.'})
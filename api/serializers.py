@@ -1,10 +1,10 @@
+from decimal import Decimal
 from rest_framework import serializers, exceptions
-from django.db import transaction
-from django.shortcuts import get_object_or_404
 
 from store.models import Category, Product, Review
-from orders.models import Order, OrderItem
-from orders.tasks import order_created_email
+from store.pricing import MAX_DISCOUNT, bulk_reprice
+from orders.models import Order, OrderItem, PromoCode
+from orders.services import place_order
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -30,20 +30,47 @@ class ProductSerializer(serializers.ModelSerializer):
     url = serializers.CharField(source='get_absolute_url', read_only=True)
     average_rating = serializers.FloatField(read_only=True)
     review_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.ListField(child=serializers.IntegerField(), read_only=True)
     old_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'url', 'category', 'image', 'model_3d',
-            'description', 'average_rating', 'review_count', 'brand',
+            'description', 'average_rating', 'review_count', 'rating_histogram', 'brand',
             'characteristics', 'sku', 'base_price', 'discount', 'final_price',
             'old_price', 'stock', 'available'
         ]
 
+class RepriceSerializer(serializers.Serializer):
+    """Параметры массовой переоценки: какие товары (категория, бренд, id) и что менять."""
+    category = serializers.SlugRelatedField(slug_field='slug', queryset=Category.objects.all(), required=False)
+    brand = serializers.CharField(required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    discount = serializers.IntegerField(required=False, min_value=0, max_value=MAX_DISCOUNT)
+    base_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=Decimal('0.01'))
+    base_price_percent = serializers.DecimalField(max_digits=5, decimal_places=2, required=False, min_value=-99)
+
+    def validate(self, attrs):
+        if not {'category', 'brand', 'ids'} & attrs.keys():
+            raise serializers.ValidationError('Укажите категорию, бренд или id товаров.')
+        if not {'discount', 'base_price', 'base_price_percent'} & attrs.keys():
+            raise serializers.ValidationError('Укажите скидку или новую базовую цену.')
+        if {'base_price', 'base_price_percent'} <= attrs.keys():
+            raise serializers.ValidationError('Укажите либо базовую цену, либо процент ее изменения.')
+        return attrs
+
+    def save(self):
+        data = dict(self.validated_data)
+        return bulk_reprice(
+            category=data.pop('category', None), brand=data.pop('brand', None),
+            product_ids=data.pop('ids', None), **data,
+        )
+
 # --- Сериализаторы для ЗАПИСИ (создания) заказа ---
 class OrderItemCreateSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField(write_only=True)
+    quantity = serializers.IntegerField(min_value=1)
     
     class Meta:
         model = OrderItem
@@ -51,35 +78,41 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     items = OrderItemCreateSerializer(many=True, write_only=True)
+    promo_code = serializers.CharField(required=False, allow_blank=True, write_only=True)
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
         model = Order
-        fields = ['user', 'first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'items']
+        fields = ['user', 'first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'items', 'promo_code']
+
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError('В заказе нет товаров.')
+        return items
+
+    def validate_promo_code(self, code):
+        if not code:
+            return None
+        promo_code = PromoCode.get_valid_promo(code)
+        if promo_code is None:
+            raise serializers.ValidationError('Этот промокод недействителен или срок его действия истек.')
+        return promo_code
 
     def create(self, validated_data):
+        """Заказ оформляется тем же сервисом, что и из корзины на сайте (orders.services.place_order)."""
         items_data = validated_data.pop('items')
-        
-        with transaction.atomic():
-            order = Order.objects.create(**validated_data)
-            
-            for item_data in items_data:
-                product = get_object_or_404(Product, id=item_data['product_id'])
-                if product.stock < item_data['quantity']:
-                    raise exceptions.ValidationError(f"Недостаточно товара '{product.name}' на складе.")
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    price=product.final_price, 
-                    quantity=item_data['quantity']
-                )
-                product.stock -= item_data['quantity']
-                product.save(update_fields=['stock'])
-        
-        order_created_email.delay(order.id)
-        
-        return order
+        promo_code = validated_data.pop('promo_code', None)
+        lines = {}
+        for item_data in items_data:
+            lines[item_data['product_id']] = lines.get(item_data['product_id'], 0) + item_data['quantity']
+        try:
+            return place_order(Order(**validated_data), lines, promo_code=promo_code)
+        except ValueError as error:
+            raise exceptions.ValidationError(str(error))
+
+    def to_representation(self, instance):
+        # После создания клиент получает заказ в том же виде, что и при чтении
+        return OrderSerializer(instance, context=self.context).data
 
 # --- Сериализаторы для ЧТЕНИЯ заказа ---
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -91,7 +124,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    total_cost = serializers.DecimalField(source='get_total_cost', max_digits=10, decimal_places=2, read_only=True)
+    total_cost = serializers.DecimalField(source='total', max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
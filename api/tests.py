@@ -1,16 +1,24 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
 
 from store.factories import CategoryFactory, ProductFactory, UserFactory, ReviewFactory
-from store.models import Product, Category, Review
+from store.models import Product, Category, Review, calculate_final_price
+from store.similarity import build_similar_index
+from store.bestsellers import build_bestsellers
+from orders.models import Order, PromoCode
+from store.models import OutboxMessage
 
 class ProductAPITests(APITestCase):
     def setUp(self):
         self.category = CategoryFactory()
-        self.product1 = ProductFactory(category=self.category, name="Тестовый диван", final_price=50000)
-        self.product2 = ProductFactory(name="Тестовое кресло", final_price=20000)
+        self.product1 = ProductFactory(category=self.category, name="Тестовый диван", base_price=50000, discount=0)
+        self.product2 = ProductFactory(name="Тестовое кресло", base_price=20000, discount=0)
         ProductFactory(available=False) # Недоступный товар
     
     def test_list_products(self):
@@ -44,6 +52,57 @@ class ProductAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], self.product1.name)
 
+    def test_bestsellers(self):
+        """Проверяет выдачу рейтинга продаж и валидацию окна."""
+        # Рейтинги строит периодическая задача; промах кэша в запросе их не пересчитывает
+        build_bestsellers()
+        url = reverse('api:bestsellers')
+        response = self.client.get(url, {'window': 'all', 'category': self.category.slug})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [self.product1.id])
+        self.assertEqual(self.client.get(url, {'window': '1y'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_products(self):
+        """Проверяет выдачу похожих товаров из предрассчитанного индекса."""
+        similar = ProductFactory(category=self.category)
+        build_similar_index([self.category.id])
+        url = reverse('api:product-similar', kwargs={'pk': self.product1.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [similar.id])
+
+    def test_characteristic_facets_and_filter(self):
+        """Проверяет выдачу фасетов категории и фильтр по диапазону характеристики."""
+        narrow = ProductFactory(category=self.category, characteristics={'Габариты': {'Ширина, см': '120'}})
+        ProductFactory(category=self.category, characteristics={'Габариты': {'Ширина, см': '200'}})
+        response = self.client.get(reverse('api:product-facets'), {'category__slug': self.category.slug})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        width = response.data['characteristics'][0]
+        self.assertEqual((width['name'], width['kind']), ('Ширина, см', 'range'))
+
+        params = {'category__slug': self.category.slug, width['key'] + '_max': '150'}
+        response = self.client.get(reverse('api:product-list'), params)
+        self.assertEqual([item['id'] for item in response.data], [narrow.id])
+        params[width['key'] + '_max'] = 'много'
+        self.assertEqual(self.client.get(reverse('api:product-list'), params).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_reprice_products(self):
+        """Проверяет массовую переоценку: только для администраторов, final_price считается в БД."""
+        url = reverse('api:product-reprice')
+        payload = {'category': self.category.slug, 'discount': 50}
+        self.client.force_authenticate(UserFactory())
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(UserFactory(is_staff=True))
+        response = self.client.post(url, payload, format='json')
+        self.assertEqual(response.data, {'updated': 1})
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.final_price, calculate_final_price(self.product1.base_price, 50))
+        response = self.client.post(url, {'discount': 10}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class ReviewAPITests(APITestCase):
     def setUp(self):
         self.user = UserFactory()
@@ -80,8 +139,8 @@ class ReviewAPITests(APITestCase):
 class OrderAPITests(APITestCase):
     def setUp(self):
         self.user = UserFactory()
-        self.product1 = ProductFactory(stock=10, final_price=100)
-        self.product2 = ProductFactory(stock=5, final_price=200)
+        self.product1 = ProductFactory(stock=10, base_price=100, discount=0)
+        self.product2 = ProductFactory(stock=5, base_price=200, discount=0)
         self.client.force_authenticate(user=self.user)
 
     def test_create_order(self):
@@ -121,4 +180,50 @@ class OrderAPITests(APITestCase):
         self.assertIn(f"Недостаточно товара '{self.product1.name}' на складе.", str(response.data))
 
         self.product1.refresh_from_db()
-        self.assertEqual(self.product1.stock, 10) # Остаток не изменился
\ No newline at end of file
+        self.assertEqual(self.product1.stock, 10) # Остаток не изменился
+
+    def test_create_order_with_promo_code(self):
+        """Заказ через API проходит тот же путь, что и оформление из корзины: промокод, счетчик продаж, письмо после коммита."""
+        now = timezone.now()
+        PromoCode.objects.create(code='API10', discount_percent=10,
+                                 valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1))
+        purchase_count = self.product1.purchase_count
+        order_data = {
+            "first_name": "API", "last_name": "User", "email": "api@test.com",
+            "address": "API Street 1", "postal_code": "12345", "city": "APItown",
+            "promo_code": "API10",
+            "items": [
+                {"product_id": self.product1.id, "quantity": 1},
+                {"product_id": self.product1.id, "quantity": 2},
+            ]
+        }
+        with patch('store.outbox._wake_worker') as wake:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('api:order-list'), order_data, format='json')
+                wake.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        wake.assert_called_once()
+
+        order = Order.objects.get(id=response.data['id'])
+        # Письмо записано в outbox той же транзакцией, что и заказ
+        self.assertTrue(OutboxMessage.objects.filter(key=f'order_created:{order.id}', payload__to=['api@test.com']).exists())
+        item = order.items.get()
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(order.discount, (item.price * 3 * Decimal('0.1')).quantize(Decimal('0.01')))
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 7)
+        self.assertEqual(self.product1.purchase_count, purchase_count + 3)
+
+    def test_create_order_with_invalid_promo_code(self):
+        """Недействительный промокод отклоняется до списания остатков."""
+        order_data = {
+            "first_name": "API", "last_name": "User", "email": "api@test.com",
+            "address": "API Street 1", "postal_code": "12345", "city": "APItown",
+            "promo_code": "NOPE",
+            "items": [{"product_id": self.product1.id, "quantity": 1}]
+        }
+        response = self.client.post(reverse('api:order-list'), order_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('promo_code', response.data)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 10)
@@ -15,5 +15,7 @@ router.register(r'orders', views.OrderViewSet, basename='order')
 urlpatterns = [
     path('', include(router.urls)),
     path('search-suggest/', views.SearchSuggestAPIView.as_view(), name='search-suggest'),
+    path('bestsellers/', views.BestsellersAPIView.as_view(), name='bestsellers'),
+    path('session-state/', views.SessionStateAPIView.as_view(), name='session-state'),
     path('action/<str:entity>/<str:action>/', views.UserActionAPIView.as_view(), name='user-action'),
 ]
\ No newline at end of file
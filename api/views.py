@@ -1,58 +1,121 @@
 from rest_framework import viewsets, filters, permissions, status
 from rest_framework.views import APIView
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 
 from store.models import Product, Category, Review
+from store.autocomplete import autocomplete
+from store.similarity import get_similar_products
+from store.bestsellers import WINDOWS, DEFAULT_WINDOW, RANKING_SIZE, get_bestsellers
+from store.facets import get_category_facets
 from orders.models import Order
-from cart.cart import Cart
+from cart.cart import get_cart
 from wishlist.wishlist import Wishlist
 from comparison.comparison import Comparison
+from cart.context_processors import build_cart_json
 
+from .filters import ProductSearchFilter, CharacteristicFilter
 from .serializers import (
     ProductSerializer, CategorySerializer, ReviewSerializer,
-    OrderSerializer, OrderCreateSerializer
+    OrderSerializer, OrderCreateSerializer, RepriceSerializer
 )
 
 class SearchSuggestAPIView(APIView):
     """
     API эндпоинт для получения поисковых подсказок в виде объектов.
+    Подсказки берутся из индекса в памяти воркера (store.autocomplete),
+    поэтому нажатие клавиши не обращается к БД. Аутентификация отключена,
+    чтобы не читать сессию и токены на каждый запрос.
     """
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
 
     def get(self, request, *args, **kwargs):
         query = request.query_params.get('q', '')
         if len(query) < 2:
             return Response([])
 
-        products = Product.objects.filter(
-            name__icontains=query,
-            available=True
-        ).distinct()[:6]
-
-        results = []
-        for p in products:
-            image_url = p.get_main_image_url()
-            results.append({
-                'name': p.name,
-                'url': p.get_absolute_url(),
-                'image_url': request.build_absolute_uri(image_url),
-                'price': f'{p.final_price:,.0f}'.replace(',', ' '),
-                'old_price': f'{p.old_price:,.0f}'.replace(',', ' ') if p.old_price else None,
-            })
-
+        results = [
+            {**suggestion, 'image_url': request.build_absolute_uri(suggestion['image_url'])}
+            for suggestion in autocomplete.search(query, limit=6)
+        ]
         return Response(results)
 
 
+class SessionStateAPIView(APIView):
+    """
+    Персональные данные для страниц, отданных из полностраничного кэша:
+    счетчики корзины, избранного и сравнения, их товары и данные корзины.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        wishlist = Wishlist(request)
+        comparison = Comparison(request)
+        return Response({
+            'cart_count': len(get_cart(request)),
+            'wishlist_count': len(wishlist),
+            'comparison_count': len(comparison),
+            'wishlist_ids': wishlist.get_product_ids(),
+            'comparison_ids': comparison.get_product_ids(),
+            'cart': build_cart_json(request),
+        })
+
+
+class BestsellersAPIView(APIView):
+    """
+    Самые продаваемые товары из кэшированного рейтинга.
+    Параметры: window (7d, 30d, all), category (слаг категории), limit (до RANKING_SIZE).
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        window = request.query_params.get('window', DEFAULT_WINDOW)
+        if window not in WINDOWS:
+            return Response({'error': f'window must be one of: {", ".join(WINDOWS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 8)), 1), RANKING_SIZE)
+        except ValueError:
+            return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+
+        category_slug = request.query_params.get('category')
+        category_id = get_object_or_404(Category, slug=category_slug).id if category_slug else None
+        products = get_bestsellers(window=window, category_id=category_id, limit=limit)
+        return Response(ProductSerializer(products, many=True, context={'request': request}).data)
+
+
 class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, CharacteristicFilter, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category__slug', 'brand']
     ordering_fields = ['created', 'name', 'final_price']
-    search_fields = ['name', 'description', 'brand']
-    queryset = Product.objects.available().select_related('category').prefetch_related('reviews')
+    queryset = Product.objects.available().select_related('category')
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Фасеты категории (category__slug) или всего каталога из кэшированного индекса:
+        бренды, гистограмма цен, значения и диапазоны характеристик с количеством товаров.
+        """
+        category_slug = request.query_params.get('category__slug')
+        category = get_object_or_404(Category, slug=category_slug) if category_slug else None
+        return Response(get_category_facets(category))
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def reprice(self, request):
+        """Массовая переоценка одним UPDATE (store.pricing) для категории, бренда или списка id."""
+        serializer = RepriceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'updated': serializer.save()})
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Похожие товары из предрассчитанного индекса (store.similarity)."""
+        products = get_similar_products(self.get_object())
+        return Response(self.get_serializer(products, many=True).data)
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
@@ -124,34 +187,43 @@ class UserActionAPIView(APIView):
         
         return handler(request, product)
 
+    @staticmethod
+    def _cart_totals(cart):
+        pricing = cart.pricing
+        return {
+            'cart_unique_items_count': len(cart),
+            'cart_total_quantity': pricing.total_quantity,
+            'cart_total_price': pricing.subtotal,
+            'cart_discount': pricing.discount,
+            'cart_total_price_after_discount': pricing.total,
+        }
+
     def _cart_add(self, request, product):
-        cart = Cart(request)
+        cart = get_cart(request)
         try:
             quantity = int(request.data.get('quantity', 1))
             if quantity < 1: raise ValueError()
         except (ValueError, TypeError):
             return Response({'error': 'Invalid quantity'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if product.stock < quantity:
-            return Response({'error': 'Insufficient stock', 'stock': product.stock}, status=status.HTTP_400_BAD_REQUEST)
-
-        cart.add(product=product, quantity=quantity)
+        # Остаток проверяется для итогового количества в корзине; в режиме резервирования ставится резерв
+        added, available = cart.try_add(product, quantity)
+        if not added:
+            return Response({'error': 'Insufficient stock', 'stock': available}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'status': 'ok', 
             'message': f'Товар "{product.name}" добавлен в корзину.',
-            'cart_unique_items_count': len(cart),
-            'cart_total_price': cart.get_total_price()
+            **self._cart_totals(cart),
         }, status=status.HTTP_200_OK)
 
     def _cart_remove(self, request, product):
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.remove(product)
         return Response({
             'status': 'ok',
             'message': f'Товар "{product.name}" удален из корзины.',
-            'cart_unique_items_count': len(cart),
-            'cart_total_price': cart.get_total_price()
+            **self._cart_totals(cart),
         }, status=status.HTTP_200_OK)
 
     def _wishlist_toggle(self, request, product):
@@ -0,0 +1,19 @@
+from functools import wraps
+from django.db.models import F
+from .models import Article
+
+
+def count_article_view(view_func):
+    """
+    Декоратор для подсчета просмотров статьи.
+    Работает и тогда, когда сама страница отдается из кэша. Счетчик
+    обновляется через UPDATE, без save() и сигналов сброса кэша.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        slug = kwargs.get('slug')
+        if slug and request.method == 'GET':
+            Article.objects.filter(slug=slug, is_published=True).update(views=F('views') + 1)
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
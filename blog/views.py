@@ -4,7 +4,10 @@ from django.db.models import Count
 from .models import Article, Tag, Comment
 from .forms import CommentForm
 from django.contrib import messages
+from store.page_cache import cache_anonymous_page
+from .decorators import count_article_view
 
+@cache_anonymous_page('layout', 'blog')
 def article_list(request, tag_slug=None):
     object_list = Article.objects.filter(is_published=True).select_related('author').prefetch_related('tags')
     tag = None
@@ -30,11 +33,10 @@ def article_list(request, tag_slug=None):
     return render(request, 'blog/list.html', context)
 
 
+@count_article_view
+@cache_anonymous_page('layout', 'blog')
 def article_detail(request, slug):
     article = get_object_or_404(Article, slug=slug, is_published=True)
-    
-    article.views += 1
-    article.save(update_fields=['views'])
 
     comments = article.comments.filter(is_active=True, parent__isnull=True).select_related('parent')
     comment_form = CommentForm()
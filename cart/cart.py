@@ -1,28 +1,47 @@
 from decimal import Decimal
-from django.conf import settings
 from store.models import Product
 from orders.models import PromoCode
+from .holds import get_stock_holds
+from .pricing import CartPricing
+from .storage import get_cart_storage
 import copy
 
+
+def get_cart(request):
+    """
+    Корзина текущего запроса. Контекстный процессор, представления и API
+    работают с одним экземпляром, поэтому товары и промокод читаются один раз.
+    """
+    # У запроса DRF атрибуты хранятся отдельно от исходного HttpRequest
+    request = getattr(request, '_request', request)
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        cart = request._cart = Cart(request)
+    return cart
+
+
 class Cart:
     def __init__(self, request):
         """
-        Инициализация корзины и промокода.
+        Инициализация корзины и промокода. Позиции хранит подключаемое
+        хранилище (cart.storage), self.cart — их копия на время запроса.
         """
         self.session = request.session
-        self.cart = self.session.get(settings.CART_SESSION_ID)
-        if not self.cart:
-            self.cart = self.session[settings.CART_SESSION_ID] = {}
+        self.storage = get_cart_storage(request)
+        self.cart = self.storage.load()
+        self.holds = get_stock_holds(self.session)
         
         # Логика промокода
         self.promo_code_id = self.session.get('promo_code_id')
         self.products_cache = None
+        self._promo_code = None
+        self._pricing = None
 
     def add(self, product, quantity=1):
         product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': 0, 'price': str(product.final_price)}
-        self.cart[product_id]['quantity'] += quantity
+        item = self.cart.setdefault(product_id, {'quantity': 0, 'price': str(product.final_price)})
+        # Хранилище возвращает итоговое количество с учетом параллельных запросов
+        item['quantity'] = self.storage.add(product_id, quantity, item['price'])
         self.save()
 
     def update(self, product, quantity):
@@ -30,26 +49,68 @@ class Cart:
         if product_id in self.cart:
             if quantity > 0:
                 self.cart[product_id]['quantity'] = quantity
+                self.storage.set(product_id, quantity, self.cart[product_id]['price'])
                 self.save()
             else:
                 self.remove(product)
 
+    def hold_stock(self, quantities):
+        """
+        Сколько единиц доступно этой корзине: {товар: итоговое количество} ->
+        {id товара: доступно}. В режиме резервирования (cart.holds) заодно
+        ставит резерв на запрошенное количество, если его хватает.
+        """
+        if self.holds is None:
+            return {product.id: product.stock for product in quantities}
+        return self.holds.hold(quantities)
+
+    def try_add(self, product, quantity=1):
+        """
+        Добавляет товар, если остатка хватает на итоговое количество в корзине
+        (в режиме резервирования — за вычетом чужих резервов). Возвращает пару
+        (добавлено ли, сколько доступно). Резерв ставится на количество, которое
+        вернуло хранилище: при двойном клике оба запроса видят одно исходное
+        количество, а в корзине оказывается сумма обоих добавлений.
+        """
+        requested = self.get_quantity(product) + quantity
+        available = self.hold_stock({product: requested})[product.id]
+        if available < requested:
+            return False, available
+        self.add(product, quantity)
+        total = self.get_quantity(product)
+        if total != requested:
+            available = self.hold_stock({product: total})[product.id]
+            if available < total:
+                # Параллельное добавление забрало остаток: откатываем свое
+                self.add(product, -quantity)
+                self.hold_stock({product: self.get_quantity(product)})
+                return False, available
+        return True, available
+
+    def get_quantity(self, product):
+        item = self.cart.get(str(product.id))
+        return item['quantity'] if item else 0
+
     def save(self):
-        self.session[settings.CART_SESSION_ID] = self.cart
-        self.session['promo_code_id'] = self.promo_code_id
-        self.session.modified = True
+        """Сохраняет промокод и сбрасывает расчет; позиции хранилище уже записало."""
+        if self.session.get('promo_code_id') != self.promo_code_id:
+            self.session['promo_code_id'] = self.promo_code_id
         self.products_cache = None
+        self._pricing = None
 
     def remove(self, product):
         product_id = str(product.id)
         if product_id in self.cart:
             del self.cart[product_id]
+            self.storage.remove(product_id)
+            if self.holds is not None:
+                self.holds.release([product.id])
             self.save()
 
     def __iter__(self):
         if self.products_cache is None:
             product_ids = self.cart.keys()
-            products = Product.objects.filter(id__in=product_ids).select_related('category')
+            products = Product.objects.filter(id__in=product_ids).select_related('category').prefetch_related('images')
             self.products_cache = {str(p.id): p for p in products}
 
         cart = copy.deepcopy(self.cart) 
@@ -61,46 +122,60 @@ class Cart:
                 item['total_price'] = item['price'] * item['quantity']
                 yield item
 
+    def __contains__(self, product):
+        return str(product.id) in self.cart
+
     def __len__(self):
         return len(self.cart.keys())
 
     def get_total_quantity(self):
         return sum(item['quantity'] for item in self.cart.values())
 
+    @property
+    def pricing(self):
+        """Расчет корзины (cart.pricing), один на состояние корзины."""
+        if self._pricing is None:
+            self._pricing = CartPricing(self)
+        return self._pricing
+
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return self.pricing.subtotal
 
     def clear(self):
-        if settings.CART_SESSION_ID in self.session:
-            del self.session[settings.CART_SESSION_ID]
+        self.storage.clear()
+        if self.holds is not None:
+            # Заказ оформлен или корзина брошена: зарезервированное снова доступно остальным
+            self.holds.release([int(product_id) for product_id in self.cart])
         if 'promo_code_id' in self.session:
             del self.session['promo_code_id']
-        self.session.modified = True
+        self.cart = {}
+        self.promo_code_id = None
+        self.products_cache = None
+        self._promo_code = None
+        self._pricing = None
 
     # --- Методы для промокода ---
     
     @property
     def promo_code(self):
-        if self.promo_code_id:
-            try:
-                return PromoCode.objects.get(id=self.promo_code_id)
-            except PromoCode.DoesNotExist:
-                return None
-        return None
+        if not self.promo_code_id:
+            return None
+        if self._promo_code is None or self._promo_code.id != self.promo_code_id:
+            self._promo_code = PromoCode.objects.filter(id=self.promo_code_id).first()
+        return self._promo_code
 
     def get_discount(self):
-        if self.promo_code:
-            discount_percent = self.promo_code.discount_percent
-            return (self.get_total_price() * Decimal(discount_percent / 100)).quantize(Decimal('0.01'))
-        return Decimal(0)
+        return self.pricing.discount
 
     def get_total_price_after_discount(self):
-        return self.get_total_price() - self.get_discount()
+        return self.pricing.total
         
     def apply_promo_code(self, promo_code_obj):
         self.promo_code_id = promo_code_obj.id
+        self._promo_code = promo_code_obj
         self.save()
     
     def remove_promo_code(self):
         self.promo_code_id = None
+        self._promo_code = None
         self.save()
\ No newline at end of file
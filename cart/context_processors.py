@@ -1,39 +1,23 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
 from wishlist.wishlist import Wishlist
 
-def cart(request):
-    cart_instance = Cart(request)
-    wishlist_instance = Wishlist(request)
-    
-    cart_json_data = {
-        'items': [
-            {
-                'product': {
-                    'id': item['product'].id,
-                    'name': item['product'].name,
-                    'url': item['product'].get_absolute_url(),
-                    'image_url': item['product'].get_main_image_url(),
-                    'category_name': item['product'].category.name,
-                    'stock': item['product'].stock,
-                },
-                'quantity': item['quantity'],
-                'price': str(item['price']),
-                'total_price': str(item['total_price']),
-            } for item in cart_instance
-        ],
-        'total_quantity': cart_instance.get_total_quantity(),
-        'subtotal': str(cart_instance.get_total_price()),
-        'discount': str(cart_instance.get_discount()),
-        'total': str(cart_instance.get_total_price_after_discount()),
-        'promo_code': {
-            'code': cart_instance.promo_code.code,
-            'discount_percent': cart_instance.promo_code.discount_percent
-        } if cart_instance.promo_code else None,
-        'wishlist_ids': wishlist_instance.get_product_ids()
+
+def build_cart_json(request):
+    """Данные корзины и избранного для Alpine.js (cart/detail.html, api:session-state)."""
+    return {
+        **get_cart(request).pricing.as_json(),
+        'wishlist_ids': Wishlist(request).get_product_ids(),
     }
-    
-    
+
+
+def cart(request):
+    """
+    Корзина для шаблонов. Оба значения ленивые: страницы, которые не обращаются
+    к корзине, не делают с ней никакой работы, а счетчику в шапке хватает сессии.
+    cart_json_data — функция: шаблон вызывает ее только там, где данные нужны.
+    """
     return {
-        'cart': cart_instance,
-        'cart_json_data': cart_json_data
-    }
\ No newline at end of file
+        'cart': SimpleLazyObject(lambda: get_cart(request)),
+        'cart_json_data': lambda: build_cart_json(request),
+    }
@@ -0,0 +1,98 @@
+import time
+import uuid
+from django.conf import settings
+from django_redis import get_redis_connection
+
+# Фигурные скобки — hash tag: все ключи товара попадают в один слот Redis Cluster
+HOLD_KEY = 'stock_hold:{{{}}}:{}'
+
+# KEYS: сроки резервов (zset), количества (hash), сумма резервов товара (string).
+# ARGV: покупатель, новое количество, остаток в БД, сейчас, срок резерва, TTL ключей.
+# Сначала снимает истекшие резервы, затем ставит резерв, если хватает остатка
+# без учета резервов других покупателей. Количество 0 снимает резерв.
+# Возвращает, сколько единиц доступно этому покупателю.
+HOLD_SCRIPT = """
+local total = tonumber(redis.call('GET', KEYS[3]) or '0')
+for _, expired in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[4])) do
+    total = total - tonumber(redis.call('HGET', KEYS[2], expired) or '0')
+    redis.call('HDEL', KEYS[2], expired)
+    redis.call('ZREM', KEYS[1], expired)
+end
+local current = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+local quantity = tonumber(ARGV[2])
+local available = tonumber(ARGV[3]) - (total - current)
+if quantity == 0 or quantity <= available then
+    if quantity > 0 then
+        redis.call('HSET', KEYS[2], ARGV[1], quantity)
+        redis.call('ZADD', KEYS[1], ARGV[5], ARGV[1])
+    else
+        redis.call('HDEL', KEYS[2], ARGV[1])
+        redis.call('ZREM', KEYS[1], ARGV[1])
+    end
+    total = total - current + quantity
+end
+redis.call('SET', KEYS[3], total, 'EX', ARGV[6])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return available
+"""
+
+
+class StockHolds:
+    """
+    Резервы остатков на время распродажи: добавление в корзину ставит в Redis
+    резерв с TTL, и доступным для продажи считается остаток в БД минус
+    резервы остальных покупателей. Проверка и резерв — один Lua-скрипт, поэтому
+    последние единицы не достаются сразу нескольким корзинам, а перепродажа
+    отсекается до обращения к БД при оформлении заказа.
+
+    Резерв снимается при удалении товара из корзины, после оформления заказа
+    (Cart.clear) или по истечении STOCK_HOLD_TTL — истекшие резервы вычищает
+    следующий вызов скрипта для того же товара. Покупатель определяется
+    идентификатором в сессии, который сохраняется и после входа в аккаунт.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.redis = get_redis_connection('default')
+        self.script = self.redis.register_script(HOLD_SCRIPT)
+
+    def _holder(self, create=False):
+        holder = self.session.get(settings.STOCK_HOLDER_SESSION_ID)
+        if holder is None and create:
+            holder = self.session[settings.STOCK_HOLDER_SESSION_ID] = uuid.uuid4().hex
+        return holder
+
+    @staticmethod
+    def _keys(product_id):
+        return [HOLD_KEY.format(product_id, kind) for kind in ('exp', 'qty', 'total')]
+
+    def _run(self, holder, quantities):
+        """quantities — {id товара: (количество, остаток в БД)}; все скрипты уходят одним pipeline."""
+        now = time.time()
+        ttl = settings.STOCK_HOLD_TTL
+        pipe = self.redis.pipeline()
+        for product_id, (quantity, stock) in quantities.items():
+            self.script(keys=self._keys(product_id), args=[holder, quantity, stock, now, now + ttl, ttl], client=pipe)
+        return dict(zip(quantities, pipe.execute()))
+
+    def hold(self, quantities):
+        """
+        Ставит резервы {товар: итоговое количество в корзине}. Возвращает
+        {id товара: доступно этому покупателю}; если доступно меньше
+        запрошенного, прежний резерв по товару остается без изменений.
+        """
+        if not quantities:
+            return {}
+        holder = self._holder(create=True)
+        available = self._run(holder, {product.id: (quantity, product.stock) for product, quantity in quantities.items()})
+        return {product_id: max(int(value), 0) for product_id, value in available.items()}
+
+    def release(self, product_ids):
+        holder = self._holder()
+        if holder is not None and product_ids:
+            self._run(holder, {product_id: (0, 0) for product_id in product_ids})
+
+
+def get_stock_holds(session):
+    """Резервы остатков сессии или None, если режим резервирования выключен."""
+    return StockHolds(session) if settings.STOCK_HOLDS_ENABLED else None
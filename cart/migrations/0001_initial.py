@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('store', '0008_product_final_price_generated'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена при добавлении')),
+                ('added', models.DateTimeField(auto_now_add=True, verbose_name='Добавлен')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product', verbose_name='Товар')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция корзины',
+                'verbose_name_plural': 'Позиции корзины',
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='unique_cart_item')],
+            },
+        ),
+    ]
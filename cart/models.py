@@ -1,3 +1,22 @@
 from django.db import models
+from django.contrib.auth.models import User
+from store.models import Product
 
-# Create your models here.
+
+class CartItem(models.Model):
+    """Позиция корзины авторизованного пользователя (cart.storage.DatabaseCartStorage)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items', verbose_name="Пользователь")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена при добавлении")
+    added = models.DateTimeField(auto_now_add=True, verbose_name="Добавлен")
+
+    class Meta:
+        verbose_name = "Позиция корзины"
+        verbose_name_plural = "Позиции корзины"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} — {self.product} × {self.quantity}'
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+
+class CartPricing:
+    """
+    Расчет корзины на один запрос: товары загружаются одним запросом,
+    промокод читается один раз, подытог, скидка и итог считаются один раз.
+    Корзина сбрасывает расчет при каждом изменении (Cart.save).
+    """
+    def __init__(self, cart):
+        self.promo_code = cart.promo_code
+        self.items = list(cart)
+        self.total_quantity = sum(item['quantity'] for item in self.items)
+        self.subtotal = sum((item['total_price'] for item in self.items), Decimal(0))
+        self.discount = self.promo_code.get_discount(self.subtotal) if self.promo_code else Decimal(0)
+        self.total = self.subtotal - self.discount
+
+    def as_json(self):
+        """Данные корзины для Alpine.js в шаблонах и для api:session-state."""
+        return {
+            'items': [
+                {
+                    'product': {
+                        'id': item['product'].id,
+                        'name': item['product'].name,
+                        'url': item['product'].get_absolute_url(),
+                        'image_url': item['product'].get_main_image_url(),
+                        'category_name': item['product'].category.name,
+                        'stock': item['product'].stock,
+                    },
+                    'quantity': item['quantity'],
+                    'price': str(item['price']),
+                    'total_price': str(item['total_price']),
+                } for item in self.items
+            ],
+            'total_quantity': self.total_quantity,
+            'subtotal': str(self.subtotal),
+            'discount': str(self.discount),
+            'total': str(self.total),
+            'promo_code': {
+                'code': self.promo_code.code,
+                'discount_percent': self.promo_code.discount_percent
+            } if self.promo_code else None,
+        }
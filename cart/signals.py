@@ -0,0 +1,10 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .storage import merge_anonymous_cart
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Корзина, собранная до входа, переносится в корзину пользователя."""
+    if request is not None and hasattr(request, 'session'):
+        merge_anonymous_cart(request.session, user)
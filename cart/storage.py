@@ -0,0 +1,202 @@
+import uuid
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+from store.models import Product
+from .models import CartItem
+
+REDIS_CART_KEY = 'cart:{}'
+
+
+class SessionCartStorage:
+    """
+    Корзина целиком в сессии: словарь {id товара: {'quantity', 'price'}}.
+    Каждое изменение перезаписывает всю сессию, параллельные запросы могут
+    потерять обновления — годится для разработки и тестов без Redis.
+    """
+    def __init__(self, session):
+        self.session = session
+
+    def _items(self):
+        items = self.session.get(settings.CART_SESSION_ID)
+        return items if isinstance(items, dict) else {}
+
+    def load(self):
+        return {product_id: dict(item) for product_id, item in self._items().items()}
+
+    def _write(self, items):
+        self.session[settings.CART_SESSION_ID] = items
+        self.session.modified = True
+
+    def add(self, product_id, quantity, price):
+        items = self._items()
+        item = items.setdefault(str(product_id), {'quantity': 0, 'price': str(price)})
+        item['quantity'] += quantity
+        self._write(items)
+        return item['quantity']
+
+    def set(self, product_id, quantity, price):
+        items = self._items()
+        items.setdefault(str(product_id), {'price': str(price)})['quantity'] = quantity
+        self._write(items)
+
+    def remove(self, product_id):
+        items = self._items()
+        if items.pop(str(product_id), None) is not None:
+            self._write(items)
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+
+class RedisCartStorage(SessionCartStorage):
+    """
+    Корзина анонимного посетителя в хэше Redis: поля '<id>:q' (количество)
+    и '<id>:p' (цена при добавлении). Добавление — атомарный HINCRBY, поэтому
+    двойной клик по «В корзину» не теряет обновлений, а сессия пишется один
+    раз — при создании корзины (в ней хранится только id хэша). Срок жизни
+    хэша продлевается при каждом изменении.
+    Корзина в старом формате (словарь в сессии) читается как есть и
+    переносится в Redis при первом изменении.
+    """
+    def __init__(self, session):
+        super().__init__(session)
+        self.redis = get_redis_connection('default')
+
+    def _key(self, create=False):
+        value = self.session.get(settings.CART_SESSION_ID)
+        if isinstance(value, str):
+            return REDIS_CART_KEY.format(value)
+        if not create:
+            return None
+        legacy = self._items()
+        cart_id = uuid.uuid4().hex
+        self.session[settings.CART_SESSION_ID] = cart_id
+        key = REDIS_CART_KEY.format(cart_id)
+        if legacy:
+            mapping = {}
+            for product_id, item in legacy.items():
+                mapping.update({f'{product_id}:q': item['quantity'], f'{product_id}:p': item['price']})
+            self.redis.hset(key, mapping=mapping)
+        return key
+
+    def load(self):
+        if isinstance(self.session.get(settings.CART_SESSION_ID), dict):
+            return super().load()
+        key = self._key()
+        if key is None:
+            return {}
+        items = {}
+        for field, value in self.redis.hgetall(key).items():
+            product_id, kind = field.decode().rsplit(':', 1)
+            item = items.setdefault(product_id, {})
+            if kind == 'q':
+                item['quantity'] = int(value)
+            else:
+                item['price'] = value.decode()
+        # Поле количества могло пропасть при параллельном удалении — такие позиции неполные
+        return {product_id: item for product_id, item in items.items() if len(item) == 2}
+
+    def _execute(self, key, *commands):
+        pipe = self.redis.pipeline()
+        for name, *args in commands:
+            getattr(pipe, name)(key, *args)
+        pipe.expire(key, settings.CART_TTL)
+        return pipe.execute()
+
+    def add(self, product_id, quantity, price):
+        key = self._key(create=True)
+        # Цена фиксируется при первом добавлении, как и в сессионной корзине
+        quantity, _, _ = self._execute(key, ('hincrby', f'{product_id}:q', quantity),
+                                       ('hsetnx', f'{product_id}:p', str(price)))
+        return quantity
+
+    def set(self, product_id, quantity, price):
+        key = self._key(create=True)
+        self._execute(key, ('hset', f'{product_id}:q', quantity), ('hsetnx', f'{product_id}:p', str(price)))
+
+    def remove(self, product_id):
+        # Удаление из пустой корзины ничего не пишет: id корзины появляется при первом изменении
+        key = self._key(create=bool(self._items()))
+        if key is None:
+            return
+        self._execute(key, ('hdel', f'{product_id}:q', f'{product_id}:p'))
+
+    def clear(self):
+        key = self._key()
+        if key is not None:
+            self.redis.delete(key)
+        super().clear()
+
+
+class DatabaseCartStorage:
+    """
+    Корзина авторизованного пользователя в таблице CartItem: переживает смену
+    устройства и выход из аккаунта. Количество увеличивается одним UPDATE
+    с F-выражением, без чтения и перезаписи всей корзины.
+    """
+    def __init__(self, user):
+        self.user = user
+
+    def _items(self, product_id):
+        return CartItem.objects.filter(user=self.user, product_id=product_id)
+
+    def load(self):
+        rows = CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity', 'price')
+        return {str(product_id): {'quantity': quantity, 'price': str(price)} for product_id, quantity, price in rows}
+
+    def add(self, product_id, quantity, price):
+        if not self._items(product_id).update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(user=self.user, product_id=product_id, quantity=quantity, price=price)
+                return quantity
+            except IntegrityError:
+                # Параллельный запрос успел создать позицию
+                self._items(product_id).update(quantity=F('quantity') + quantity)
+        return self._items(product_id).values_list('quantity', flat=True).first() or 0
+
+    def set(self, product_id, quantity, price):
+        CartItem.objects.update_or_create(user=self.user, product_id=product_id,
+                                          defaults={'quantity': quantity}, create_defaults={'quantity': quantity, 'price': price})
+
+    def remove(self, product_id):
+        self._items(product_id).delete()
+
+    def clear(self):
+        CartItem.objects.filter(user=self.user).delete()
+
+
+def get_anonymous_storage(session):
+    return import_string(settings.CART_STORAGE)(session)
+
+
+def merge_anonymous_cart(session, user):
+    """
+    Переносит корзину, собранную до входа, в корзину пользователя: количества
+    одинаковых товаров складываются, удаленные из каталога товары пропускаются.
+    """
+    anonymous = get_anonymous_storage(session)
+    items = anonymous.load()
+    if not items:
+        return
+    existing = {str(product_id) for product_id in Product.objects.filter(id__in=items).values_list('id', flat=True)}
+    storage = DatabaseCartStorage(user)
+    with transaction.atomic():
+        for product_id, item in items.items():
+            if product_id in existing:
+                storage.add(product_id, item['quantity'], item['price'])
+    anonymous.clear()
+
+
+def get_cart_storage(request):
+    """Хранилище корзины запроса: таблица для авторизованных, CART_STORAGE для анонимных."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        # Корзина, собранная до входа (или сохраненная в сессии старой версией), не теряется
+        merge_anonymous_cart(request.session, user)
+        return DatabaseCartStorage(user)
+    return get_anonymous_storage(request.session)
@@ -1,23 +1,33 @@
-from django.test import TestCase, Client
+import time
+from importlib import import_module
+from unittest.mock import patch
+from django.test import TestCase, Client, override_settings
 from django.conf import settings
 from django.urls import reverse
-from store.factories import ProductFactory
+from store.factories import ProductFactory, UserFactory
+from django.utils import timezone
+from orders.models import PromoCode
+from django_redis import get_redis_connection
 from .cart import Cart
+from .holds import StockHolds
+from .storage import RedisCartStorage
+from .models import CartItem
+from .context_processors import cart as cart_context
 from decimal import Decimal
 
 class CartTests(TestCase):
 
     def setUp(self):
-        self.product1 = ProductFactory(name='Товар 1', base_price=Decimal('100.00'), discount=0, available=True)
-        self.product2 = ProductFactory(name='Товар 2', base_price=Decimal('200.00'), discount=0, available=True)
+        self.product1 = ProductFactory(name='Товар 1', base_price=Decimal('100.00'), discount=0, available=True, stock=10)
+        self.product2 = ProductFactory(name='Товар 2', base_price=Decimal('200.00'), discount=0, available=True, stock=10)
         
         self.client = Client()
         self.session = self.client.session
         self.session[settings.CART_SESSION_ID] = {}
         self.session.save()
         
-        request = type('Request', (), {'session': self.session})()
-        self.cart = Cart(request)
+        self.request = type('Request', (), {'session': self.session})()
+        self.cart = Cart(self.request)
 
     def test_add_product(self):
         self.cart.add(product=self.product1, quantity=2)
@@ -49,6 +59,121 @@ class CartTests(TestCase):
         self.cart.add(product=self.product2, quantity=1)
         self.assertEqual(self.cart.get_total_price(), Decimal('400.00'))
 
+    def test_cart_pricing_computed_once(self):
+        """Товары и промокод читаются один раз на состояние корзины, контекст корзины ленивый."""
+        now = timezone.now()
+        promo = PromoCode.objects.create(code='SALE10', discount_percent=10,
+                                         valid_from=now - timezone.timedelta(days=1), valid_to=now + timezone.timedelta(days=1))
+        self.cart.add(product=self.product1, quantity=2)
+        self.cart.add(product=self.product2, quantity=1)
+        self.cart.apply_promo_code(promo)
+
+        cart = Cart(self.request)
+        # Промокод, товары и их галереи (для картинок в данных корзины)
+        with self.assertNumQueries(3):
+            self.assertEqual(cart.get_total_price(), Decimal('400.00'))
+            self.assertEqual(cart.get_discount(), Decimal('40.00'))
+            self.assertEqual(cart.get_total_price_after_discount(), Decimal('360.00'))
+            self.assertEqual(cart.pricing.as_json()['promo_code']['code'], 'SALE10')
+
+        cart.update(product=self.product1, quantity=1)
+        self.assertEqual(cart.get_total_price_after_discount(), Decimal('270.00'))
+
+        with self.assertNumQueries(0):
+            context = cart_context(self.request)
+            self.assertEqual(len(context['cart']), 2)
+
+    def test_parallel_adds_are_not_lost(self):
+        """Два запроса с одной сессией добавляют товар независимо — количества складываются."""
+        first, second = Cart(self.request), Cart(self.request)
+        first.add(product=self.product1, quantity=1)
+        second.add(product=self.product1, quantity=2)
+        self.assertEqual(second.cart[str(self.product1.id)]['quantity'], 3)
+        self.assertEqual(Cart(self.request).get_total_quantity(), 3)
+
+    def test_anonymous_cart_merged_on_login(self):
+        """После входа корзина гостя складывается с корзиной пользователя в БД."""
+        user = UserFactory()
+        CartItem.objects.create(user=user, product=self.product1, quantity=1, price=self.product1.final_price)
+        client = Client()
+        client.post(reverse('api:user-action', kwargs={'entity': 'cart', 'action': 'add'}),
+                    data={'product_id': self.product1.id, 'quantity': 2}, content_type='application/json')
+        client.post(reverse('api:user-action', kwargs={'entity': 'cart', 'action': 'add'}),
+                    data={'product_id': self.product2.id, 'quantity': 1}, content_type='application/json')
+
+        client.force_login(user)
+        self.assertEqual(dict(CartItem.objects.filter(user=user).values_list('product_id', 'quantity')),
+                         {self.product1.id: 3, self.product2.id: 1})
+        self.assertNotIn(settings.CART_SESSION_ID, client.session)
+
+    @override_settings(STOCK_HOLDS_ENABLED=True)
+    def test_stock_holds_prevent_overselling(self):
+        """Резерв первой корзины уменьшает доступное второй; удаление, оформление и истечение резерва его снимают."""
+        product = ProductFactory(base_price=Decimal('100.00'), discount=0, available=True, stock=3)
+        redis = get_redis_connection('default')
+        self.addCleanup(redis.delete, *StockHolds._keys(product.id))
+        url = reverse('api:user-action', kwargs={'entity': 'cart', 'action': 'add'})
+        first, second = Client(), Client()
+
+        response = first.post(url, data={'product_id': product.id, 'quantity': 2}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = second.post(url, data={'product_id': product.id, 'quantity': 2}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['stock'], 1)
+        # Изменение количества тоже проверяется с учетом чужого резерва
+        second.post(url, data={'product_id': product.id, 'quantity': 1}, content_type='application/json')
+        response = second.post(reverse('cart:cart_update', args=[product.id]),
+                               data={'quantity': 2}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        first.post(reverse('api:user-action', kwargs={'entity': 'cart', 'action': 'remove'}),
+                   data={'product_id': product.id}, content_type='application/json')
+        response = second.post(reverse('cart:cart_update', args=[product.id]),
+                               data={'quantity': 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        # Изменение позиции, которой нет в корзине, не оставляет резерва
+        third = Client()
+        response = third.post(reverse('cart:cart_update', args=[self.product1.id]),
+                              data={'quantity': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn(settings.STOCK_HOLDER_SESSION_ID, third.session)
+
+        # Брошенная корзина не держит товар дольше STOCK_HOLD_TTL
+        later = time.time() + settings.STOCK_HOLD_TTL + 1
+        with patch('cart.holds.time.time', return_value=later):
+            response = first.post(url, data={'product_id': product.id, 'quantity': 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(STOCK_HOLDS_ENABLED=True)
+    def test_stock_hold_follows_parallel_adds(self):
+        """Резерв равен итоговому количеству в хранилище, даже если запросы видели одно исходное количество."""
+        product = ProductFactory(base_price=Decimal('100.00'), discount=0, available=True, stock=3)
+        redis = get_redis_connection('default')
+        self.addCleanup(redis.delete, *StockHolds._keys(product.id))
+        first, second = Cart(self.request), Cart(self.request)
+        self.assertEqual(first.try_add(product, 1), (True, 3))
+        self.assertEqual(second.try_add(product, 1), (True, 3))
+        holder = self.request.session[settings.STOCK_HOLDER_SESSION_ID]
+        self.assertEqual(int(redis.hget(StockHolds._keys(product.id)[1], holder)), 2)
+
+        # Купить сейчас не обходит чужие резервы
+        client = Client()
+        client.post(reverse('api:user-action', kwargs={'entity': 'cart', 'action': 'add'}),
+                    data={'product_id': product.id, 'quantity': 1}, content_type='application/json')
+        response = client.get(reverse('store:buy_now', args=[product.id]))
+        self.assertRedirects(response, reverse('orders:order_create'), fetch_redirect_response=False)
+        other = Client()
+        response = other.get(reverse('store:buy_now', args=[product.id]))
+        self.assertRedirects(response, product.get_absolute_url(), fetch_redirect_response=False)
+
+    def test_remove_from_new_guest_cart_keeps_session_untouched(self):
+        """Удаление из корзины нового гостя не создает корзину и не пишет в сессию."""
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        RedisCartStorage(session).remove(str(self.product1.id))
+        self.assertNotIn(settings.CART_SESSION_ID, session)
+        self.assertFalse(session.modified)
+
     def test_clear_cart(self):
         self.cart.add(product=self.product1)
         self.cart.clear()
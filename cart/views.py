@@ -4,28 +4,32 @@ from django.http import JsonResponse, HttpRequest, HttpResponse
 from django.contrib import messages
 from store.models import Product
 from orders.models import PromoCode
-from .cart import Cart
+from .cart import get_cart
 from .forms import PromoCodeForm
 from django.urls import reverse
 import json
 
 @require_POST
 def cart_update(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     try:
         data = json.loads(request.body)
         quantity = int(data.get('quantity'))
 
-        # Проверяем, что количество не превышает остаток на складе
-        if quantity > product.stock:
+        if quantity < 0:
+            return JsonResponse({'status': 'error', 'error': 'Invalid quantity'}, status=400)
+        # Резерв ставится только на позицию, которая есть в корзине, иначе он провисит до истечения TTL
+        if product not in cart:
+            return JsonResponse({'status': 'error', 'error': 'Item not in cart'}, status=404)
+
+        # Проверяем, что количество не превышает остаток на складе (за вычетом чужих резервов)
+        available = cart.hold_stock({product: quantity})[product.id]
+        if quantity > available:
             return JsonResponse({
                 'status': 'error', 
-                'error': f'На складе всего {product.stock} шт.'
+                'error': f'На складе всего {available} шт.'
             }, status=400)
-            
-        if quantity < 0:
-            return JsonResponse({'status': 'error', 'error': 'Invalid quantity'}, status=400)
         
         cart.update(product=product, quantity=quantity)
         
@@ -44,7 +48,7 @@ def cart_update(request, product_id):
 
 @require_POST
 def cart_remove(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     
@@ -58,7 +62,7 @@ def cart_remove(request, product_id):
     })
 
 def cart_detail(request: HttpRequest) -> HttpResponse:
-    cart = Cart(request)
+    cart = get_cart(request)
     promo_form = PromoCodeForm()
 
     context = {
@@ -70,7 +74,7 @@ def cart_detail(request: HttpRequest) -> HttpResponse:
 
 @require_POST
 def promo_code_apply(request: HttpRequest) -> HttpResponse:
-    cart = Cart(request)
+    cart = get_cart(request)
     form = PromoCodeForm(request.POST)
     if form.is_valid():
         code_text = form.cleaned_data['code']
@@ -85,7 +89,7 @@ def promo_code_apply(request: HttpRequest) -> HttpResponse:
 
 @require_POST
 def promo_code_remove(request: HttpRequest) -> HttpResponse:
-    cart = Cart(request)
+    cart = get_cart(request)
     if cart.promo_code:
         messages.info(request, f'Промокод "{cart.promo_code.code}" был удален.')
         cart.remove_promo_code()
@@ -7,10 +7,8 @@ class Comparison:
     """
     def __init__(self, request):
         self.session = request.session
-        comparison = self.session.get(settings.COMPARISON_SESSION_ID)
-        if not comparison:
-            comparison = self.session[settings.COMPARISON_SESSION_ID] = []
-        self.comparison = comparison
+        # Сессия только читается до первого изменения: пустой список в нее не пишется
+        self.comparison = list(self.session.get(settings.COMPARISON_SESSION_ID) or [])
         self.products_cache = None
 
     def add(self, product):
@@ -65,13 +63,15 @@ class Comparison:
         """
         Полностью очищает список сравнения из сессии.
         """
-        if settings.COMPARISON_SESSION_ID in self.session:
-            del self.session[settings.COMPARISON_SESSION_ID]
-            self.save()
+        self.comparison = []
+        self.save()
 
     def save(self):
         """
-        Сохраняет изменения в сессии.
+        Сохраняет изменения в сессии. Пустой список из сессии удаляется.
         """
-        self.session.modified = True
+        if self.comparison:
+            self.session[settings.COMPARISON_SESSION_ID] = self.comparison
+        elif settings.COMPARISON_SESSION_ID in self.session:
+            del self.session[settings.COMPARISON_SESSION_ID]
         self.products_cache = None
\ No newline at end of file
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     
     'store.apps.StoreConfig',
@@ -60,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.middleware.InvalidationBatchMiddleware',
 ]
 
 ROOT_URLCONF = 'furniture.urls'
@@ -159,7 +161,26 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CART_SESSION_ID = 'cart'
 WISH_SESSION_ID = 'wishlist'
 COMPARISON_SESSION_ID = 'comparison'
-RECENTLY_VIEWED_SESSION_ID = 'recently_viewed'
+RECENTLY_VIEWED_COOKIE = 'recently_viewed'
+# Хранилище корзины анонимных посетителей (cart.storage); у авторизованных корзина в БД
+CART_STORAGE = env('CART_STORAGE', default='cart.storage.RedisCartStorage')
+CART_TTL = 60 * 60 * 24 * 30
+# Резервирование остатков при добавлении в корзину (cart.holds) — для распродаж
+STOCK_HOLDS_ENABLED = env.bool('STOCK_HOLDS_ENABLED', default=False)
+STOCK_HOLD_TTL = env.int('STOCK_HOLD_TTL', default=60 * 15)
+STOCK_HOLDER_SESSION_ID = 'stock_holder'
+
+# Курсорная (keyset) пагинация каталога вместо постраничной с OFFSET
+SHOP_KEYSET_PAGINATION = env.bool('SHOP_KEYSET_PAGINATION', default=True)
+
+# Полностраничный кэш для анонимных посетителей (store.page_cache)
+PAGE_CACHE_ENABLED = env.bool('PAGE_CACHE_ENABLED', default=True)
+PAGE_CACHE_TIMEOUT = 60 * 10
+# Версия кода в ключах кэша (store.cache_namespaces): при выкладке передается номер релиза,
+# чтобы процессы разных версий не читали объекты друг друга
+CACHE_CODE_VERSION = env('CACHE_CODE_VERSION', default='1')
+# Доля записей лога о сбросе кэша, которые реально пишутся (store.invalidation)
+INVALIDATION_LOG_SAMPLE_RATE = env.float('INVALIDATION_LOG_SAMPLE_RATE', default=0.1)
 
 
 LOGIN_REDIRECT_URL = 'store:account'
@@ -169,6 +190,8 @@ LOGIN_URL = 'users:login'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@domusaurea.com'
+# Получатель сообщений из формы контактов
+ADMIN_EMAIL = env('ADMIN_EMAIL', default=DEFAULT_FROM_EMAIL)
 
 
 CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://redis:6379/0')
@@ -177,6 +200,16 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'rebuild-bestsellers': {
+        'task': 'store.tasks.rebuild_bestsellers',
+        'schedule': 60 * 15,
+    },
+    'drain-outbox': {
+        'task': 'store.tasks.drain_outbox',
+        'schedule': 60,
+    },
+}
 
 
 REST_FRAMEWORK = {
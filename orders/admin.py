@@ -10,10 +10,15 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'first_name', 'last_name', 'email', 'paid', 'created', 'promo_code']
+    list_display = ['id', 'first_name', 'last_name', 'email', 'paid', 'created', 'promo_code', 'total']
     list_filter = ['paid', 'created', 'updated', 'promo_code']
     inlines = [OrderItemInline]
-    readonly_fields = ['discount']
+    readonly_fields = ['subtotal', 'discount', 'total']
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Позиции и скидку могли изменить или удалить: суммы в списках и API читаются из заказа
+        form.instance.update_totals()
 
 @admin.register(PromoCode)
 class PromoCodeAdmin(admin.ModelAdmin):
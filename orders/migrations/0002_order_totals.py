@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:44
+
+from django.conf import settings
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    subtotal = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order') \
+                                .annotate(cost=Sum(F('price') * F('quantity'))).values('cost')
+    Order.objects.update(subtotal=Coalesce(Subquery(subtotal), Value(Decimal(0)), output_field=DecimalField()))
+    Order.objects.update(total=F('subtotal') - F('discount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Стоимость товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Итого к оплате'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created'], include=('id', 'paid', 'total'), name='orders_user_created_idx'),
+        ),
+    ]
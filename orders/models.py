@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -30,6 +31,10 @@ class PromoCode(models.Model):
         if self.valid_from >= self.valid_to:
             raise ValidationError("Дата начала действия не может быть позже или равна дате окончания.")
 
+    def get_discount(self, amount):
+        """Сумма скидки по промокоду для суммы заказа, с округлением до копеек."""
+        return (amount * Decimal(self.discount_percent) / 100).quantize(Decimal('0.01'))
+
     @staticmethod
     def get_valid_promo(code_text):
         now = timezone.now()
@@ -44,6 +49,10 @@ class PromoCode(models.Model):
             return None
 
 
+# Поля заказа для списков: все они есть в индексе orders_user_created_idx
+ORDER_LIST_FIELDS = ('id', 'user', 'created', 'paid', 'total')
+
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders', verbose_name="Пользователь")
     first_name = models.CharField(max_length=50, verbose_name="Имя")
@@ -58,24 +67,41 @@ class Order(models.Model):
 
     promo_code = models.ForeignKey(PromoCode, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders', verbose_name="Промокод")
     discount = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Скидка по промокоду (сумма)")
+    # Суммы фиксируются при оформлении (set_totals): списки заказов не пересчитывают их по позициям
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False, verbose_name="Стоимость товаров")
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False, verbose_name="Итого к оплате")
 
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            # Списки заказов пользователя (личный кабинет, история заказов) читаются из индекса целиком
+            models.Index(fields=['user', '-created'], include=['id', 'paid', 'total'], name='orders_user_created_idx'),
+        ]
 
     def __str__(self):
         return f'Заказ #{self.id}'
 
+    def set_totals(self, subtotal):
+        """Записывает стоимость товаров и итог с учетом уже рассчитанной скидки."""
+        self.subtotal = subtotal
+        self.total = subtotal - self.discount
+
+    def update_totals(self):
+        """Пересчитывает и сохраняет суммы по позициям из БД — после их правки в обход place_order."""
+        subtotal = self.items.aggregate(subtotal=Sum(F('price') * F('quantity')))['subtotal']
+        self.set_totals(subtotal or Decimal(0))
+        self.save(update_fields=['subtotal', 'total', 'updated'])
+
     def get_subtotal_cost(self):
         """Возвращает стоимость товаров до скидки."""
-        return sum(item.get_cost() for item in self.items.all())
+        return self.subtotal
 
     def get_total_cost(self):
         """Возвращает итоговую стоимость с учетом скидки."""
-        subtotal = self.get_subtotal_cost()
-        return subtotal - self.discount
+        return self.total
     
     def get_absolute_url(self):
         return reverse('orders:order_detail', args=[self.id])
@@ -1,25 +1,127 @@
+from decimal import Decimal
 from typing import Dict, Optional
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import OperationalError, connection, transaction
 from cart.cart import Cart
 from store.models import Product
-from .models import Order, OrderItem
+from store.cache_namespaces import category_namespace
+from store.invalidation import invalidation
+from store.outbox import enqueue_email
+from .models import Order, OrderItem, PromoCode
 from .forms import OrderCreateForm
-from .tasks import order_created_email
+
+
+# Взаимоблокировка, сбой сериализации или истекший lock_timeout: заказ можно просто повторить
+RETRYABLE_PGCODES = {'40P01', '40001', '55P03'}
+
+
+def reserve_stock(quantities: Dict[int, int]) -> None:
+    """
+    Списывает остатки и увеличивает счетчики покупок всех позиций одним
+    условным UPDATE ... WHERE stock >= n RETURNING. Строки товаров блокируются
+    в том же запросе CTE с ORDER BY id FOR UPDATE: порядок блокировок у
+    параллельных заказов одинаковый, и пересекающиеся корзины не приводят
+    к взаимоблокировке. Блокировки держатся до конца транзакции, поэтому
+    запрос выполняют последним перед коммитом.
+
+    Если какого-то товара не хватает или конкурирующая транзакция все же
+    заставила откатить запрос, вызывает ValueError — транзакция заказа
+    откатывается целиком, включая уже списанные позиции.
+    """
+    if not quantities:
+        return
+    table = connection.ops.quote_name(Product._meta.db_table)
+    ids = sorted(quantities)
+    values = ', '.join(['(%s, %s)'] * len(ids))
+    params = [*ids, *(value for product_id in ids for value in (product_id, quantities[product_id]))]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH locked AS (SELECT id FROM {table} WHERE id IN ({", ".join(["%s"] * len(ids))}) '
+                f'ORDER BY id FOR UPDATE) '
+                f'UPDATE {table} AS p SET stock = p.stock - v.quantity, purchase_count = p.purchase_count + v.quantity '
+                f'FROM (VALUES {values}) AS v(id, quantity), locked '
+                f'WHERE p.id = v.id AND locked.id = p.id AND p.stock >= v.quantity RETURNING p.id',
+                params,
+            )
+            reserved = {row[0] for row in cursor.fetchall()}
+    except OperationalError as error:
+        if getattr(error.__cause__, 'pgcode', None) in RETRYABLE_PGCODES:
+            raise ValueError('Товары из корзины сейчас оформляют другие покупатели. Повторите попытку.') from error
+        raise
+    missing = set(quantities) - reserved
+    if missing:
+        product = Product.objects.filter(id__in=missing).order_by('id').only('name', 'stock').first()
+        if product is None:
+            raise ValueError('Товар из корзины больше не продается.')
+        raise ValueError(f"Недостаточно товара '{product.name}' на складе. Доступно: {product.stock} шт.")
+
+
+def queue_order_created_email(order: Order) -> None:
+    """Письмо о созданном заказе; уходит через outbox только если заказ закоммичен."""
+    enqueue_email(
+        subject=f'Заказ #{order.id} - Domus Aurea',
+        body=f'Уважаемый {order.first_name},\n\n'
+             f'Вы успешно разместили заказ.\n'
+             f'Номер вашего заказа: {order.id}.',
+        to=[order.email],
+        key=f'order_created:{order.id}',
+    )
 
 
 @transaction.atomic
+def place_order(order: Order, lines: Dict[int, int], promo_code: Optional[PromoCode] = None,
+                prices: Optional[Dict[int, Decimal]] = None) -> Order:
+    """
+    Единый путь оформления заказа для HTML-корзины и REST API.
+    1. Загружает все товары заказа одним запросом и проверяет остатки пачкой.
+    2. Сохраняет заказ с суммами и скидкой по промокоду и все позиции одним bulk_create.
+    3. Списывает остатки одним условным UPDATE (reserve_stock) — последним
+       шагом, чтобы строки товаров были заблокированы как можно меньше.
+    4. Записывает письмо покупателю в outbox той же транзакцией; закэшированные
+       страницы заказанных товаров и их категорий сбрасываются после коммита.
+
+    lines — количества по id товара, prices — цены позиций (по умолчанию
+    текущая цена товара). При ошибке вызывает ValueError, заказ не создается.
+    """
+    if not lines:
+        raise ValueError('В заказе нет товаров.')
+    products = Product.objects.select_related('category').in_bulk(lines)
+    for product_id, quantity in lines.items():
+        product = products.get(product_id)
+        if product is None or not product.available:
+            raise ValueError('Товар из корзины больше не продается.')
+        if product.stock < quantity:
+            raise ValueError(f"Недостаточно товара '{product.name}' на складе. Доступно: {product.stock} шт.")
+
+    prices = prices or {}
+    items = [
+        OrderItem(order=order, product=products[product_id], quantity=quantity,
+                  price=prices.get(product_id, products[product_id].final_price))
+        for product_id, quantity in lines.items()
+    ]
+    subtotal = sum((item.get_cost() for item in items), Decimal(0))
+    if promo_code:
+        order.promo_code = promo_code
+        order.discount = promo_code.get_discount(subtotal)
+    order.set_totals(subtotal)
+    order.save()
+    OrderItem.objects.bulk_create(items)
+    # Остаток мог измениться после проверки выше: окончательно его проверяет условный UPDATE
+    reserve_stock(lines)
+    # Остатки списаны в обход сигналов: сбрасываем (после коммита) страницы заказанных товаров и их категорий
+    invalidation.touch_tags(*{tag for product in products.values()
+                              for tag in (f'product:{product.slug}', category_namespace(product.category.slug))})
+    queue_order_created_email(order)
+    return order
+
+
 def create_order(cart: Cart, form_data: Dict, user: Optional[User] = None) -> Optional[Order]:
     """
-    Сервисная функция для создания заказа.
-    1. Валидирует данные формы.
-    2. Создает объект Order, применяет скидку по промокоду.
-    3. Блокирует строки товаров для безопасного списания остатков.
-    4. Переносит товары из корзины в OrderItem, проверяя и уменьшая остатки.
-    5. Очищает корзину.
-    6. Запускает асинхронную задачу отправки email.
-    
-    В случае нехватки товара вызывает ValueError.
+    Оформляет заказ из корзины: валидирует данные формы, в режиме резервирования
+    продлевает резервы остатков (cart.holds), передает позиции по ценам из
+    корзины в place_order и очищает корзину, снимая резервы.
+    Возвращает None, если форма невалидна; при нехватке товара вызывает ValueError.
     """
     form = OrderCreateForm(form_data)
     if not form.is_valid():
@@ -28,39 +130,19 @@ def create_order(cart: Cart, form_data: Dict, user: Optional[User] = None) -> Op
     order = form.save(commit=False)
     if user and user.is_authenticated:
         order.user = user
-    
-    # Применяем промокод из корзины
-    if cart.promo_code:
-        order.promo_code = cart.promo_code
-        order.discount = cart.get_discount()
 
-    order.save()
+    if cart.holds is not None:
+        # Резерв мог истечь, пока покупатель заполнял форму: продлеваем его и отказываем
+        # до обращения к остаткам в БД, если товар уже зарезервировали другие
+        items = cart.pricing.items
+        available = cart.hold_stock({item['product']: item['quantity'] for item in items})
+        for item in items:
+            product = item['product']
+            if available[product.id] < item['quantity']:
+                raise ValueError(f"Недостаточно товара '{product.name}' на складе. Доступно: {available[product.id]} шт.")
 
-    product_ids = [item['product'].id for item in cart]
-    # Блокируем строки товаров для безопасного обновления
-    products = Product.objects.select_for_update().filter(id__in=product_ids)
-    product_map = {product.id: product for product in products}
-
-    for item in cart:
-        product = product_map.get(item['product'].id)
-        if product.stock < item['quantity']:
-            # Транзакция будет отменена автоматически при возникновении исключения
-            raise ValueError(f"Недостаточно товара '{product.name}' на складе. Доступно: {product.stock} шт.")
-        
-        OrderItem.objects.create(
-            order=order,
-            product=product,
-            price=item['price'],
-            quantity=item['quantity']
-        )
-        product.stock -= item['quantity']
-        product.purchase_count += item['quantity']
-    
-    # Сохраняем обновленные остатки и счетчики покупок одним запросом
-    Product.objects.bulk_update(products, ['stock', 'purchase_count'])
-    
+    lines = {int(product_id): item['quantity'] for product_id, item in cart.cart.items()}
+    prices = {int(product_id): Decimal(item['price']) for product_id, item in cart.cart.items()}
+    place_order(order, lines, promo_code=cart.promo_code, prices=prices)
     cart.clear()
-    
-    order_created_email.delay(order.id)
-    
-    return order
\ No newline at end of file
+    return order
@@ -2,9 +2,15 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.conf import settings
 from store.factories import UserFactory, ProductFactory
-from orders.models import Order
+from django.db import OperationalError, connection
+from django.db.backends.utils import CursorWrapper
+from unittest import mock
+from django.test.utils import CaptureQueriesContext
+from orders.models import Order, OrderItem, PromoCode
 from store.models import Product
+from datetime import timedelta
 from decimal import Decimal
+from django.utils import timezone
 
 class OrderCreationTests(TestCase):
     def setUp(self):
@@ -81,6 +87,105 @@ class OrderCreationTests(TestCase):
         self.assertEqual(len(messages), 1)
         self.assertIn(f"Недостаточно товара '{self.product.name}'", str(messages[0]))
 
+    def test_order_rolled_back_when_one_line_is_short(self):
+        """Нехватка одной позиции откатывает весь заказ; строки блокируются в порядке id в том же UPDATE."""
+        other = ProductFactory(base_price=Decimal('90.00'), stock=1, discount=0)
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = {
+            str(self.product.id): {'quantity': 2, 'price': str(self.product.final_price)},
+            str(other.id): {'quantity': 3, 'price': str(other.final_price)},
+        }
+        session.save()
+
+        self.client.post(self.create_url, self.order_data)
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(OrderItem.objects.count(), 0)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.purchase_count), (10, 0))
+
+        # Корзина после отказа сохранилась: после поставки заказ проходит
+        Product.objects.filter(id=other.id).update(stock=3)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.create_url, self.order_data)
+        locking = [query['sql'] for query in queries if 'FOR UPDATE' in query['sql']]
+        self.assertEqual(len(locking), 1)
+        self.assertIn('ORDER BY id FOR UPDATE', locking[0])
+        self.assertTrue(locking[0].startswith('WITH'))
+        self.assertEqual(Order.objects.get().items.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.purchase_count), (8, 2))
+        self.assertEqual(Product.objects.get(id=other.id).stock, 0)
+
+    def test_order_deadlock_reported_as_retry(self):
+        """Взаимоблокировка при списании остатков — сообщение покупателю, а не ошибка 500."""
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = {
+            str(self.product.id): {'quantity': 2, 'price': str(self.product.final_price)},
+        }
+        session.save()
+
+        class DeadlockDetected(Exception):
+            pgcode = '40P01'
+
+        execute = CursorWrapper.execute
+
+        def deadlock(cursor, sql, params=None):
+            if sql.startswith('WITH locked'):
+                raise OperationalError('deadlock detected') from DeadlockDetected()
+            return execute(cursor, sql, params)
+
+        with mock.patch.object(CursorWrapper, 'execute', deadlock):
+            response = self.client.post(self.create_url, self.order_data, follow=True)
+        self.assertRedirects(response, reverse('cart:cart_detail'))
+        self.assertContains(response, 'Повторите попытку')
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_order_totals_stored_at_placement(self):
+        """Суммы заказа записываются при оформлении, списки заказов читают их без позиций."""
+        now = timezone.now()
+        promo = PromoCode.objects.create(code='TOTAL10', discount_percent=10,
+                                         valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1))
+        session = self.client.session
+        session[settings.CART_SESSION_ID] = {
+            str(self.product.id): {'quantity': 2, 'price': '150.00'}
+        }
+        session['promo_code_id'] = promo.id
+        session.save()
+
+        self.client.post(self.create_url, self.order_data)
+        order = Order.objects.get()
+        self.assertEqual(order.subtotal, Decimal('300.00'))
+        self.assertEqual(order.discount, Decimal('30.00'))
+        self.assertEqual(order.total, Decimal('270.00'))
+
+        for url in (reverse('orders:order_list'), reverse('store:account')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertContains(response, '270 ₽')
+            self.assertFalse([q['sql'] for q in queries if 'orders_orderitem' in q['sql']])
+
+    def test_order_totals_recalculated_after_admin_edit(self):
+        """Удаление позиции в админке пересчитывает сохраненные суммы заказа."""
+        other = ProductFactory(stock=5)
+        order = Order.objects.create(user=self.user, discount=Decimal('10.00'), **self.order_data)
+        item = OrderItem.objects.create(order=order, product=self.product, price=Decimal('150.00'), quantity=2)
+        extra = OrderItem.objects.create(order=order, product=other, price=Decimal('50.00'), quantity=1)
+        order.update_totals()
+        self.assertEqual((order.subtotal, order.total), (Decimal('350.00'), Decimal('340.00')))
+
+        self.client.force_login(UserFactory(is_staff=True, is_superuser=True))
+        data = {
+            **self.order_data, 'user': self.user.id, 'paid': 'on', 'promo_code': '',
+            'items-TOTAL_FORMS': '2', 'items-INITIAL_FORMS': '2', 'items-MIN_NUM_FORMS': '0', 'items-MAX_NUM_FORMS': '1000',
+            'items-0-id': item.id, 'items-0-order': order.id,
+            'items-1-id': extra.id, 'items-1-order': order.id, 'items-1-DELETE': 'on',
+        }
+        response = self.client.post(reverse('admin:orders_order_change', args=[order.id]), data)
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.items.count(), 1)
+        self.assertEqual((order.subtotal, order.total), (Decimal('300.00'), Decimal('290.00')))
+
     def test_order_creation_with_empty_cart(self):
         """Тестирует редирект при попытке создать заказ с пустой корзиной."""
         session = self.client.session
@@ -5,17 +5,15 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView
-from django.db.models import Sum, F, DecimalField
-from django.db.models.functions import Coalesce
 
-from .models import Order
+from .models import Order, ORDER_LIST_FIELDS
 from .forms import OrderCreateForm
-from cart.cart import Cart
+from cart.cart import get_cart
 from .services import create_order
 
 @login_required
 def order_create(request: HttpRequest) -> HttpResponse:
-    cart = Cart(request)
+    cart = get_cart(request)
     if len(cart) == 0:
         messages.info(request, "Ваша корзина пуста. Невозможно оформить заказ.")
         return redirect('store:product_list')
@@ -79,13 +77,8 @@ class OrderListView(LoginRequiredMixin, UserOrdersMixin, ListView):
         # Наследуем фильтрацию по пользователю от UserOrdersMixin
         queryset = super().get_queryset()
         
-        # Аннотируем для подсчета общей стоимости
-        total_cost_annotation = Coalesce(
-            Sum(F('items__price') * F('items__quantity')),
-            0,
-            output_field=DecimalField()
-        )
-        return queryset.annotate(total_cost=total_cost_annotation).order_by('-created')
+        # Итог хранится в заказе: список читается из индекса (user, -created) без соединения с позициями
+        return queryset.only(*ORDER_LIST_FIELDS).order_by('-created')
 
 
 class OrderDetailView(LoginRequiredMixin, UserOrdersMixin, DetailView):
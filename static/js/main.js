@@ -264,7 +264,46 @@ async function handleUserAction(button, entity, action, params = {}) {
 }
 
 
+// Страница из полностраничного кэша не содержит персональных данных — догружаем их отдельно
+async function loadPersonalState() {
+    const meta = document.querySelector('meta[name="personal-state"]');
+    if (!meta || meta.getAttribute('content') !== '1') return;
+
+    try {
+        const response = await fetch('/api/session-state/', { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+        if (!response.ok) throw new Error(`API Error: ${response.statusText}`);
+        const data = await response.json();
+
+        window.dispatchEvent(new CustomEvent('update-cart-count', { detail: { count: data.cart_count } }));
+        window.dispatchEvent(new CustomEvent('update-wishlist-count', { detail: { count: data.wishlist_count } }));
+        window.dispatchEvent(new CustomEvent('update-comparison-count', { detail: { count: data.comparison_count } }));
+
+        document.querySelectorAll('[data-entity="wishlist"]').forEach(button => {
+            const icon = button.querySelector('i.icon-default');
+            const isAdded = data.wishlist_ids.includes(Number(button.dataset.productId));
+            if (icon) {
+                icon.classList.toggle('far', !isAdded);
+                icon.classList.toggle('fas', isAdded);
+                icon.classList.toggle('text-sale-pink', isAdded);
+            }
+        });
+        document.querySelectorAll('[data-entity="comparison"]').forEach(button => {
+            const icon = button.querySelector('i.icon-default');
+            if (icon) {
+                icon.classList.toggle('text-lavender-dark', data.comparison_ids.includes(Number(button.dataset.productId)));
+            }
+        });
+
+        window.dispatchEvent(new CustomEvent('personal-state-loaded', { detail: data }));
+    } catch (error) {
+        console.error('Ошибка загрузки персональных данных:', error);
+    }
+}
+
+
 document.addEventListener('DOMContentLoaded', () => {
+    loadPersonalState();
+
     // Логика для кнопки "Наверх"
     const scrollTopBtn = document.getElementById('scrollTopBtn');
     if (scrollTopBtn) {
@@ -1,6 +1,11 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Category, Product, Review, Subscriber, ContactMessage, Feature, Slide, SpecialOffer, ProductImage
+from .models import Category, Product, Review, Subscriber, ContactMessage, Feature, Slide, SpecialOffer, ProductImage, OutboxMessage
+from .services import rebuild_product_ratings
+from .pricing import reprice_products, MAX_DISCOUNT
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -38,6 +43,13 @@ class ProductImageInline(admin.TabularInline):
     image_thumbnail_display.short_description = "Миниатюра"
 
 
+class RepriceActionForm(ActionForm):
+    """Дополнительные поля рядом со списком действий для массовой переоценки."""
+    discount = forms.IntegerField(label='Скидка, %', required=False, min_value=0, max_value=MAX_DISCOUNT)
+    base_price_percent = forms.DecimalField(label='Изменить базовую цену на, %', required=False,
+                                            max_digits=5, decimal_places=2, min_value=-99)
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['image_tag', 'name', 'category', 'brand', 'final_price', 'stock', 'available', 'is_featured']
@@ -67,6 +79,33 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name', 'description', 'brand', 'collection', 'sku', 'category__name']
     search_help_text = 'Поиск по названию, описанию, бренду, артикулу и категории.'
+    action_form = RepriceActionForm
+    actions = ['set_discount', 'change_base_price']
+
+    def _reprice(self, request, queryset, field, **changes):
+        if changes[field] is None:
+            self.message_user(request, 'Заполните поле рядом со списком действий.', messages.WARNING)
+            return
+        try:
+            updated = reprice_products(queryset, **changes)
+        except ValueError as error:
+            self.message_user(request, str(error), messages.ERROR)
+            return
+        self.message_user(request, f'Переоценено товаров: {updated}.')
+
+    def _action_value(self, request, field):
+        # Форма действий уже проверена админкой до вызова действия
+        value = request.POST.get(field)
+        return self.action_form.base_fields[field].clean(value) if value not in (None, '') else None
+
+    @admin.action(description='Установить скидку выбранным товарам')
+    def set_discount(self, request, queryset):
+        self._reprice(request, queryset, 'discount', discount=self._action_value(request, 'discount'))
+
+    @admin.action(description='Изменить базовую цену выбранных товаров на процент')
+    def change_base_price(self, request, queryset):
+        self._reprice(request, queryset, 'base_price_percent',
+                      base_price_percent=self._action_value(request, 'base_price_percent'))
 
     @admin.display(description='Изображение')
     def image_tag(self, obj):
@@ -81,6 +120,24 @@ class ReviewAdmin(admin.ModelAdmin):
     list_editable = ['is_active']
     search_fields = ['author_name', 'text', 'product__name']
     autocomplete_fields = ['product']
+    actions = ['activate_reviews', 'deactivate_reviews']
+
+    def _set_active(self, queryset, is_active):
+        product_ids = set(queryset.values_list('product_id', flat=True))
+        updated = queryset.update(is_active=is_active)
+        # update() не отправляет сигналы, поэтому статистику пересчитываем явно
+        rebuild_product_ratings(product_ids)
+        return updated
+
+    @admin.action(description='Опубликовать выбранные отзывы')
+    def activate_reviews(self, request, queryset):
+        updated = self._set_active(queryset, True)
+        self.message_user(request, f'Опубликовано отзывов: {updated}.')
+
+    @admin.action(description='Скрыть выбранные отзывы')
+    def deactivate_reviews(self, request, queryset):
+        updated = self._set_active(queryset, False)
+        self.message_user(request, f'Скрыто отзывов: {updated}.')
 
 @admin.register(Subscriber)
 class SubscriberAdmin(admin.ModelAdmin):
@@ -93,4 +150,19 @@ class ContactMessageAdmin(admin.ModelAdmin):
     list_filter = ('is_processed', 'created_at')
     list_editable = ('is_processed',)
     readonly_fields = ('name', 'email', 'subject', 'message', 'created_at')
-    search_fields = ('name', 'email', 'subject', 'message')
\ No newline at end of file
+    search_fields = ('name', 'email', 'subject', 'message')
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'status', 'attempts', 'available_at', 'created', 'processed_at')
+    list_filter = ('status', 'topic')
+    search_fields = ('key', 'last_error')
+    readonly_fields = ('topic', 'payload', 'key', 'attempts', 'last_error', 'created', 'processed_at')
+    actions = ['retry_messages']
+
+    @admin.action(description="Отправить повторно")
+    def retry_messages(self, request, queryset):
+        updated = queryset.exclude(status=OutboxMessage.Status.SENT).update(
+            status=OutboxMessage.Status.PENDING, attempts=0, available_at=timezone.now()
+        )
+        self.message_user(request, f"Поставлено в очередь: {updated}.", messages.SUCCESS)
@@ -0,0 +1,203 @@
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'autocomplete_version'
+# Как часто воркер сверяет свою версию индекса с общей (секунды)
+VERSION_CHECK_INTERVAL = 2
+# Нечеткий поиск по триграммам включается для слов от этой длины
+MIN_FUZZY_LENGTH = 4
+FUZZY_THRESHOLD = 0.5
+# Сколько токенов индекса максимум разворачивает один префикс (короткие "01", "ск")
+MAX_EXPANSIONS = 50
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+def query_trigrams(token):
+    # Без завершающего пробела: пользователь может еще не допечатать слово
+    padded = f'  {token}'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def format_price(value):
+    return f'{value:,.0f}'.replace(',', ' ')
+
+
+class AutocompleteIndex:
+    """
+    Неизменяемый индекс подсказок по названиям, брендам и артикулам товаров.
+    Префиксный поиск идет по отсортированному списку токенов (bisect),
+    опечатки прощаются через индекс триграмм токенов. Списки товаров по токену
+    заранее отсортированы по названию, поэтому выдача собирается лениво до limit.
+    Готовые данные подсказок (url, картинка, цены) хранятся в самом индексе.
+    """
+    def __init__(self, products=()):
+        self.payloads = {}
+        self.sort_keys = {}
+        self.product_tokens = {}
+        postings = defaultdict(list)
+        for product in products:
+            self.payloads[product.id] = {
+                'name': product.name,
+                'url': product.get_absolute_url(),
+                'image_url': product.get_main_image_url(),
+                'price': format_price(product.final_price),
+                'old_price': format_price(product.old_price) if product.old_price else None,
+            }
+            self.sort_keys[product.id] = (product.name.lower(), product.id)
+            tokens = frozenset(tokenize(product.name) + tokenize(product.brand) + tokenize(product.sku))
+            self.product_tokens[product.id] = tokens
+            for token in tokens:
+                postings[token].append(product.id)
+        self.postings = {token: sorted(ids, key=self.sort_keys.__getitem__) for token, ids in postings.items()}
+        self.posting_sets = {token: frozenset(ids) for token, ids in postings.items()}
+        self.tokens = sorted(self.postings)
+        self.trigram_postings = defaultdict(set)
+        for token in self.tokens:
+            for trigram in query_trigrams(token):
+                self.trigram_postings[trigram].add(token)
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def _token_matches(self, query_token, limit):
+        """Токены индекса, подходящие под слово запроса, с весом: точное > префикс > нечеткое."""
+        matches = {}
+        covered = 0
+        position = bisect.bisect_left(self.tokens, query_token)
+        end = min(position + MAX_EXPANSIONS, len(self.tokens))
+        while position < end and self.tokens[position].startswith(query_token):
+            token = self.tokens[position]
+            matches[token] = 2.0 if token == query_token else 1.0
+            covered += len(self.postings[token])
+            position += 1
+        if covered < limit and len(query_token) >= MIN_FUZZY_LENGTH:
+            trigrams = query_trigrams(query_token)
+            shared = Counter(token for trigram in trigrams for token in self.trigram_postings.get(trigram, ()))
+            for token, count in shared.items():
+                similarity = count / len(trigrams)
+                if similarity >= FUZZY_THRESHOLD:
+                    matches.setdefault(token, similarity * 0.9)
+        return matches
+
+    def _matching_ids(self, matches):
+        ids = set()
+        for token in matches:
+            ids |= self.posting_sets[token]
+        return ids
+
+    def _ranked_single(self, matches, limit):
+        # Внутри одного веса списки уже отсортированы по названию — сливаем их лениво
+        ranked, seen = [], set()
+        for score in sorted(set(matches.values()), reverse=True):
+            tier = [self.postings[token] for token, token_score in matches.items() if token_score == score]
+            for product_id in heapq.merge(*tier, key=self.sort_keys.__getitem__):
+                if product_id not in seen:
+                    seen.add(product_id)
+                    ranked.append(product_id)
+                    if len(ranked) == limit:
+                        return ranked
+        return ranked
+
+    def search(self, query, limit=6):
+        """Каждое слово запроса должно совпасть с каким-либо токеном товара (по префиксу или нечетко)."""
+        all_matches = [self._token_matches(query_token, limit) for query_token in tokenize(query)]
+        if not all_matches or not all(all_matches):
+            return []
+        if len(all_matches) == 1:
+            return [self.payloads[pid] for pid in self._ranked_single(all_matches[0], limit)]
+
+        # Кандидаты — пересечение множеств товаров по всем словам, веса считаем только для них
+        candidates = set.intersection(*(self._matching_ids(matches) for matches in all_matches))
+        scores = {
+            product_id: sum(
+                max(matches[token] for token in self.product_tokens[product_id] if token in matches)
+                for matches in all_matches
+            )
+            for product_id in candidates
+        }
+        ranked = heapq.nsmallest(limit, scores, key=lambda pid: (-scores[pid], self.sort_keys[pid]))
+        return [self.payloads[pid] for pid in ranked]
+
+
+class AutocompleteService:
+    """
+    Индекс подсказок в памяти воркера. Изменения товаров после коммита
+    увеличивают общую версию в кэше; воркеры сверяют ее не чаще
+    VERSION_CHECK_INTERVAL и перестраивают индекс в фоновом потоке, продолжая
+    отвечать по прежнему. Синхронно индекс строится только первый раз, когда
+    отдавать еще нечего. background=False перестраивает индекс в запросе (тесты).
+    """
+    background = True
+
+    def __init__(self):
+        self._index = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+
+    def build(self):
+        products = Product.objects.filter(available=True).prefetch_related('images')
+        return AutocompleteIndex(products)
+
+    def _rebuild(self, version):
+        index = self.build()
+        self._index, self._version = index, version
+
+    def _rebuild_in_background(self, version):
+        try:
+            self._rebuild(version)
+        except Exception:
+            logger.exception('Не удалось перестроить индекс подсказок')
+        finally:
+            self._rebuilding.release()
+            connection.close()
+
+    def get_index(self):
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return self._index
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        self._checked_at = now
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._rebuild(version)
+        elif version != self._version:
+            if not self.background:
+                with self._lock:
+                    self._rebuild(version)
+            elif self._rebuilding.acquire(blocking=False):
+                # Один пересчет на процесс; версия, сменившаяся во время пересчета, подхватится следующей проверкой
+                threading.Thread(target=self._rebuild_in_background, args=(version,),
+                                 name='autocomplete-rebuild', daemon=True).start()
+        return self._index
+
+    def search(self, query, limit=6):
+        return self.get_index().search(query, limit)
+
+    def mark_stale(self):
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self):
+        cache.add(VERSION_CACHE_KEY, 0, None)
+        cache.incr(VERSION_CACHE_KEY)
+        # Свой воркер сверит версию при следующем запросе, не дожидаясь интервала
+        self._checked_at = 0.0
+
+
+autocomplete = AutocompleteService()
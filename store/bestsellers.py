@@ -0,0 +1,93 @@
+from collections import defaultdict
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+from orders.models import OrderItem
+from .models import Product, Category
+from .cache_namespaces import versioned_key
+from .loaders import load_products
+
+# Окна рейтинга: ключ -> глубина в днях (None — за все время)
+WINDOWS = {'7d': 7, '30d': 30, 'all': None}
+DEFAULT_WINDOW = 'all'
+ALL_CATEGORIES = 'all'
+# Сколько id хранится в каждом рейтинге (с запасом на закончившиеся товары)
+RANKING_SIZE = 24
+# Кэш живет дольше интервала периодической задачи, чтобы рейтинг не пропадал между запусками
+BESTSELLERS_CACHE_TIMEOUT = 60 * 60 * 2
+REBUILD_PENDING_KEY = 'bestsellers_rebuild_pending'
+
+
+def bestsellers_cache_key(window, category_id=None):
+    return versioned_key(f'bestsellers_{window}_{category_id or ALL_CATEGORIES}')
+
+
+def _rank(rows):
+    """Раскладывает строки (product_id, category_id) по рейтингам каталога и категорий."""
+    rankings = defaultdict(list)
+    for product_id, category_id in rows:
+        for scope in (ALL_CATEGORIES, category_id):
+            if len(rankings[scope]) < RANKING_SIZE:
+                rankings[scope].append(product_id)
+    return rankings
+
+
+def build_bestsellers():
+    """
+    Пересчитывает рейтинги продаж по всем окнам для всего каталога и каждой
+    категории: один агрегирующий запрос по OrderItem на окно, запись в кэш пачкой.
+    Рейтинг за все время дополняется товарами по purchase_count, чтобы
+    витрина не пустела, пока заказов мало.
+    """
+    now = timezone.now()
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    result = {}
+    for window, days in WINDOWS.items():
+        # Пустые рейтинги тоже кэшируются, иначе каждый запрос к ним запускал бы пересчет
+        result.update({bestsellers_cache_key(window, cid): [] for cid in [None, *category_ids]})
+        items = OrderItem.objects.all()
+        if days is not None:
+            items = items.filter(order__created__gte=now - timezone.timedelta(days=days))
+        rows = items.values('product_id', 'product__category_id') \
+                    .annotate(sold=Sum('quantity')) \
+                    .order_by('-sold', 'product_id') \
+                    .values_list('product_id', 'product__category_id')
+        rows = list(rows)
+        if days is None:
+            seen = {product_id for product_id, _ in rows}
+            fallback = Product.objects.filter(available=True).order_by('-purchase_count', '-created') \
+                                      .values_list('id', 'category_id')
+            rows += [row for row in fallback if row[0] not in seen]
+        for scope, ids in _rank(rows).items():
+            result[bestsellers_cache_key(window, None if scope == ALL_CATEGORIES else scope)] = ids
+
+    cache.set_many(result, BESTSELLERS_CACHE_TIMEOUT)
+    return result
+
+
+def schedule_bestsellers_rebuild():
+    """Ставит пересчет рейтингов в очередь Celery; пока задача не началась, новых не создает."""
+    from .tasks import rebuild_bestsellers
+
+    if cache.add(REBUILD_PENDING_KEY, 1, 60 * 5):
+        rebuild_bestsellers.delay()
+
+
+def get_bestseller_ids(window=DEFAULT_WINDOW, category_id=None):
+    """
+    Рейтинг из кэша. Пересчет затрагивает все окна и категории, поэтому при
+    промахе (холодный кэш, вытеснение) он уходит в Celery, а запрос получает
+    рейтинг за все время или пустой список.
+    """
+    key = bestsellers_cache_key(window, category_id)
+    fallback_key = bestsellers_cache_key(DEFAULT_WINDOW, category_id)
+    found = cache.get_many([key, fallback_key])
+    if key in found:
+        return found[key]
+    schedule_bestsellers_rebuild()
+    return found.get(fallback_key, [])
+
+
+def get_bestsellers(window=DEFAULT_WINDOW, category_id=None, limit=4):
+    """Самые продаваемые доступные товары окна из кэшированного рейтинга, в порядке рейтинга."""
+    return load_products(get_bestseller_ids(window, category_id), limit)
@@ -0,0 +1,183 @@
+import math
+import random
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from .local_cache import local_cache, publish_invalidation, subscriber
+
+_MISSING = object()
+
+# Сколько после срока свежести отдается прежнее значение, пока один процесс его пересчитывает
+STALE_TIMEOUT = 60 * 5
+# Блокировка пересчета: время жизни на случай падения процесса и ожидание холодного ключа
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+def generation_key(namespace):
+    return f'cache_gen_{namespace}'
+
+
+def category_namespace(slug):
+    """
+    Пространство имен (и тег страниц) одной категории: ее фасеты и страницы
+    каталога сбрасываются без данных остальных категорий.
+    """
+    return f'category:{slug}'
+
+
+def versioned_key(key):
+    """
+    Добавляет к ключу версию кода: после выкладки, меняющей форму кэшируемых
+    объектов, старые и новые процессы читают каждый свои данные.
+    """
+    return f'v{settings.CACHE_CODE_VERSION}:{key}'
+
+
+def get_generations(namespaces, create=False):
+    """Текущие поколения пространств имен; create=True заводит недостающие."""
+    keys = [generation_key(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+    if create and len(generations) < len(keys):
+        for key in keys:
+            if key not in generations:
+                cache.add(key, time.time_ns(), None)
+        generations = cache.get_many(keys)
+    return generations
+
+
+def bump_generations(*namespaces):
+    """
+    Новое поколение делает устаревшими все данные пространства имен разом,
+    без перебора ключей. Старые записи никто больше не читает, их вытесняет TTL.
+    """
+    generation = time.time_ns()
+    cache.set_many({generation_key(namespace): generation for namespace in namespaces}, None)
+    local_cache.discard_namespaces(namespaces)
+    publish_invalidation(namespaces)
+
+
+def _now():
+    """Часы сроков свежести; тесты подменяют их, не трогая time.time во всем процессе."""
+    return time.time()
+
+
+def _should_refresh(entry, beta):
+    _, fresh_until, delta = entry
+    if fresh_until is None:
+        return False
+    # 1 - random() лежит в (0, 1], логарифм от него не падает на нуле
+    return _now() - delta * beta * math.log(1 - random.random()) >= fresh_until
+
+
+def _compute(full_key, default, timeout, stale_timeout):
+    """Считает значение и сохраняет его вместе со сроком свежести и временем расчета."""
+    started = _now()
+    value = default() if callable(default) else default
+    delta = _now() - started
+    if timeout is DEFAULT_TIMEOUT:
+        timeout = cache.default_timeout
+    if timeout is None:
+        cache.set(full_key, (value, None, delta), None)
+    else:
+        cache.set(full_key, (value, started + delta + timeout, delta), timeout + stale_timeout)
+    return value
+
+
+class NamespacedCache:
+    """
+    Кэш, ключи которого содержат версию кода и поколения пространств имен
+    (теги тех же имен сбрасываются через invalidation.touch_tags). Ключ
+    зависит от всех перечисленных пространств: запись устаревает при сбросе любого.
+
+    С local=True результаты get_or_set еще и держатся в памяти процесса
+    (store.local_cache): такие запросы обходятся без Redis, а сброс доходит
+    до всех воркеров через pub/sub, в худшем случае — по истечении TTL.
+    """
+    def __init__(self, *namespaces, local=False):
+        self.namespaces = namespaces
+        self.local = local
+
+    def _prefix(self):
+        generations = get_generations(self.namespaces, create=True)
+        return '.'.join(f'{namespace}:{generations.get(generation_key(namespace), 0)}' for namespace in self.namespaces)
+
+    def _make_keys(self, keys):
+        prefix = self._prefix()
+        return {key: versioned_key(f'{key}@{prefix}') for key in keys}
+
+    def get(self, key, default=None):
+        return cache.get(self._make_keys([key])[key], default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        cache.set(self._make_keys([key])[key], value, timeout)
+
+    def get_many(self, keys):
+        full_keys = self._make_keys(keys)
+        found = cache.get_many(full_keys.values())
+        return {key: found[full_key] for key, full_key in full_keys.items() if full_key in found}
+
+    def set_many(self, mapping, timeout=DEFAULT_TIMEOUT):
+        full_keys = self._make_keys(mapping)
+        cache.set_many({full_keys[key]: value for key, value in mapping.items()}, timeout)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, stale_timeout=STALE_TIMEOUT, beta=1.0):
+        """
+        Как cache.get_or_set, но без лавины пересчетов при истечении горячего ключа:
+
+        - значение пересчитывается заранее с вероятностью, растущей к концу
+          срока свежести (XFetch: чем дольше считается значение, тем раньше);
+        - пересчитывает только процесс, взявший блокировку cache.add, остальные
+          до stale_timeout после истечения отдают прежнее значение;
+        - при холодном ключе остальные ждут результат до LOCK_WAIT секунд.
+
+        None тоже кэшируется (например, отсутствие спецпредложения). Запись хранится
+        вместе со сроком свежести, поэтому читать ее можно только через get_or_set.
+        """
+        if not self.local:
+            return self._get_or_set_shared(key, default, timeout, stale_timeout, beta)
+        subscriber.ensure_started()
+        local_key = (self.namespaces, key)
+        value = local_cache.get(local_key, _MISSING)
+        if value is _MISSING:
+            # Счетчик читается до поколений: сброс, пришедший во время расчета, не оставит в памяти старое значение
+            epoch = local_cache.epoch
+            value = self._get_or_set_shared(key, default, timeout, stale_timeout, beta)
+            local_cache.set(local_key, value, epoch=epoch)
+        return value
+
+    def _get_or_set_shared(self, key, default, timeout, stale_timeout, beta):
+        full_key = self._make_keys([key])[key]
+        entry = cache.get(full_key)
+        if entry is not None and not _should_refresh(entry, beta):
+            return entry[0]
+
+        lock_key = f'{full_key}:lock'
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                return _compute(full_key, default, timeout, stale_timeout)
+            finally:
+                cache.delete(lock_key)
+        if entry is not None:
+            return entry[0]
+
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = cache.get(full_key)
+            if entry is not None:
+                return entry[0]
+        # Пересчитывающий процесс не успел (или упал): запрос не должен ждать бесконечно
+        return _compute(full_key, default, timeout, stale_timeout)
+
+    def invalidate(self):
+        bump_generations(*self.namespaces)
+
+
+# Категории и спецпредложение нужны каждой странице, а меняются редко
+layout_cache = NamespacedCache('layout', local=True)
+home_cache = NamespacedCache('home')
+catalog_cache = NamespacedCache('catalog')
+blog_cache = NamespacedCache('blog')
@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .cache_namespaces import versioned_key
+
+CARD_TEMPLATE = 'store/partials/_product_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Метки на месте персональных частей карточки: в кэше лежит разметка, общая для всех посетителей
+WISHLIST_SLOT = '__wishlist_icon__'
+COMPARISON_SLOT = '__comparison_icon__'
+
+
+def card_cache_key(product):
+    """
+    Версия карточки — время обновления товара. Наличие тоже входит в ключ:
+    остатки списываются через bulk_update, который не трогает поле updated.
+    Версия кода отделяет разметку разных выкладок шаблона.
+    """
+    in_stock = int(product.available and product.stock > 0)
+    return versioned_key(f'product_card_{product.pk}_{product.updated.timestamp():.6f}_{in_stock}')
+
+
+def _render_card(product):
+    return render_to_string(CARD_TEMPLATE, {
+        'product': product,
+        'wishlist_icon': WISHLIST_SLOT,
+        'comparison_icon': COMPARISON_SLOT,
+    })
+
+
+def render_product_cards(products, wishlist_ids=(), comparison_ids=()):
+    """
+    Отдает HTML карточек сетки товаров. Готовые фрагменты читаются из кэша одним
+    get_many, недостающие рендерятся и сохраняются одним set_many. Персональные
+    иконки (избранное, сравнение) подставляются в фрагмент при каждой выдаче.
+    """
+    products = list(products)
+    keys = {product.pk: card_cache_key(product) for product in products}
+    fragments = cache.get_many(keys.values())
+
+    missing = {}
+    for product in products:
+        key = keys[product.pk]
+        if key not in fragments:
+            fragments[key] = missing[key] = _render_card(product)
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+
+    wishlist_ids, comparison_ids = set(wishlist_ids), set(comparison_ids)
+    cards = []
+    for product in products:
+        wishlist_icon = 'fas fa-heart text-sale-pink' if product.pk in wishlist_ids else 'far fa-heart'
+        comparison_icon = 'text-lavender-dark' if product.pk in comparison_ids else ''
+        cards.append(
+            fragments[keys[product.pk]]
+            .replace(WISHLIST_SLOT, wishlist_icon)
+            .replace(COMPARISON_SLOT, comparison_icon)
+        )
+    return mark_safe(''.join(cards))
@@ -0,0 +1,109 @@
+from decimal import Decimal, InvalidOperation
+from django.db.models import Exists, OuterRef
+from slugify import slugify
+from .models import Product, ProductCharacteristic
+
+# Префикс GET-параметров фильтра по характеристикам: ?ch_material_obivki=Велюр&ch_shirina_sm_min=200
+PARAM_PREFIX = 'ch_'
+NUMBER_QUANT = Decimal('0.01')
+
+
+def to_number(value):
+    """Число из значения характеристики ("205.3", 250, "1,5") или None для текста."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip().replace(',', '.'))
+        except ValueError:
+            return None
+    return None
+
+
+def flatten_characteristics(characteristics):
+    """Характеристики хранятся группами {"Группа": {"Параметр": значение}}; допускается и плоский словарь."""
+    for name, value in (characteristics or {}).items():
+        if isinstance(value, dict):
+            for inner_name, inner_value in value.items():
+                yield name, inner_name, inner_value
+        else:
+            yield '', name, value
+
+
+def characteristic_key(name):
+    """Имя GET-параметра для характеристики: транслитерация названия."""
+    return PARAM_PREFIX + slugify(name, separator='_')
+
+
+def to_decimal(value):
+    number = to_number(value)
+    if number is None:
+        return None
+    try:
+        number = Decimal(str(number)).quantize(NUMBER_QUANT)
+    except InvalidOperation:
+        return None
+    # Значение должно поместиться в DecimalField(max_digits=12)
+    return number if abs(number) < Decimal('1e10') else None
+
+
+def _characteristic_rows(product_id, characteristics):
+    rows = {}
+    for group, name, value in flatten_characteristics(characteristics):
+        if value is None or value == '' or isinstance(value, (dict, list)):
+            continue
+        # Одинаковый параметр в разных группах для фильтра один и тот же
+        rows.setdefault(name[:100], ProductCharacteristic(
+            product_id=product_id, group=group[:100], name=name[:100],
+            value=str(value)[:255], number=to_decimal(value),
+        ))
+    return list(rows.values())
+
+
+def sync_product_characteristics(product):
+    """Перезаписывает типизированные характеристики одного товара из его JSON."""
+    ProductCharacteristic.objects.filter(product_id=product.pk).delete()
+    ProductCharacteristic.objects.bulk_create(_characteristic_rows(product.pk, product.characteristics))
+
+
+def rebuild_product_characteristics(product_ids=None, batch_size=500):
+    """
+    Массово пересобирает таблицу характеристик из Product.characteristics
+    (после loaddata, миграции или правки данных в обход сигналов).
+    Возвращает количество обработанных товаров.
+    """
+    products = Product.objects.all()
+    existing = ProductCharacteristic.objects.all()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        products = products.filter(id__in=product_ids)
+        existing = existing.filter(product_id__in=product_ids)
+
+    existing.delete()
+    rows, count = [], 0
+    for product_id, characteristics in products.values_list('id', 'characteristics').iterator(chunk_size=batch_size):
+        rows.extend(_characteristic_rows(product_id, characteristics))
+        count += 1
+        if len(rows) >= batch_size:
+            ProductCharacteristic.objects.bulk_create(rows, batch_size=batch_size)
+            rows = []
+    ProductCharacteristic.objects.bulk_create(rows, batch_size=batch_size)
+    return count
+
+
+def filter_by_characteristic(queryset, name, values=None, min_value=None, max_value=None):
+    """
+    Товары, у которых характеристика name равна одному из values и/или
+    числовое значение лежит в [min_value, max_value]. Подзапрос EXISTS идет
+    по индексам (name, value) и (name, number) и не размножает строки товаров.
+    """
+    matches = ProductCharacteristic.objects.filter(product=OuterRef('pk'), name=name)
+    if values:
+        matches = matches.filter(value__in=values)
+    if min_value is not None:
+        matches = matches.filter(number__gte=min_value)
+    if max_value is not None:
+        matches = matches.filter(number__lte=max_value)
+    return queryset.filter(Exists(matches))
@@ -1,43 +1,23 @@
 from functools import wraps
-from django.conf import settings
-from .models import Product
+from .recently_viewed import remember_viewed_product, resolve_product_id
 
-MAX_RECENTLY_VIEWED = 5
 
 def track_viewed_product(view_func):
     """
     Декоратор для отслеживания просмотренных товаров.
-    Сохраняет ID товара в сессии пользователя.
+    Сохраняет id товара в подписанной cookie (store.recently_viewed), а не в сессии.
+    Товар берется у представления (request.viewed_product_id), которое и так
+    загружает его; для страницы из полностраничного кэша id ищется по слагу в кэше.
     """
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        product_slug = kwargs.get('product_slug')
-        if product_slug:
-            try:
-                product_id = Product.objects.values_list('id', flat=True).get(slug=product_slug, available=True)
-                
-                # Получаем текущий список из сессии
-                recently_viewed_ids = request.session.get(settings.RECENTLY_VIEWED_SESSION_ID, [])
-                
-                # Если товар уже есть в списке, удаляем его, чтобы переместить наверх
-                if product_id in recently_viewed_ids:
-                    recently_viewed_ids.remove(product_id)
-                
-                # Добавляем товар в начало списка
-                recently_viewed_ids.insert(0, product_id)
-                
-                # Ограничиваем список до MAX_RECENTLY_VIEWED товаров
-                if len(recently_viewed_ids) > MAX_RECENTLY_VIEWED:
-                    recently_viewed_ids = recently_viewed_ids[:MAX_RECENTLY_VIEWED]
-                
-                # Сохраняем обновленный список в сессию
-                request.session[settings.RECENTLY_VIEWED_SESSION_ID] = recently_viewed_ids
-            
-            except Product.DoesNotExist:
-                # Если товар не найден, ничего не делаем
-                pass
-        
-        # Вызываем оригинальную view-функцию
-        return view_func(request, *args, **kwargs)
-        
-    return wrapper
\ No newline at end of file
+        response = view_func(request, *args, **kwargs)
+        if request.method == 'GET' and response.status_code == 200:
+            product_id = getattr(request, 'viewed_product_id', None)
+            if product_id is None and kwargs.get('product_slug'):
+                product_id = resolve_product_id(kwargs['product_slug'])
+            if product_id:
+                remember_viewed_product(request, response, product_id)
+        return response
+
+    return wrapper
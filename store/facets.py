@@ -0,0 +1,170 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+from django.db.models import Count, Max, Min, Q
+from .models import Category, Product, ProductCharacteristic
+from .characteristics import characteristic_key
+from .cache_namespaces import NamespacedCache, category_namespace
+
+FACETS_CACHE_TIMEOUT = 60 * 60 * 24
+PRICE_BUCKETS = 10
+ALL_CATEGORIES = 'all'
+# Текстовая характеристика с большим числом значений (описания, артикулы) фильтром не показывается
+MAX_CHARACTERISTIC_CHOICES = 30
+
+
+def facets_cache_key(category_id):
+    return f'facets_{category_id}'
+
+
+def facets_cache(category_slug=None):
+    """Фасеты категории лежат в ее пространстве имен, фасеты всего каталога — в 'catalog'."""
+    return NamespacedCache(category_namespace(category_slug) if category_slug else 'catalog')
+
+
+def category_namespaces(category_ids):
+    """Пространства имен категорий по их id — для сброса фасетов только затронутых категорий."""
+    category_ids = {category_id for category_id in category_ids if category_id is not None}
+    if not category_ids:
+        return []
+    slugs = Category.objects.filter(pk__in=category_ids).values_list('slug', flat=True)
+    return [category_namespace(slug) for slug in slugs]
+
+
+def _build_facets(rows):
+    """
+    Собирает фасеты из пар (бренд, цена): бренды с количеством товаров,
+    границы цены и гистограмму цен из PRICE_BUCKETS равных интервалов.
+    """
+    brands = Counter(brand for brand, _ in rows if brand)
+    prices = [price for _, price in rows]
+    facets = {
+        'total': len(rows),
+        'brands': [{'name': name, 'count': brands[name]} for name in sorted(brands)],
+        'min_price': min(prices) if prices else None,
+        'max_price': max(prices) if prices else None,
+        'price_buckets': [],
+    }
+    if not prices:
+        return facets
+
+    low, high = facets['min_price'], facets['max_price']
+    width = (high - low) / PRICE_BUCKETS or Decimal(1)
+    counts = [0] * PRICE_BUCKETS
+    for price in prices:
+        counts[min(int((price - low) / width), PRICE_BUCKETS - 1)] += 1
+    peak = max(counts)
+    facets['price_buckets'] = [
+        {
+            'from': (low + width * i).quantize(Decimal('1')),
+            'to': (low + width * (i + 1)).quantize(Decimal('1')),
+            'count': count,
+            'percent': round(count * 100 / peak),
+        }
+        for i, count in enumerate(counts)
+    ]
+    return facets
+
+
+def _build_characteristic_facets(stats, values):
+    """
+    Фасеты характеристик: параметр, у которого все значения числовые, становится
+    диапазоном (min/max), остальные — списком значений с количеством товаров.
+    Параметры с единственным значением ничего не отфильтровывают и пропускаются.
+    """
+    facets = []
+    for name in sorted(stats):
+        row = stats[name]
+        facet = {'name': name, 'key': characteristic_key(name), 'count': row['count']}
+        if row['numeric'] == row['count']:
+            if row['min'] < row['max']:
+                facets.append({**facet, 'kind': 'range', 'min': row['min'], 'max': row['max']})
+            continue
+        counts = values.get(name, {})
+        if 1 < len(counts) <= MAX_CHARACTERISTIC_CHOICES:
+            facets.append({**facet, 'kind': 'choice', 'values': [
+                {'value': value, 'count': counts[value]} for value in sorted(counts)
+            ]})
+    return facets
+
+
+def _characteristic_stats(products):
+    """
+    Два агрегирующих запроса по таблице характеристик: сводка по параметру
+    (количество, числовых значений, min/max) и количество товаров на значение
+    для текстовых параметров. Результат разложен по категориям и каталогу целиком.
+    """
+    characteristics = ProductCharacteristic.objects.filter(product__in=products)
+    stats = defaultdict(dict)
+    mixed = set()
+    rows = characteristics.values('product__category_id', 'name').order_by().annotate(
+        count=Count('id'), numeric=Count('number'), min=Min('number'), max=Max('number'),
+    )
+    for row in rows:
+        for scope in (row['product__category_id'], ALL_CATEGORIES):
+            current = stats[scope].get(row['name'])
+            if current is None:
+                stats[scope][row['name']] = {key: row[key] for key in ('count', 'numeric', 'min', 'max')}
+                continue
+            current['count'] += row['count']
+            current['numeric'] += row['numeric']
+            if row['min'] is not None:
+                current['min'] = row['min'] if current['min'] is None else min(current['min'], row['min'])
+                current['max'] = row['max'] if current['max'] is None else max(current['max'], row['max'])
+        if 0 < row['numeric'] < row['count']:
+            mixed.add(row['name'])
+
+    # Значения чисто числовых параметров не нужны — для них хватает границ диапазона
+    values = defaultdict(lambda: defaultdict(Counter))
+    rows = characteristics.filter(Q(number__isnull=True) | Q(name__in=mixed)) \
+                          .values_list('product__category_id', 'name', 'value').order_by().annotate(count=Count('id'))
+    for category_id, name, value, count in rows:
+        for scope in (category_id, ALL_CATEGORIES):
+            values[scope][name][value] += count
+    return stats, values
+
+
+def build_facet_index(category_ids=None):
+    """
+    Пересчитывает фасеты для указанных категорий (или для всего каталога)
+    одним запросом по доступным товарам и двумя по таблице характеристик
+    и сохраняет их в кэш пачкой.
+    Фасеты всего каталога хранятся под ключом категории ALL_CATEGORIES.
+    """
+    wanted = None if category_ids is None else set(category_ids)
+    products = Product.objects.available()
+    if wanted is not None and ALL_CATEGORIES not in wanted:
+        products = products.filter(category_id__in=wanted)
+
+    by_category = defaultdict(list)
+    for category_id, brand, price in products.values_list('category_id', 'brand', 'final_price').order_by():
+        by_category[category_id].append((brand, price))
+
+    if wanted is None:
+        wanted = {*by_category, ALL_CATEGORIES}
+    index = {
+        category_id: _build_facets(by_category.get(category_id, []))
+        for category_id in wanted if category_id != ALL_CATEGORIES
+    }
+    if ALL_CATEGORIES in wanted:
+        index[ALL_CATEGORIES] = _build_facets([row for rows in by_category.values() for row in rows])
+
+    stats, values = _characteristic_stats(products)
+    for category_id, facets in index.items():
+        facets['characteristics'] = _build_characteristic_facets(stats.get(category_id, {}), values.get(category_id, {}))
+
+    slugs = dict(Category.objects.filter(pk__in=[cid for cid in index if cid != ALL_CATEGORIES]).values_list('id', 'slug'))
+    for category_id, facets in index.items():
+        if category_id == ALL_CATEGORIES:
+            facets_cache().set(facets_cache_key(category_id), facets, FACETS_CACHE_TIMEOUT)
+        elif category_id in slugs:
+            facets_cache(slugs[category_id]).set(facets_cache_key(category_id), facets, FACETS_CACHE_TIMEOUT)
+    return index
+
+
+def get_category_facets(category=None):
+    """Возвращает фасеты категории (или всего каталога) из кэша, достраивая их при промахе."""
+    category_id = category.id if category else ALL_CATEGORIES
+    facets = facets_cache(category.slug if category else None).get(facets_cache_key(category_id))
+    if facets is None:
+        facets = build_facet_index([category_id])[category_id]
+    return facets
@@ -1,6 +1,11 @@
 import django_filters
 from django import forms
+from django_filters.widgets import RangeWidget
 from .models import Product, Category
+from .facets import get_category_facets
+from .characteristics import filter_by_characteristic
+
+INPUT_CLASS = 'w-full border-gray-300 rounded-md shadow-sm focus:border-lavender-dark focus:ring-lavender-dark'
 
 class ProductFilter(django_filters.FilterSet):
     SORT_CHOICES = (
@@ -43,11 +48,38 @@ class ProductFilter(django_filters.FilterSet):
         model = Product
         fields = ['brand', 'min_price', 'max_price', 'ordering']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, category=None, **kwargs):
         super().__init__(*args, **kwargs)
-        brands = self.queryset.exclude(brand__isnull=True).exclude(brand__exact='') \
-                       .values_list('brand', 'brand').distinct().order_by('brand')
-        self.filters['brand'].extra['choices'] = brands
+        # Бренды, количество товаров и границы цен берутся из кэшированного индекса фасетов
+        self.facets = get_category_facets(category)
+        self.filters['brand'].extra['choices'] = [
+            (brand['name'], f"{brand['name']} ({brand['count']})") for brand in self.facets['brands']
+        ]
+        # Фильтры по характеристикам строятся из тех же фасетов: список значений или диапазон
+        for facet in self.facets.get('characteristics', []):
+            self.filters[facet['key']] = self._characteristic_filter(facet)
+
+    def _characteristic_filter(self, facet):
+        if facet['kind'] == 'range':
+            return django_filters.RangeFilter(
+                field_name=facet['name'], label=facet['name'], method=self.filter_by_characteristic,
+                widget=RangeWidget(attrs={'class': INPUT_CLASS, 'inputmode': 'decimal'}),
+            )
+        return django_filters.MultipleChoiceFilter(
+            field_name=facet['name'], label=facet['name'], method=self.filter_by_characteristic,
+            choices=[(item['value'], f"{item['value']} ({item['count']})") for item in facet['values']],
+            widget=forms.CheckboxSelectMultiple,
+        )
+
+    @property
+    def characteristic_fields(self):
+        """Пары (фасет, поле формы) для вывода фильтров характеристик в шаблоне."""
+        return [(facet, self.form[facet['key']]) for facet in self.facets.get('characteristics', [])]
+
+    def filter_by_characteristic(self, queryset, name, value):
+        if isinstance(value, slice):
+            return filter_by_characteristic(queryset, name, min_value=value.start, max_value=value.stop)
+        return filter_by_characteristic(queryset, name, values=value)
 
     def filter_by_order(self, queryset, name, value):
         return queryset.order_by(value)
\ No newline at end of file
@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.utils import timezone
+from .models import Product
+
+# Варианты карточки по форматам: спецификации imagekit от меньшей к большей
+CARD_SPECS = {
+    'avif': ('image_card_small_avif', 'image_card_large_avif'),
+    'webp': ('image_card_small', 'image_card_large'),
+}
+# Маленький вариант — на телефонах, большой — на широких экранах (как в исходной разметке карточки)
+CARD_SIZES = '(max-width: 640px) 400px, 800px'
+GENERATION_PENDING_KEY = 'product_images_pending_{}'
+
+
+def _generate(spec, force=False):
+    spec.generate(force=force)
+    return spec
+
+
+def _card_sources(product, force=False):
+    sources = {'sizes': CARD_SIZES}
+    for image_format, spec_names in CARD_SPECS.items():
+        files = [_generate(getattr(product, name), force) for name in spec_names]
+        sources[image_format] = ', '.join(f'{spec.url} {spec.width}w' for spec in files)
+    largest = getattr(product, CARD_SPECS['webp'][-1])
+    sources.update(src=largest.url, width=largest.width, height=largest.height)
+    return sources
+
+
+def build_image_manifest(product, force=False):
+    """
+    Генерирует все варианты изображений товара (карточка в AVIF и WEBP,
+    миниатюры основного изображения и галереи) и возвращает манифест
+    с готовыми URL. Исходные имена файлов сохраняются в манифесте, чтобы
+    после замены картинки шаблоны не взяли устаревшие варианты.
+    """
+    manifest = {'source': product.image.name if product.image else '', 'gallery': {}}
+    if product.image:
+        manifest['card'] = _card_sources(product, force)
+        manifest['thumbnail'] = _generate(product.image_thumbnail, force).url
+    for image in product.images.all():
+        manifest['gallery'][str(image.pk)] = {
+            'source': image.image.name,
+            'thumbnail': _generate(image.image_thumbnail, force).url,
+        }
+    return manifest
+
+
+def generate_product_images(product_id, force=False):
+    """
+    Строит манифест изображений товара и сохраняет его через update(),
+    не вызывая сигналы сохранения. Новое время обновления сбрасывает
+    закэшированные карточки. Возвращает False, если товар не найден
+    или картинку успели заменить во время генерации.
+    """
+    product = Product.objects.filter(pk=product_id).prefetch_related('images').first()
+    if product is None:
+        return False
+    manifest = build_image_manifest(product, force)
+    # Манифест пишется, только если основное изображение не сменилось за время генерации
+    return bool(Product.objects.filter(pk=product_id, image=product.image.name or '')
+                .update(image_manifest=manifest, updated=timezone.now()))
+
+
+def schedule_image_generation(*product_ids):
+    """
+    Ставит генерацию изображений товаров в очередь Celery. Повторные загрузки
+    картинок одного товара, пока задача еще не началась, новых задач не создают.
+    """
+    from .tasks import generate_product_images as generate_task
+
+    for product_id in {*product_ids}:
+        if product_id and cache.add(GENERATION_PENDING_KEY.format(product_id), 1, 60 * 5):
+            generate_task.delay(product_id)
@@ -0,0 +1,181 @@
+import logging
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from .page_cache import invalidate_page_tags
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей уровня ниже WARNING; предупреждения и ошибки проходят всегда."""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+logger.addFilter(SamplingFilter(settings.INVALIDATION_LOG_SAMPLE_RATE))
+
+
+def _new_pending():
+    return {'keys': set(), 'tags': set(), 'calls': defaultdict(set)}
+
+
+class InvalidationCollector:
+    """
+    Собирает инвалидации кэша из сигналов и применяет их один раз:
+    ключи удаляются одним delete_many, новые поколения тегов (страниц и
+    пространств имен store.cache_namespaces) пишутся одним set_many,
+    отложенные вызовы (пересчет индексов) выполняются по разу с объединенными
+    аргументами.
+
+    Собранное внутри транзакции копится отдельно для каждого уровня
+    вложенности (точки сохранения) и регистрируется в transaction.on_commit:
+    при откате Django отбрасывает колбэк вместе с собранным, и сбросы для
+    незакоммиченных строк не выполняются. После коммита собранное
+    применяется сразу или, внутри batch(), на выходе из внешнего блока.
+    Запрос и задача Celery оборачиваются в batch() автоматически
+    (store.middleware и сигналы Celery ниже). suspended() отбрасывает собранное —
+    для массовых загрузок, которые в конце очищают кэш целиком.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def _state(self):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            state = self._local.state = {
+                **_new_pending(), 'depth': 0, 'suspended': 0, 'transactions': {},
+            }
+        return state
+
+    def delete(self, *keys):
+        self._collect('keys', keys)
+
+    def touch_tags(self, *tags):
+        self._collect('tags', tags)
+
+    def call(self, func, *args):
+        """Отложенный вызов func; аргументы повторных вызовов объединяются в один вызов."""
+        pending = self._pending()
+        if pending is not None:
+            pending['calls'][func].update(args)
+            self._schedule()
+
+    def _collect(self, kind, values):
+        pending = self._pending()
+        if pending is not None:
+            pending[kind].update(values)
+            self._schedule()
+
+    def _pending(self):
+        """Куда собирать: в накопитель текущей транзакции или общий; None внутри suspended()."""
+        state = self._state
+        if state['suspended']:
+            return None
+        if not connection.in_atomic_block:
+            return state
+        transactions = state['transactions']
+        level = tuple(connection.savepoint_ids)
+        entry = transactions.get(level)
+        if entry is None or not self._is_registered(entry):
+            # Откаченные уровни больше не нужны: их колбэки Django уже отбросил
+            for stale in [key for key, value in transactions.items() if not self._is_registered(value)]:
+                del transactions[stale]
+            pending = _new_pending()
+
+            def callback():
+                self._commit(pending)
+
+            transaction.on_commit(callback, robust=True)
+            entry = transactions[level] = (pending, callback)
+        return entry[0]
+
+    @staticmethod
+    def _is_registered(entry):
+        pending, callback = entry
+        return not pending.get('done') and any(func is callback for _, func, _ in connection.run_on_commit)
+
+    def _commit(self, pending):
+        pending['done'] = True
+        state = self._state
+        if state['depth']:
+            for kind in ('keys', 'tags'):
+                state[kind].update(pending[kind])
+            for func, args in pending['calls'].items():
+                state['calls'][func].update(args)
+        else:
+            self._apply(pending)
+
+    def _schedule(self):
+        state = self._state
+        if not state['depth'] and not connection.in_atomic_block:
+            self.flush()
+
+    def begin(self):
+        self._state['depth'] += 1
+
+    def end(self):
+        state = self._state
+        state['depth'] = max(state['depth'] - 1, 0)
+        if not state['depth'] and (state['keys'] or state['tags'] or state['calls']):
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.end()
+
+    @contextmanager
+    def suspended(self):
+        state = self._state
+        state['suspended'] += 1
+        try:
+            yield self
+        finally:
+            state['suspended'] -= 1
+
+    def flush(self):
+        """Применяет собранное вне транзакций; собранное в незакоммиченной транзакции ждет коммита."""
+        state = self._state
+        pending = {'keys': state['keys'], 'tags': state['tags'], 'calls': state['calls']}
+        state.update(_new_pending())
+        self._apply(pending)
+
+    @staticmethod
+    def _apply(pending):
+        keys, tags, calls = pending['keys'], pending['tags'], pending['calls']
+        if keys:
+            cache.delete_many(list(keys))
+        if tags:
+            invalidate_page_tags(*tags)
+        for func, args in calls.items():
+            func(*args)
+        if keys or tags or calls:
+            logger.info('Сброс кэша: ключей %d, тегов %d, вызовов %d (%s)',
+                        len(keys), len(tags), len(calls), ', '.join(sorted(keys | tags)))
+
+
+invalidation = InvalidationCollector()
+
+
+@task_prerun.connect
+def _begin_task_batch(**kwargs):
+    invalidation.begin()
+
+
+@task_postrun.connect
+def _end_task_batch(**kwargs):
+    invalidation.end()
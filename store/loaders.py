@@ -0,0 +1,15 @@
+from .models import Product
+
+
+def load_products(ids, limit=None):
+    """
+    Доступные товары по списку id одним запросом, в порядке списка.
+    Общий путь для витрин из готовых списков id: хиты продаж, похожие
+    и недавно просмотренные товары. Пропавшие из каталога id пропускаются.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    products = Product.objects.available().select_related('category').in_bulk(ids)
+    ordered = [products[pid] for pid in ids if pid in products]
+    return ordered[:limit] if limit is not None else ordered
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache_invalidation'
+LOCAL_CACHE_SIZE = 256
+# Верхняя граница задержки сброса, если сообщение pub/sub потерялось
+LOCAL_CACHE_TIMEOUT = 30
+RECONNECT_DELAY = 5
+
+
+class LocalCache:
+    """
+    Ограниченный LRU-кэш процесса с TTL перед Redis. Ключ — пара
+    (пространства имен, ключ), чтобы сброс пространства удалял все его записи.
+
+    Каждый сброс увеличивает счетчик epoch. Значение, посчитанное по данным,
+    прочитанным до сброса, записывается с epoch на момент чтения и
+    отбрасывается, если сброс успел прийти раньше записи.
+    """
+    def __init__(self, maxsize=LOCAL_CACHE_SIZE, timeout=LOCAL_CACHE_TIMEOUT):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, epoch=None):
+        """Сохраняет значение; с epoch — только если с тех пор не было сбросов."""
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_namespaces(self, namespaces=None):
+        """Удаляет записи указанных пространств имен; None — все записи."""
+        with self._lock:
+            self._epoch += 1
+            if namespaces is None:
+                self._data.clear()
+                return
+            namespaces = set(namespaces)
+            for key in [key for key in self._data if namespaces.intersection(key[0])]:
+                del self._data[key]
+
+
+local_cache = LocalCache()
+
+
+def publish_invalidation(namespaces):
+    """Сообщает остальным процессам и серверам о сбросе пространств имен."""
+    try:
+        get_redis_connection('default').publish(INVALIDATION_CHANNEL, json.dumps(sorted(namespaces)))
+    except NotImplementedError:
+        # Кэш не в Redis: локальные записи устаревают по TTL
+        pass
+    except Exception:
+        logger.warning('Не удалось опубликовать сброс кэша %s', namespaces, exc_info=True)
+
+
+class InvalidationSubscriber:
+    """
+    Фоновый поток процесса, который слушает канал сброса и очищает локальный
+    кэш. Запускается лениво при первом обращении, в том числе заново после
+    fork воркера gunicorn. После переподключения локальный кэш очищается
+    целиком: пропущенные за это время сообщения не восстановить.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def handle(self, message):
+        self.cache.discard_namespaces(json.loads(message['data']))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                self.cache.discard_namespaces()
+                for message in pubsub.listen():
+                    self.handle(message)
+            except NotImplementedError:
+                return
+            except Exception:
+                logger.warning('Подписка на сброс кэша прервана, переподключение', exc_info=True)
+                time.sleep(RECONNECT_DELAY)
+
+
+subscriber = InvalidationSubscriber(local_cache)
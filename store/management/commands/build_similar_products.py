@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store.similarity import build_similar_index
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the top-k similar products for every available product.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category-id', type=int, nargs='+', dest='category_ids',
+                            help='Пересчитать только указанные категории.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пакета для bulk_update.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("--> Построение индекса похожих товаров...")
+        updated = build_similar_index(options['category_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Похожие товары рассчитаны для {updated} товаров."))
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from store.models import Product
+from store.images import generate_product_images
+
+
+def _init_worker():
+    # При запуске процессов через spawn/forkserver Django в дочернем процессе еще не настроен
+    django.setup()
+
+
+def _generate(args):
+    product_id, force = args
+    return generate_product_images(product_id, force=force)
+
+
+class Command(BaseCommand):
+    help = 'Generates responsive image variants (AVIF, WEBP, thumbnails) and srcset manifests for products.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-id', type=int, nargs='+', dest='product_ids',
+                            help='Обработать только указанные товары.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Количество процессов для кодирования изображений.')
+        parser.add_argument('--missing', action='store_true',
+                            help='Только товары без манифеста.')
+        parser.add_argument('--force', action='store_true',
+                            help='Перегенерировать уже существующие файлы.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(id__in=options['product_ids'])
+        if options['missing']:
+            products = products.filter(image_manifest={})
+        product_ids = list(products.order_by('id').values_list('id', flat=True))
+        self.stdout.write(f"--> Генерация изображений для {len(product_ids)} товаров...")
+
+        tasks = [(product_id, options['force']) for product_id in product_ids]
+        if options['workers'] <= 1:
+            results = list(map(_generate, tasks))
+        else:
+            # Открытые соединения с БД не должны наследоваться дочерними процессами
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+                results = list(executor.map(_generate, tasks, chunksize=8))
+
+        self.stdout.write(self.style.SUCCESS(f"Манифесты изображений сохранены для {sum(results)} товаров."))
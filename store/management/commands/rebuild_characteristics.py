@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from store.characteristics import rebuild_product_characteristics
+from store.facets import build_facet_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the typed product characteristics table used by catalog facets and filters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-id', type=int, nargs='+', dest='product_ids',
+                            help='Пересобрать только указанные товары.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пакета для bulk_create.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("--> Пересборка характеристик товаров...")
+        updated = rebuild_product_characteristics(options['product_ids'], batch_size=options['batch_size'])
+        build_facet_index()
+        self.stdout.write(self.style.SUCCESS(f"Характеристики пересобраны для {updated} товаров."))
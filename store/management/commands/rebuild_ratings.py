@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store.services import rebuild_product_ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds stored review statistics (rating_avg, rating_count, rating_histogram) for products.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-id', type=int, nargs='+', dest='product_ids',
+                            help='Пересчитать только указанные товары.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пакета для bulk_update.')
+
+    def handle(self, *args, **options):
+        self.stdout.write("--> Пересчет статистики отзывов...")
+        updated = rebuild_product_ratings(options['product_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Статистика отзывов пересчитана для {updated} товаров."))
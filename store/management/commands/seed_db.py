@@ -12,6 +12,10 @@ from django.core.cache import cache
 from django.contrib.auth.models import User
 
 from store.models import Category, Product, ProductImage, Review
+from store.services import rebuild_product_ratings
+from store.similarity import build_similar_index
+from store.characteristics import rebuild_product_characteristics
+from store.invalidation import invalidation
 from blog.models import Article, Comment, Tag
 from store.factories import UserFactory
 from blog.factories import ArticleFactory, CommentFactory, TagFactory
@@ -149,13 +153,15 @@ class Command(BaseCommand):
         
         DUMP_PATH = settings.BASE_DIR / 'seed_data' / 'dump'
         MEDIA_ARCHIVE = DUMP_PATH / 'media_dump.tar.gz'
-        
-        if os.path.exists(MEDIA_ARCHIVE):
-            self.stdout.write(self.style.NOTICE("--> Обнаружен 'снимок' сайта. Загрузка из него..."))
-            self.load_from_dump(DUMP_PATH, MEDIA_ARCHIVE)
-        else:
-            self.stdout.write(self.style.NOTICE("--> 'Снимок' сайта не найден. Запуск процедурной генерации..."))
-            self.run_procedural_seeding()
+
+        # Кэш в конце очищается целиком, поэтому сигналы ничего не сбрасывают по отдельности
+        with invalidation.suspended():
+            if os.path.exists(MEDIA_ARCHIVE):
+                self.stdout.write(self.style.NOTICE("--> Обнаружен 'снимок' сайта. Загрузка из него..."))
+                self.load_from_dump(DUMP_PATH, MEDIA_ARCHIVE)
+            else:
+                self.stdout.write(self.style.NOTICE("--> 'Снимок' сайта не найден. Запуск процедурной генерации..."))
+                self.run_procedural_seeding()
             
         self.stdout.write(self.style.SUCCESS("= БАЗА ДАННЫХ УСПЕШНО НАПОЛНЕНА! ="))
 
@@ -193,7 +199,12 @@ class Command(BaseCommand):
             else:
                  self.stdout.write(self.style.WARNING(f"      - Файл фикстуры {fixture_file} не найден, пропуск."))
 
-        self.stdout.write("    - Шаг 4: Очистка кэша...")
+        self.stdout.write("    - Шаг 4: Пересчет статистики отзывов, характеристик и похожих товаров...")
+        rebuild_product_ratings()
+        rebuild_product_characteristics()
+        build_similar_index()
+
+        self.stdout.write("    - Шаг 5: Очистка кэша...")
         cache.clear()
         self.stdout.write(self.style.SUCCESS("--> Загрузка из 'снимка' завершена."))
 
@@ -298,6 +309,7 @@ class Command(BaseCommand):
                     is_active=True
                 )
 
+        build_similar_index()
         self.stdout.write(self.style.SUCCESS("    - Шаг 2 завершен: Новые данные успешно созданы."))
         self.stdout.write("    - Шаг 3: Очистка кэша...")
         cache.clear()
@@ -0,0 +1,14 @@
+from .invalidation import invalidation
+
+
+class InvalidationBatchMiddleware:
+    """
+    Собирает инвалидации кэша за весь запрос и применяет их один раз в конце
+    (store.invalidation), а не на каждый сигнал сохранения.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with invalidation.batch():
+            return self.get_response(request)
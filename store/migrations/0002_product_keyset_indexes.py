@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created', 'id'], name='store_produ_created_0fb440_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['final_price', 'id'], name='store_produ_final_p_b0c985_idx'),
+        ),
+    ]
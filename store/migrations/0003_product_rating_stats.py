@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import store.models
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q
+
+
+def fill_rating_stats(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    active = Q(is_active=True)
+    rows = Review.objects.values('product_id').order_by().annotate(
+        avg=Avg('rating', filter=active),
+        count=Count('id', filter=active),
+        **{f'r{value}': Count('id', filter=active & Q(rating=value)) for value in range(1, 6)},
+    )
+    for row in rows:
+        Product.objects.filter(pk=row['product_id']).update(
+            rating_avg=Decimal(row['avg'] or 0).quantize(Decimal('0.01')),
+            rating_count=row['count'],
+            rating_histogram=[row[f'r{value}'] for value in range(1, 6)],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(default=store.models.default_rating_histogram, editable=False, verbose_name='Распределение оценок'),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
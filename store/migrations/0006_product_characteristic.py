@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from decimal import Decimal, InvalidOperation
+from django.db import migrations, models
+
+
+# Копии store.characteristics на момент миграции: изменения модуля не должны менять ее результат
+def flatten_characteristics(characteristics):
+    for name, value in (characteristics or {}).items():
+        if isinstance(value, dict):
+            for inner_name, inner_value in value.items():
+                yield name, inner_name, inner_value
+        else:
+            yield '', name, value
+
+
+def to_decimal(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(value.strip().replace(',', '.'))
+        except ValueError:
+            return None
+    else:
+        return None
+    try:
+        number = Decimal(str(number)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    return number if abs(number) < Decimal('1e10') else None
+
+
+def fill_characteristics(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductCharacteristic = apps.get_model('store', 'ProductCharacteristic')
+    rows = []
+    for product_id, characteristics in Product.objects.values_list('id', 'characteristics').iterator(chunk_size=500):
+        seen = set()
+        for group, name, value in flatten_characteristics(characteristics):
+            if value is None or value == '' or isinstance(value, (dict, list)) or name[:100] in seen:
+                continue
+            seen.add(name[:100])
+            rows.append(ProductCharacteristic(
+                product_id=product_id, group=group[:100], name=name[:100],
+                value=str(value)[:255], number=to_decimal(value),
+            ))
+    ProductCharacteristic.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_similar_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCharacteristic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(blank=True, max_length=100, verbose_name='Группа')),
+                ('name', models.CharField(max_length=100, verbose_name='Параметр')),
+                ('value', models.CharField(max_length=255, verbose_name='Значение')),
+                ('number', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Число')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='characteristic_values', to='store.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Характеристика товара',
+                'verbose_name_plural': 'Характеристики товаров',
+                'indexes': [models.Index(fields=['name', 'value', 'product'], name='store_produ_name_75c279_idx'), models.Index(fields=['name', 'number', 'product'], name='store_produ_name_1599a1_idx')],
+            },
+        ),
+        migrations.RunPython(fill_characteristics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_product_characteristic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_manifest',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Манифест изображений'),
+        ),
+    ]
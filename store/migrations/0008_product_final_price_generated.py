@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    final_price становится генерируемой колонкой. Изменить обычную колонку
+    на GeneratedField нельзя, поэтому она пересоздается вместе с индексом
+    курсорной пагинации; значения вычисляет сама БД.
+    """
+
+    dependencies = [
+        ('store', '0007_product_image_manifest'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='store_produ_final_p_b0c985_idx',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='final_price',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.GeneratedField(db_persist=True, expression=models.F('base_price') * (100 - models.F('discount')) / 100, output_field=models.DecimalField(decimal_places=2, max_digits=10), verbose_name='Итоговая цена'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['final_price', 'id'], name='store_produ_final_p_b0c985_idx'),
+        ),
+    ]
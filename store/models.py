@@ -1,17 +1,38 @@
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models.functions import Cast
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
 from django.urls import reverse
 from django.contrib.auth.models import User
-from django.db.models import Avg
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from imagekit.models import ImageSpecField, ProcessedImageField
 from imagekit.processors import ResizeToFill, ResizeToFit
 
+# Конфигурация полнотекстового поиска PostgreSQL для каталога
+SEARCH_CONFIG = 'russian'
+# Точность rank: real хранит около 6 значащих цифр, больше знаков не дают
+SEARCH_RANK_FIELD = models.DecimalField(max_digits=12, decimal_places=6)
+
+
 class ProductQuerySet(models.QuerySet):
     def available(self):
         return self.filter(available=True, stock__gt=0)
 
+    def search(self, query):
+        """
+        Полнотекстовый поиск по search_vector (GIN-индекс).
+        Добавляет аннотацию rank для сортировки по релевантности.
+        ts_rank возвращает real, а курсор пагинации хранит значение в JSON:
+        rank приводится к numeric, чтобы сравнение со значением из курсора
+        было точным и товары с равной релевантностью не терялись между страницами.
+        """
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        rank = Cast(SearchRank(models.F('search_vector'), search_query), SEARCH_RANK_FIELD)
+        return self.filter(search_vector=search_query).annotate(rank=rank)
+
     def on_sale(self):
         return self.available().filter(discount__gt=0)
     
@@ -31,6 +52,19 @@ class ProductManager(models.Manager):
     def new_arrivals(self, days=30):
         return self.get_queryset().new_arrivals(days)
 
+    def search(self, query):
+        return self.get_queryset().search(query)
+
+
+def calculate_final_price(base_price, discount):
+    """Цена со скидкой с тем же округлением, что и у генерируемой колонки final_price."""
+    return (Decimal(base_price) * (100 - discount) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def default_rating_histogram():
+    """Количество активных отзывов с оценками 1..5 (индекс 0 соответствует оценке 1)."""
+    return [0, 0, 0, 0, 0]
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, db_index=True, verbose_name="Название категории")
@@ -65,6 +99,20 @@ class Product(models.Model):
                                       processors=[ResizeToFit(400, 400)],
                                       format='WEBP',
                                       options={'quality': 75})
+    image_card_large_avif = ImageSpecField(source='image',
+                                           processors=[ResizeToFit(800, 800)],
+                                           format='AVIF',
+                                           options={'quality': 60})
+    image_card_small_avif = ImageSpecField(source='image',
+                                           processors=[ResizeToFit(400, 400)],
+                                           format='AVIF',
+                                           options={'quality': 55})
+    image_thumbnail = ImageSpecField(source='image',
+                                     processors=[ResizeToFill(100, 100)],
+                                     format='JPEG',
+                                     options={'quality': 80})
+    # Готовые srcset и URL миниатюр, сгенерированных в фоне (см. store.images)
+    image_manifest = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Манифест изображений")
 
     brand = models.CharField(max_length=100, blank=True, verbose_name="Бренд")
     collection = models.CharField(max_length=100, blank=True, verbose_name="Коллекция")
@@ -87,7 +135,13 @@ class Product(models.Model):
         help_text="Укажите скидку в процентах от 0 до 99.",
         validators=[MinValueValidator(0), MaxValueValidator(99)]
     )
-    final_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Итоговая цена", editable=False)
+    # Вычисляется самой БД, поэтому queryset.update() цены или скидки не оставляет ее устаревшей
+    final_price = models.GeneratedField(
+        expression=models.F('base_price') * (100 - models.F('discount')) / 100,
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+        verbose_name="Итоговая цена",
+    )
     stock = models.PositiveIntegerField(verbose_name="Остаток на складе")
     available = models.BooleanField(default=True, verbose_name="Доступен")
 
@@ -97,19 +151,53 @@ class Product(models.Model):
     
     purchase_count = models.PositiveIntegerField(default=0, verbose_name="Количество покупок")
 
+    # Взвешенный поисковый вектор; вычисляется самой БД при каждой записи строки
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name', 'sku', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('brand', 'collection', weight='B', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='D', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    # Денормализованная статистика активных отзывов (см. store.services.update_product_rating)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False, verbose_name="Средний рейтинг")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    rating_histogram = models.JSONField(default=default_rating_histogram, editable=False, verbose_name="Распределение оценок")
+
+    # Предрассчитанные похожие товары по убыванию сходства (см. store.similarity)
+    similar_ids = ArrayField(models.PositiveIntegerField(), default=list, blank=True, editable=False, verbose_name="Похожие товары")
+
     objects = ProductManager()
     
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
-        indexes = [ models.Index(fields=['id', 'slug']), models.Index(fields=['name']), models.Index(fields=['-created']), ]
+        indexes = [
+            models.Index(fields=['id', 'slug']), models.Index(fields=['name']), models.Index(fields=['-created']),
+            # Индексы для курсорной пагинации каталога: (поле сортировки, id)
+            models.Index(fields=['created', 'id']), models.Index(fields=['final_price', 'id']),
+            GinIndex(fields=['search_vector'], name='store_product_search_gin'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходную категорию, чтобы при переносе товара сбросить фасеты обеих категорий
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        # Исходный слаг — чтобы при его смене сбросить закэшированную страницу по старому адресу
+        instance._loaded_slug = instance.__dict__.get('slug')
+        return instance
+
     def save(self, *args, **kwargs):
-        self.final_price = self.base_price * (1 - Decimal(self.discount) / 100)
+        # Колонку пишет БД; значение в объекте обновляем тем же расчетом, чтобы не перечитывать строку
+        self.final_price = calculate_final_price(self.base_price, self.discount)
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -126,6 +214,21 @@ class Product(models.Model):
         from django.templatetags.static import static
         return static('images/placeholder.png')
 
+    @property
+    def card_image_sources(self):
+        """srcset карточки (AVIF, WEBP) из манифеста, если он построен для текущего изображения."""
+        manifest = self.image_manifest or {}
+        if self.image and manifest.get('source') == self.image.name:
+            return manifest.get('card')
+        return None
+
+    @property
+    def image_thumbnail_url(self):
+        manifest = self.image_manifest or {}
+        if manifest.get('source') == self.image.name and manifest.get('thumbnail'):
+            return manifest['thumbnail']
+        return self.image_thumbnail.url
+
     @property
     def old_price(self):
         if self.discount > 0:
@@ -134,12 +237,11 @@ class Product(models.Model):
 
     @property
     def average_rating(self):
-        avg = self.reviews.filter(is_active=True).aggregate(Avg('rating'))['rating__avg']
-        return avg if avg is not None else 0
+        return self.rating_avg
 
     @property
     def review_count(self):
-        return self.reviews.filter(is_active=True).count()
+        return self.rating_count
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE, verbose_name="Товар")
@@ -159,6 +261,37 @@ class ProductImage(models.Model):
     def __str__(self):
         return f"Изображение для {self.product.name}"
 
+    @property
+    def thumbnail_url(self):
+        """Миниатюра из манифеста товара; пока он не построен — через imagekit."""
+        entry = (self.product.image_manifest or {}).get('gallery', {}).get(str(self.pk))
+        if entry and entry['source'] == self.image.name:
+            return entry['thumbnail']
+        return self.image_thumbnail.url
+
+class ProductCharacteristic(models.Model):
+    """
+    Характеристика товара в типизированном виде — копия Product.characteristics
+    для фасетов и фильтрации без разбора JSON. Заполняется из store.characteristics.
+    """
+    product = models.ForeignKey(Product, related_name='characteristic_values', on_delete=models.CASCADE, verbose_name="Товар")
+    group = models.CharField(max_length=100, blank=True, verbose_name="Группа")
+    name = models.CharField(max_length=100, verbose_name="Параметр")
+    value = models.CharField(max_length=255, verbose_name="Значение")
+    # Числовое значение для фильтра по диапазону (размеры, нагрузка); пусто для текстовых
+    number = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name="Число")
+
+    class Meta:
+        verbose_name = "Характеристика товара"
+        verbose_name_plural = "Характеристики товаров"
+        indexes = [
+            models.Index(fields=['name', 'value', 'product']),
+            models.Index(fields=['name', 'number', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews', verbose_name="Товар")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews', verbose_name="Автор", null=True, blank=True)
@@ -174,6 +307,13 @@ class Review(models.Model):
         verbose_name_plural = 'Отзывы'
     def __str__(self): return f'Отзыв от {self.author_name} на {self.product.name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный товар, чтобы при переносе отзыва пересчитать оба товара
+        instance._loaded_product_id = instance.__dict__.get('product_id')
+        return instance
+
 class Feature(models.Model):
     title = models.CharField(max_length=100, verbose_name="Заголовок")
     description = models.TextField(verbose_name="Описание")
@@ -244,4 +384,38 @@ class SpecialOffer(models.Model):
         verbose_name_plural = "Специальные предложения (баннеры)"
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class OutboxMessage(models.Model):
+    """
+    Побочный эффект (письмо и т.п.), записанный в той же транзакции, что и
+    породившие его данные: откат заказа откатывает и письмо, а воркер не увидит
+    сообщение раньше коммита. Выполняет store.outbox.process_outbox.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает отправки'
+        SENT = 'sent', 'Отправлено'
+        FAILED = 'failed', 'Ошибка'
+
+    topic = models.CharField(max_length=50, verbose_name="Тип")
+    payload = models.JSONField(verbose_name="Данные")
+    # Повторная постановка с тем же ключом игнорируется
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True, verbose_name="Ключ идемпотентности")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Не раньше")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Обработано")
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Исходящее сообщение"
+        verbose_name_plural = "Исходящие сообщения"
+        indexes = [
+            # Очередь — только неотправленные сообщения, отправленные индекс не раздувают
+            models.Index(fields=['available_at', 'id'], condition=models.Q(status='pending'), name='store_outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.topic} #{self.id} ({self.get_status_display()})'
@@ -0,0 +1,150 @@
+import logging
+from contextlib import suppress
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.utils import DNS_NAME
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TOPIC = 'email'
+OUTBOX_BATCH_SIZE = 100
+# Сколько пачек обрабатывает один запуск задачи, остальное заберет следующий
+OUTBOX_MAX_BATCHES = 10
+OUTBOX_MAX_ATTEMPTS = 8
+# Пауза перед повтором удваивается с каждой неудачной попыткой
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_RETRY_MAX_DELAY = 60 * 60
+# На это время взятая воркером пачка скрыта от остальных; после падения воркера она вернется в очередь
+OUTBOX_LEASE = 60 * 10
+
+def enqueue(topic, payload, key=None):
+    """
+    Записывает сообщение в outbox в текущей транзакции. Сообщение с уже
+    существующим ключом key не добавляется. После коммита будит воркер; если
+    брокер недоступен, сообщение заберет периодическая задача drain_outbox.
+    """
+    OutboxMessage.objects.bulk_create([OutboxMessage(topic=topic, payload=payload, key=key)], ignore_conflicts=True)
+    transaction.on_commit(_wake_worker, robust=True)
+
+
+def enqueue_email(subject, body, to, reply_to=None, from_email=None, key=None):
+    enqueue(EMAIL_TOPIC, {
+        'subject': subject,
+        'body': body,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'to': list(to),
+        'reply_to': list(reply_to or []),
+    }, key=key)
+
+
+def _wake_worker():
+    from .tasks import drain_outbox
+
+    drain_outbox.delay()
+
+
+class _Mailer:
+    """SMTP-соединение, открываемое при первом письме и общее для всех пачек запуска."""
+    def __init__(self):
+        self.connection = None
+
+    def send(self, message):
+        payload = message.payload
+        try:
+            if self.connection is None:
+                self.connection = get_connection()
+                self.connection.open()
+            # Message-ID постоянен для сообщения outbox: повтор после сбоя почтовые клиенты склеят с оригиналом
+            EmailMessage(payload['subject'], payload['body'], payload['from_email'], payload['to'],
+                         reply_to=payload.get('reply_to') or None, connection=self.connection,
+                         headers={'Message-ID': f'<outbox.{message.id}@{DNS_NAME}>'}).send()
+        except Exception:
+            # Разорванное соединение не должно ронять остальные письма пачки: следующее откроет новое
+            with suppress(Exception):
+                self.close()
+            raise
+
+    def close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_DELAY))
+
+
+def claim_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Берет пачку готовых писем короткой транзакцией: строки выбираются
+    FOR UPDATE SKIP LOCKED, и им сразу выставляется аренда (available_at)
+    и засчитывается попытка. Параллельные воркеры делят очередь без ожидания,
+    а блокировки не держатся, пока идет SMTP.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.Status.PENDING, topic=EMAIL_TOPIC, available_at__lte=now)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        for message in messages:
+            message.attempts += 1
+            message.available_at = now + timedelta(seconds=OUTBOX_LEASE)
+        OutboxMessage.objects.bulk_update(messages, ['attempts', 'available_at'])
+    return messages
+
+
+def _mark_failed(message, error):
+    message.last_error = f'{type(error).__name__}: {error}'
+    if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+        message.status = OutboxMessage.Status.FAILED
+        logger.error('Сообщение outbox #%s не отправлено за %d попыток: %s',
+                     message.id, message.attempts, message.last_error)
+    else:
+        message.available_at = timezone.now() + _retry_delay(message.attempts)
+        logger.warning('Сообщение outbox #%s: попытка %d не удалась, повтор позже',
+                       message.id, message.attempts, exc_info=True)
+    OutboxMessage.objects.filter(pk=message.pk).update(
+        status=message.status, available_at=message.available_at, last_error=message.last_error
+    )
+
+
+def process_outbox(mailer, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Отправляет одну пачку писем вне транзакции и возвращает их число. Каждое
+    письмо помечается отдельным UPDATE сразу после отправки, поэтому сбой
+    посреди пачки повторит только неотмеченные письма. Доставка — «хотя бы
+    один раз»: письмо, отправленное перед падением воркера, уйдет повторно
+    по истечении аренды.
+    """
+    messages = claim_batch(batch_size)
+    for message in messages:
+        try:
+            mailer.send(message)
+        except Exception as error:
+            _mark_failed(message, error)
+        else:
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                status=OutboxMessage.Status.SENT, processed_at=timezone.now(), last_error=''
+            )
+    return len(messages)
+
+
+def drain_outbox(max_batches=OUTBOX_MAX_BATCHES, batch_size=OUTBOX_BATCH_SIZE):
+    """Обрабатывает готовые сообщения пачками через одно SMTP-соединение; возвращает их число."""
+    mailer = _Mailer()
+    processed = 0
+    try:
+        for _ in range(max_batches):
+            count = process_outbox(mailer, batch_size)
+            processed += count
+            if count < batch_size:
+                break
+    finally:
+        mailer.close()
+    return processed
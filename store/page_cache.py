@@ -0,0 +1,97 @@
+import hashlib
+import re
+from functools import wraps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from .cache_namespaces import bump_generations, get_generations, versioned_key
+
+# Части сессии, от которых зависят счетчики в шапке и иконки на карточках
+PERSONAL_SESSION_KEYS = (settings.CART_SESSION_ID, settings.WISH_SESSION_ID, settings.COMPARISON_SESSION_ID)
+CSRF_SLOT = '__csrf_token__'
+CSRF_META_RE = re.compile(r'<meta name="csrf-token" content="([^"]+)">')
+# В base.html метка всегда "0"; при отдаче из кэша она включает догрузку персональных данных
+PERSONAL_STATE_OFF = '<meta name="personal-state" content="0">'
+PERSONAL_STATE_ON = '<meta name="personal-state" content="1">'
+
+
+def invalidate_page_tags(*tags):
+    """Новое поколение тега делает устаревшими все страницы, сохраненные с этим тегом."""
+    bump_generations(*tags)
+
+
+def has_personal_state(request):
+    return any(request.session.get(key) for key in PERSONAL_SESSION_KEYS)
+
+
+def _page_cache_key(request):
+    ajax = request.headers.get('x-requested-with', '')
+    raw = f'{request.get_full_path()}|{ajax}'
+    return versioned_key(f'page_{hashlib.md5(raw.encode()).hexdigest()}')
+
+
+def _is_cacheable_request(request, bypass_cookies):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # len() не помечает сообщения прочитанными, в отличие от итерации
+    if len(get_messages(request)):
+        return False
+    return not any(name in request.COOKIES for name in bypass_cookies)
+
+
+def cache_anonymous_page(*tags, timeout=None, bypass_cookies=()):
+    """
+    Кэширует страницу целиком для анонимных посетителей.
+
+    Персональные части вырезаются из закэшированной копии: CSRF-токен
+    подставляется при каждой отдаче, а счетчики корзины, избранного, сравнения
+    и данные корзины догружаются отдельным запросом (api:session-state).
+    Сохраняется только страница, отрисованная для сессии без персональных данных.
+    Теги могут ссылаться на аргументы view, например 'product:{product_slug}',
+    или быть функцией от аргументов view, возвращающей тег; сбрасываются они
+    через invalidate_page_tags из store.signals.
+    bypass_cookies — cookie, при которых страница персональна и не кэшируется
+    (например, недавно просмотренные товары на главной).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not settings.PAGE_CACHE_ENABLED or not _is_cacheable_request(request, bypass_cookies):
+                return view_func(request, *args, **kwargs)
+
+            page_tags = [tag(**kwargs) if callable(tag) else tag.format(**kwargs) for tag in tags]
+            cache_key = _page_cache_key(request)
+            cached = cache.get(cache_key)
+            if cached is not None and cached['versions'] == get_generations(page_tags):
+                content = cached['content'].replace(CSRF_SLOT, get_token(request))
+                if has_personal_state(request):
+                    content = content.replace(PERSONAL_STATE_OFF, PERSONAL_STATE_ON, 1)
+                return HttpResponse(content, content_type=cached['content_type'])
+
+            personal = has_personal_state(request)
+            # Версии берутся до отрисовки: сброс тега во время рендера не должен потеряться
+            versions = None if personal else get_generations(page_tags, create=True)
+            response = view_func(request, *args, **kwargs)
+
+            def store(response):
+                if personal or request.method != 'GET' or response.status_code != 200 or response.streaming:
+                    return
+                content = response.content.decode(response.charset)
+                match = CSRF_META_RE.search(content)
+                if match:
+                    content = content.replace(match.group(1), CSRF_SLOT)
+                cache.set(cache_key, {
+                    'content': content,
+                    'content_type': response['Content-Type'],
+                    'versions': versions,
+                }, timeout or settings.PAGE_CACHE_TIMEOUT)
+
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    """Курсор поврежден или не соответствует текущей сортировке."""
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации. Итерируется как обычная страница Paginator,
+    но вместо номеров страниц хранит непрозрачные курсоры соседних страниц.
+    """
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу (seek method) для упорядоченного QuerySet.
+
+    Страница выбирается условием `(field, id) > (value, last_id)` вместо OFFSET,
+    поэтому стоимость запроса не растет с номером страницы. Поле сортировки
+    дополняется первичным ключом, чтобы порядок был строгим при совпадающих значениях.
+    Общее количество не пересчитывается на каждой странице, а берется из кэша.
+    """
+    COUNT_CACHE_TIMEOUT = 60 * 5
+
+    def __init__(self, queryset, per_page, ordering='-created'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.descending = ordering.startswith('-')
+        self.field_name = ordering.lstrip('-')
+        annotation = queryset.query.annotations.get(self.field_name)
+        # Сортировать можно и по аннотации (например, rank полнотекстового поиска)
+        self.field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(self.field_name)
+
+    @property
+    def count(self):
+        """Приблизительное (кэшированное) количество объектов в выборке."""
+        unordered = self.queryset.order_by()
+        query_hash = hashlib.md5(str(unordered.query).encode()).hexdigest()
+        cache_key = f'keyset_count_{query_hash}'
+        count = cache.get(cache_key)
+        if count is None:
+            count = unordered.count()
+            cache.set(cache_key, count, self.COUNT_CACHE_TIMEOUT)
+        return count
+
+    def encode_cursor(self, obj, direction):
+        value = getattr(obj, self.field_name)
+        # Значение сохраняется без потери точности: микросекунды даты важны для сравнения
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload = json.dumps({'o': self.ordering, 'v': value, 'id': obj.pk, 'd': direction})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if payload['o'] != self.ordering or payload['d'] not in ('n', 'p'):
+                raise InvalidCursor(cursor)
+            return self.field.to_python(payload['v']), int(payload['id']), payload['d']
+        except (ValueError, TypeError, KeyError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def _seek(self, value, pk, forward):
+        # Идем "вперед" по убыванию для -field, иначе по возрастанию
+        after = forward != self.descending
+        lookup = 'gt' if after else 'lt'
+        condition = Q(**{f'{self.field_name}__{lookup}': value}) | \
+            Q(**{self.field_name: value, f'pk__{lookup}': pk})
+        order = (self.field_name, 'pk') if after else (f'-{self.field_name}', '-pk')
+        return self.queryset.filter(condition).order_by(*order)
+
+    def page(self, cursor=None):
+        """
+        Возвращает страницу, следующую за курсором (или предшествующую ему).
+        Пустой или невалидный курсор означает первую страницу.
+        """
+        try:
+            value, pk, direction = self.decode_cursor(cursor) if cursor else (None, None, 'n')
+        except InvalidCursor:
+            value, pk, direction = None, None, 'n'
+
+        if pk is None:
+            order = (self.ordering, '-pk' if self.descending else 'pk')
+            queryset = self.queryset.order_by(*order)
+        else:
+            queryset = self._seek(value, pk, forward=(direction == 'n'))
+
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+
+        if direction == 'p':
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, pk is not None
+
+        next_cursor = self.encode_cursor(items[-1], 'n') if items and has_next else None
+        previous_cursor = self.encode_cursor(items[0], 'p') if items and has_previous else None
+        return KeysetPage(items, self, next_cursor, previous_cursor)
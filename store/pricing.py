@@ -0,0 +1,73 @@
+from decimal import Decimal
+from typing import Iterable, Optional
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Product
+from .autocomplete import autocomplete
+from .similarity import schedule_similar_rebuild
+from .invalidation import invalidation
+from .facets import category_namespaces
+
+MAX_DISCOUNT = 99
+
+
+def select_products(category=None, brand: Optional[str] = None, product_ids: Optional[Iterable[int]] = None):
+    """Товары для переоценки: категория, бренд и/или список id (условия объединяются через И)."""
+    products = Product.objects.all()
+    if category is not None:
+        products = products.filter(category=category)
+    if brand:
+        products = products.filter(brand=brand)
+    if product_ids is not None:
+        products = products.filter(id__in=list(product_ids))
+    return products
+
+
+def _invalidate_catalog(category_ids, slugs):
+    invalidation.call(autocomplete.mark_stale)
+    invalidation.call(schedule_similar_rebuild, *category_ids)
+    invalidation.touch_tags('catalog', *category_namespaces(category_ids), *(f'product:{slug}' for slug in slugs))
+
+
+@transaction.atomic
+def reprice_products(products, *, discount: Optional[int] = None, base_price: Optional[Decimal] = None,
+                     base_price_percent: Optional[Decimal] = None) -> int:
+    """
+    Переоценивает товары одним UPDATE: задает скидку, базовую цену или меняет
+    базовую цену на процент. final_price пересчитывает сама БД (генерируемая
+    колонка), новое время обновления сбрасывает закэшированные карточки.
+    Сигналы сохранения не вызываются — кэши каталога сбрасываются один раз
+    на всю пачку. Возвращает количество обновленных товаров.
+    """
+    if base_price is not None and base_price_percent is not None:
+        raise ValueError('Укажите либо базовую цену, либо процент ее изменения.')
+    changes = {}
+    if discount is not None:
+        if not 0 <= discount <= MAX_DISCOUNT:
+            raise ValueError(f'Скидка должна быть от 0 до {MAX_DISCOUNT}%.')
+        changes['discount'] = discount
+    if base_price is not None:
+        if base_price <= 0:
+            raise ValueError('Базовая цена должна быть положительной.')
+        changes['base_price'] = base_price
+    if base_price_percent is not None:
+        if base_price_percent <= -100:
+            raise ValueError('Цена не может уменьшиться на 100% и более.')
+        changes['base_price'] = F('base_price') * (100 + base_price_percent) / 100
+    if not changes:
+        raise ValueError('Не указано, что менять: скидка или базовая цена.')
+
+    rows = list(products.order_by().values_list('category_id', 'slug'))
+    if not rows:
+        return 0
+    updated = products.update(**changes, updated=timezone.now())
+    _invalidate_catalog({category_id for category_id, _ in rows}, [slug for _, slug in rows])
+    return updated
+
+
+def bulk_reprice(*, category=None, brand=None, product_ids=None, **changes) -> int:
+    """Переоценка по категории, бренду и/или списку id. Весь каталог сразу не переоценивается."""
+    if category is None and not brand and product_ids is None:
+        raise ValueError('Укажите категорию, бренд или товары для переоценки.')
+    return reprice_products(select_products(category, brand, product_ids), **changes)
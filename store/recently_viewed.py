@@ -0,0 +1,37 @@
+from django.conf import settings
+from .models import Product
+from .cache_namespaces import catalog_cache
+
+MAX_RECENTLY_VIEWED = 5
+COOKIE_SALT = 'store.recently_viewed'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+
+
+def get_recently_viewed_ids(request):
+    """Id недавно просмотренных товаров из подписанной cookie, последний просмотренный — первым."""
+    value = request.get_signed_cookie(settings.RECENTLY_VIEWED_COOKIE, default='', salt=COOKIE_SALT)
+    return [int(pid) for pid in value.split(',') if pid.isdigit()][:MAX_RECENTLY_VIEWED]
+
+
+def remember_viewed_product(request, response, product_id):
+    """
+    Переносит товар в начало списка и пишет cookie в ответ. Если товар уже
+    первый, ответ не меняется: повторные просмотры обходятся без Set-Cookie.
+    """
+    ids = get_recently_viewed_ids(request)
+    if ids[:1] == [product_id]:
+        return
+    ids = [product_id, *(pid for pid in ids if pid != product_id)][:MAX_RECENTLY_VIEWED]
+    response.set_signed_cookie(
+        settings.RECENTLY_VIEWED_COOKIE, ','.join(map(str, ids)), salt=COOKIE_SALT,
+        max_age=COOKIE_MAX_AGE, secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+    )
+
+
+def resolve_product_id(slug):
+    """Id доступного товара по слагу для страниц, отданных из кэша, где представление не выполнялось."""
+    return catalog_cache.get_or_set(
+        f'product_id_{slug}',
+        lambda: Product.objects.available().filter(slug=slug).values_list('id', flat=True).first(),
+        60 * 60,
+    )
@@ -1,8 +1,13 @@
-from typing import Dict, Optional
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Avg, Count, Q
 from .models import Product, Review
 from .forms import ReviewForm
 
+RATING_VALUES = range(1, 6)
+
 
 def add_review(user: User, product: Product, data: Dict) -> Optional[Review]:
     """
@@ -25,4 +30,69 @@ def add_review(user: User, product: Product, data: Dict) -> Optional[Review]:
     new_review.author_name = user.get_full_name() or user.username
     new_review.save()
     
-    return new_review
\ No newline at end of file
+    return new_review
+
+
+def _rating_aggregates():
+    """Агрегаты по активным отзывам: среднее, количество и гистограмма оценок 1..5."""
+    active = Q(is_active=True)
+    aggregates = {
+        'avg': Avg('rating', filter=active),
+        'count': Count('id', filter=active),
+    }
+    for value in RATING_VALUES:
+        aggregates[f'r{value}'] = Count('id', filter=active & Q(rating=value))
+    return aggregates
+
+
+def _rating_fields(row: Dict) -> Dict:
+    avg = row['avg'] or 0
+    return {
+        'rating_avg': Decimal(avg).quantize(Decimal('0.01')),
+        'rating_count': row['count'],
+        'rating_histogram': [row[f'r{value}'] for value in RATING_VALUES],
+    }
+
+
+@transaction.atomic
+def update_product_rating(product_id: int) -> None:
+    """
+    Пересчитывает сохраненную статистику отзывов одного товара.
+    Строка товара блокируется, чтобы параллельные изменения отзывов
+    одного товара применялись последовательно и не затирали друг друга.
+    Записывает поля через update(), не вызывая сигналы сохранения Product.
+    """
+    locked = Product.objects.select_for_update().filter(pk=product_id)
+    if not locked.exists():
+        return
+    row = Review.objects.filter(product_id=product_id).aggregate(**_rating_aggregates())
+    locked.update(**_rating_fields(row))
+
+
+def rebuild_product_ratings(product_ids: Optional[Iterable[int]] = None, batch_size: int = 500) -> int:
+    """
+    Массово пересчитывает статистику отзывов одним агрегирующим запросом
+    с группировкой по товару и сохраняет ее пакетами через bulk_update.
+    Возвращает количество обновленных товаров.
+    """
+    products = Product.objects.only('id')
+    reviews = Review.objects.all()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        products = products.filter(id__in=product_ids)
+        reviews = reviews.filter(product_id__in=product_ids)
+
+    stats = {
+        row['product_id']: _rating_fields(row)
+        for row in reviews.values('product_id').order_by().annotate(**_rating_aggregates())
+    }
+    empty = _rating_fields({'avg': None, 'count': 0, **{f'r{value}': 0 for value in RATING_VALUES}})
+
+    to_update = []
+    for product in products.iterator(chunk_size=batch_size):
+        for field, value in stats.get(product.id, empty).items():
+            setattr(product, field, value)
+        to_update.append(product)
+
+    Product.objects.bulk_update(to_update, ['rating_avg', 'rating_count', 'rating_histogram'], batch_size=batch_size)
+    return len(to_update)
@@ -1,44 +1,111 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
-from .models import Product, Category, Slide, Feature, SpecialOffer
-from blog.models import Article
+import logging
+from django.utils import timezone
+from .models import Product, ProductImage, Category, Slide, Feature, SpecialOffer, Review
+from .services import update_product_rating
+from .autocomplete import autocomplete
+from .similarity import schedule_similar_rebuild
+from .characteristics import sync_product_characteristics
+from .images import schedule_image_generation
+from .invalidation import invalidation
+from .facets import category_namespaces
+from .cache_namespaces import category_namespace
+from blog.models import Article, Comment
+
+logger = logging.getLogger('store.invalidation')
+
+@receiver(post_save, sender=Product)
+def sync_characteristics(sender, instance, raw=False, **kwargs):
+    """Обновляет типизированную копию характеристик для фасетов и фильтров."""
+    if raw:
+        # После loaddata таблица пересобирается командой rebuild_characteristics
+        return
+    sync_product_characteristics(instance)
+
+@receiver(post_save, sender=Product)
+def generate_images(sender, instance, raw=False, **kwargs):
+    """Варианты нового основного изображения генерируются в фоне, а не при первом показе."""
+    if raw or not instance.image:
+        return
+    if (instance.image_manifest or {}).get('source') != instance.image.name:
+        invalidation.call(schedule_image_generation, instance.pk)
 
 @receiver([post_save, post_delete], sender=Product)
 def clear_product_related_cache(sender, instance, **kwargs):
     """Очищает кэш, связанный с товарами, при их изменении."""
-    if instance.category:
-        cache.delete(f'similar_products_{instance.category.slug}')
-    cache.delete('bestsellers_4')
-    print(f"Сигнал от Product '{instance}': Очистка кэша, связанного с товарами.")
+    previous_category_id = getattr(instance, '_loaded_category_id', None)
+    if not kwargs.get('raw'):
+        # Похожие товары пересчитываются в фоне только для затронутых категорий
+        invalidation.call(schedule_similar_rebuild, instance.category_id, previous_category_id)
+    instance._loaded_category_id = instance.category_id
+    invalidation.call(autocomplete.mark_stale)
+    product_tags = {f'product:{slug}' for slug in (instance.slug, getattr(instance, '_loaded_slug', None)) if slug}
+    instance._loaded_slug = instance.slug
+    # Сбрасываются страница товара, фасеты и страницы его старой и новой категории и общие списки ('catalog')
+    invalidation.touch_tags('catalog', *product_tags, *category_namespaces([instance.category_id, previous_category_id]))
+    logger.debug("Сигнал от Product '%s': очистка кэша, связанного с товарами.", instance)
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def clear_product_image_cache(sender, instance, **kwargs):
+    """Картинка галереи может быть основной картинкой подсказки поиска и карточки товара."""
+    if kwargs.get('raw') or isinstance(kwargs.get('origin'), Product):
+        return
+    # Новая версия товара делает устаревшими закэшированные карточки
+    Product.objects.filter(pk=instance.product_id).update(updated=timezone.now())
+    invalidation.call(schedule_image_generation, instance.product_id)
+    invalidation.call(autocomplete.mark_stale)
+    for slug, category_slug in Product.objects.filter(pk=instance.product_id).values_list('slug', 'category__slug'):
+        invalidation.touch_tags('catalog', f'product:{slug}', category_namespace(category_slug))
 
 @receiver([post_save, post_delete], sender=Category)
 def clear_category_cache(sender, instance, **kwargs):
     """Очищает кэш категорий при их изменении."""
-    cache.delete('all_categories')
-    cache.delete('home_featured_categories')
-    print(f"Сигнал от Category '{instance}': Очистка кэша категорий.")
+    if kwargs.get('created') is False:
+        # Название категории выводится в карточках ее товаров
+        Product.objects.filter(category=instance).update(updated=timezone.now())
+    invalidation.touch_tags('layout', 'catalog', category_namespace(instance.slug))
+    logger.debug("Сигнал от Category '%s': очистка кэша категорий.", instance)
 
 @receiver([post_save, post_delete], sender=Slide)
 def clear_slides_cache(sender, instance, **kwargs):
     """Очищает кэш слайдов на главной."""
-    cache.delete('home_slides')
-    print(f"Сигнал от Slide '{instance}': Очистка кэша слайдов.")
+    invalidation.touch_tags('home')
+    logger.debug("Сигнал от Slide '%s': очистка кэша слайдов.", instance)
 
 @receiver([post_save, post_delete], sender=Feature)
 def clear_features_cache(sender, instance, **kwargs):
     """Очищает кэш преимуществ на главной."""
-    cache.delete('home_features')
-    print(f"Сигнал от Feature '{instance}': Очистка кэша преимуществ.")
+    invalidation.touch_tags('home')
+    logger.debug("Сигнал от Feature '%s': очистка кэша преимуществ.", instance)
 
 @receiver([post_save, post_delete], sender=SpecialOffer)
 def clear_special_offer_cache(sender, instance, **kwargs):
     """Очищает кэш спецпредложений."""
-    cache.delete('active_special_offer')
-    print(f"Сигнал от SpecialOffer '{instance}': Очистка кэша спецпредложений.")
+    invalidation.touch_tags('layout')
+    logger.debug("Сигнал от SpecialOffer '%s': очистка кэша спецпредложений.", instance)
 
 @receiver([post_save, post_delete], sender=Article)
 def clear_article_cache(sender, instance, **kwargs):
     """Очищает кэш статей на главной при их изменении."""
-    cache.delete('home_latest_articles')
-    print(f"Сигнал от Article '{instance}': Очистка кэша статей на главной.")
\ No newline at end of file
+    invalidation.touch_tags('blog', 'home')
+    logger.debug("Сигнал от Article '%s': очистка кэша статей на главной.", instance)
+
+@receiver([post_save, post_delete], sender=Comment)
+def clear_comment_cache(sender, instance, **kwargs):
+    """Комментарии выводятся на закэшированной странице статьи."""
+    invalidation.touch_tags('blog')
+
+@receiver([post_save, post_delete], sender=Review)
+def update_rating_stats(sender, instance, **kwargs):
+    """Пересчитывает сохраненную статистику отзывов товара при изменении отзыва."""
+    if kwargs.get('raw') or isinstance(kwargs.get('origin'), Product):
+        # Загрузка фикстур пересчитывается массово, а при каскадном удалении товара пересчитывать нечего
+        return
+    update_product_rating(instance.product_id)
+    previous_product_id = getattr(instance, '_loaded_product_id', None)
+    if previous_product_id and previous_product_id != instance.product_id:
+        update_product_rating(previous_product_id)
+    instance._loaded_product_id = instance.product_id
+    slugs = Product.objects.filter(pk__in={instance.product_id, previous_product_id}).values_list('slug', flat=True)
+    invalidation.touch_tags(*(f'product:{slug}' for slug in slugs))
@@ -0,0 +1,136 @@
+from collections import defaultdict
+import numpy as np
+from django.core.cache import cache
+from .models import Product
+from .characteristics import flatten_characteristics, to_number
+from .loaders import load_products
+
+# Сколько соседей хранится у товара (с запасом: часть может закончиться на складе)
+SIMILAR_PRODUCTS_STORED = 8
+SIMILAR_PRODUCTS_SHOWN = 4
+PRICE_BANDS = 5
+# Вклад групп признаков в итоговое косинусное сходство
+FEATURE_WEIGHTS = {'characteristics': 1.0, 'brand': 0.7, 'collection': 0.7, 'price': 1.0}
+# Сходство считается блоками строк, чтобы матрица не росла как n^2 для больших категорий
+BLOCK_SIZE = 1024
+REBUILD_PENDING_KEY = 'similar_products_pending_{}'
+
+
+def build_feature_matrix(rows):
+    """
+    Векторизует товары: числовые характеристики нормируются (z-score),
+    текстовые, бренд и коллекция кодируются one-hot, цена — ценовым
+    диапазоном по квантилям с частичным весом у соседних диапазонов.
+    rows — последовательность (brand, collection, final_price, characteristics).
+    """
+    n = len(rows)
+    numeric = defaultdict(dict)
+    onehot = defaultdict(list)
+    for i, (brand, collection, _, characteristics) in enumerate(rows):
+        for _, name, value in flatten_characteristics(characteristics):
+            number = to_number(value)
+            if number is not None:
+                numeric[name][i] = number
+            else:
+                onehot[('characteristics', name, str(value))].append(i)
+        if brand:
+            onehot[('brand', brand)].append(i)
+        if collection:
+            onehot[('collection', collection)].append(i)
+
+    columns = []
+    for name, values in numeric.items():
+        column = np.zeros(n, dtype=np.float32)
+        data = np.fromiter(values.values(), dtype=np.float32, count=len(values))
+        std = data.std()
+        if std == 0:
+            continue
+        column[list(values)] = (data - data.mean()) / std
+        columns.append(column * FEATURE_WEIGHTS['characteristics'])
+    for key, indices in onehot.items():
+        # Значение, общее для всех товаров, ничего не различает
+        if len(indices) == n:
+            continue
+        column = np.zeros(n, dtype=np.float32)
+        column[indices] = FEATURE_WEIGHTS[key[0]]
+        columns.append(column)
+
+    prices = np.log1p(np.array([float(row[2] or 0) for row in rows], dtype=np.float32))
+    edges = np.quantile(prices, np.linspace(0, 1, PRICE_BANDS + 1)[1:-1]) if n else []
+    bands = np.searchsorted(edges, prices, side='right')
+    price_columns = np.zeros((n, PRICE_BANDS), dtype=np.float32)
+    for offset, weight in ((0, 1.0), (-1, 0.5), (1, 0.5)):
+        neighbour = bands + offset
+        valid = (neighbour >= 0) & (neighbour < PRICE_BANDS)
+        price_columns[np.nonzero(valid)[0], neighbour[valid]] = weight * FEATURE_WEIGHTS['price']
+
+    matrix = np.column_stack(columns + [price_columns]) if columns else price_columns
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_k_neighbours(matrix, k=SIMILAR_PRODUCTS_STORED):
+    """Индексы k ближайших по косинусу строк для каждой строки (по убыванию сходства)."""
+    n = len(matrix)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.intp)
+    result = np.empty((n, k), dtype=np.intp)
+    for start in range(0, n, BLOCK_SIZE):
+        block = matrix[start:start + BLOCK_SIZE] @ matrix.T
+        rows = np.arange(len(block))
+        block[rows, rows + start] = -np.inf
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(block, candidates, axis=1), axis=1, kind='stable')
+        result[start:start + BLOCK_SIZE] = np.take_along_axis(candidates, order, axis=1)
+    return result
+
+
+def build_similar_index(category_ids=None, batch_size=500):
+    """
+    Пересчитывает соседей для товаров указанных категорий (или всего каталога)
+    и сохраняет их id в Product.similar_ids. Похожие ищутся внутри категории,
+    поэтому изменение одного товара пересчитывает только его категорию.
+    Возвращает количество обновленных товаров.
+    """
+    products = Product.objects.filter(available=True)
+    if category_ids is not None:
+        products = products.filter(category_id__in=category_ids)
+
+    by_category = defaultdict(list)
+    fields = ('id', 'category_id', 'brand', 'collection', 'final_price', 'characteristics')
+    for product_id, category_id, *row in products.values_list(*fields).order_by('id'):
+        by_category[category_id].append((product_id, row))
+
+    to_update = []
+    for items in by_category.values():
+        ids = np.array([product_id for product_id, _ in items])
+        neighbours = top_k_neighbours(build_feature_matrix([row for _, row in items]))
+        for product_id, row in zip(ids, neighbours):
+            to_update.append(Product(pk=int(product_id), similar_ids=ids[row].tolist()))
+
+    Product.objects.bulk_update(to_update, ['similar_ids'], batch_size=batch_size)
+    return len(to_update)
+
+
+def schedule_similar_rebuild(*category_ids):
+    """
+    Ставит пересчет категорий в очередь Celery. Повторные изменения одной
+    категории, пока задача еще не началась, новых задач не создают.
+    """
+    from .tasks import rebuild_similar_products
+
+    pending = [cid for cid in {*category_ids} if cid and cache.add(REBUILD_PENDING_KEY.format(cid), 1, 60 * 5)]
+    if pending:
+        rebuild_similar_products.delay(sorted(pending))
+
+
+def get_similar_products(product, limit=SIMILAR_PRODUCTS_SHOWN):
+    """
+    Похожие товары из предрассчитанного индекса в порядке сходства.
+    Пока индекс для товара не построен, берутся товары той же категории.
+    """
+    if not product.similar_ids:
+        return list(Product.objects.available().filter(category_id=product.category_id).exclude(id=product.id)[:limit])
+    return load_products(product.similar_ids, limit)
@@ -0,0 +1,45 @@
+from celery import shared_task
+from django.core.cache import cache
+from .similarity import build_similar_index, REBUILD_PENDING_KEY
+from .bestsellers import build_bestsellers, REBUILD_PENDING_KEY as BESTSELLERS_PENDING_KEY
+from .images import GENERATION_PENDING_KEY, generate_product_images as build_product_images
+from .outbox import drain_outbox as process_outbox_batches
+
+
+@shared_task
+def rebuild_similar_products(category_ids=None):
+    """
+    Задача пересчета индекса похожих товаров для категорий (или всего каталога).
+    """
+    if category_ids:
+        cache.delete_many([REBUILD_PENDING_KEY.format(cid) for cid in category_ids])
+    return build_similar_index(category_ids)
+
+
+@shared_task
+def rebuild_bestsellers():
+    """
+    Периодическая задача пересчета рейтингов продаж (см. CELERY_BEAT_SCHEDULE);
+    ставится и при промахе кэша рейтинга.
+    """
+    cache.delete(BESTSELLERS_PENDING_KEY)
+    return len(build_bestsellers())
+
+
+@shared_task
+def generate_product_images(product_id):
+    """
+    Задача генерации вариантов изображений товара и его манифеста сразу после загрузки.
+    """
+    cache.delete(GENERATION_PENDING_KEY.format(product_id))
+    return build_product_images(product_id)
+
+
+@shared_task
+def drain_outbox():
+    """
+    Задача отправки сообщений outbox (store.outbox): запускается после коммита
+    транзакции, записавшей сообщение, и по расписанию — для повторов и на случай
+    недоступного брокера.
+    """
+    return process_outbox_batches()
@@ -1,32 +1,40 @@
 from django import template
-from django.conf import settings
-from store.models import Product
+from store.loaders import load_products
+from store.recently_viewed import get_recently_viewed_ids
+from store.cards import render_product_cards
+from store.bestsellers import DEFAULT_WINDOW, get_bestsellers as bestseller_products
 
 register = template.Library()
 
-@register.inclusion_tag('store/partials/bestsellers_list.html')
-def get_bestsellers(count=4):
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
     """
-    Получает самые продаваемые товары.
+    Выводит карточки товаров сетки из кэша фрагментов.
     """
-    bestsellers = Product.objects.available().order_by('-purchase_count')[:count]
-    return {'bestsellers': bestsellers}
+    wishlist = context.get('wishlist')
+    comparison = context.get('comparison')
+    return render_product_cards(
+        products,
+        wishlist_ids=wishlist.get_product_ids() if wishlist else (),
+        comparison_ids=comparison.get_product_ids() if comparison else (),
+    )
 
-@register.inclusion_tag('store/partials/recently_viewed_list.html')
-def get_recently_viewed(request, count=5):
+@register.inclusion_tag('store/partials/bestsellers_list.html', takes_context=True)
+def get_bestsellers(context, count=4, window=DEFAULT_WINDOW):
     """
-    Получает недавно просмотренные товары из сессии.
+    Получает самые продаваемые товары из кэшированного рейтинга (store.bestsellers).
     """
-    recently_viewed_ids = request.session.get(settings.RECENTLY_VIEWED_SESSION_ID, [])
-    
-    if not recently_viewed_ids:
-        return {'recently_viewed_products': []}
-        
+    bestsellers = bestseller_products(window=window, limit=count)
+    return {'bestsellers': bestsellers, 'wishlist': context.get('wishlist'), 'comparison': context.get('comparison')}
 
-    products = Product.objects.available().filter(id__in=recently_viewed_ids)
-    
-
-    product_map = {p.id: p for p in products}
-    ordered_products = [product_map[pid] for pid in recently_viewed_ids if pid in product_map][:count]
-    
-    return {'recently_viewed_products': ordered_products}
\ No newline at end of file
+@register.inclusion_tag('store/partials/recently_viewed_list.html', takes_context=True)
+def get_recently_viewed(context, request, count=5):
+    """
+    Получает недавно просмотренные товары из подписанной cookie
+    одним запросом (store.loaders).
+    """
+    return {
+        'recently_viewed_products': load_products(get_recently_viewed_ids(request), count),
+        'wishlist': context.get('wishlist'),
+        'comparison': context.get('comparison'),
+    }
\ No newline at end of file
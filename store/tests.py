@@ -1,17 +1,56 @@
-from django.test import TestCase, Client
-from django.urls import reverse
-from django.contrib.auth.models import User
-from .models import Product, Review
-from .factories import ProductFactory, UserFactory, ReviewFactory, CategoryFactory
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
 from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMessage, get_connection
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from orders.services import place_order
+from .autocomplete import AutocompleteService, autocomplete
+from .bestsellers import REBUILD_PENDING_KEY as BESTSELLERS_PENDING_KEY
+from .bestsellers import bestsellers_cache_key, build_bestsellers, get_bestseller_ids
+from .cache_namespaces import bump_generations, catalog_cache, home_cache, layout_cache
+from .cards import WISHLIST_SLOT, card_cache_key, render_product_cards
+from .factories import CategoryFactory, ProductFactory, ReviewFactory, UserFactory
+from .facets import build_facet_index, get_category_facets
+from .images import generate_product_images
+from .invalidation import invalidation
+from .loaders import load_products
+from .local_cache import local_cache, subscriber
+from .models import OutboxMessage, Product, ProductImage, Review
+from .outbox import claim_batch, drain_outbox, enqueue_email
+from .page_cache import CSRF_SLOT
+from .pagination import KeysetPaginator
+from .pricing import bulk_reprice
+from .recently_viewed import get_recently_viewed_ids
+from .similarity import build_similar_index
 
 # --- Тесты Моделей ---
 class StoreModelTests(TestCase):
 
     def setUp(self):
-        self.product_no_discount = ProductFactory(base_price=Decimal('1000.00'), discount=0)
-        self.product_with_discount = ProductFactory(base_price=Decimal('2000.00'), discount=25)
-        self.product_unavailable = ProductFactory(stock=0, available=False)
+        # Сбросы кэша копятся до коммита транзакции (store.invalidation), а TestCase не коммитит — выполняем колбэки явно
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product_no_discount = ProductFactory(base_price=Decimal('1000.00'), discount=0)
+            self.product_with_discount = ProductFactory(base_price=Decimal('2000.00'), discount=25)
+            self.product_unavailable = ProductFactory(stock=0, available=False)
 
     def test_product_price_property(self):
         """Тестирует свойство 'price' для товаров со скидкой и без."""
@@ -45,16 +84,308 @@ class StoreModelTests(TestCase):
         self.product_no_discount.refresh_from_db()
         self.assertEqual(self.product_no_discount.review_count, 2)
         self.assertEqual(self.product_no_discount.average_rating, 4.0)
+        self.assertEqual(self.product_no_discount.rating_histogram, [0, 0, 1, 0, 1])
+
+    def test_product_rating_stats_follow_review_changes(self):
+        """Сохраненная статистика обновляется при правке, скрытии, переносе и удалении отзыва."""
+        product = self.product_no_discount
+        review = ReviewFactory(product=product, rating=5, is_active=True)
+        ReviewFactory(product=product, rating=2, is_active=True)
+
+        review.rating = 4
+        review.save()
+        product.refresh_from_db()
+        self.assertEqual(product.average_rating, Decimal('3.00'))
+
+        review.is_active = False
+        review.save()
+        product.refresh_from_db()
+        self.assertEqual((product.rating_count, product.rating_histogram), (1, [0, 1, 0, 0, 0]))
+
+        review = Review.objects.get(pk=review.pk)
+        review.is_active = True
+        review.product = self.product_with_discount
+        review.save()
+        product.refresh_from_db()
+        self.product_with_discount.refresh_from_db()
+        self.assertEqual(product.rating_count, 1)
+        self.assertEqual(self.product_with_discount.rating_count, 1)
+
+        Review.objects.filter(product=product).delete()
+        product.refresh_from_db()
+        self.assertEqual((product.rating_count, product.average_rating), (0, Decimal('0.00')))
+
+    def test_rebuild_product_ratings(self):
+        """Массовый пересчет восстанавливает статистику, записанную в обход сигналов."""
+        ReviewFactory(product=self.product_no_discount, rating=5, is_active=True)
+        Review.objects.update(rating=1)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.product_no_discount.refresh_from_db()
+        self.assertEqual(self.product_no_discount.rating_histogram, [1, 0, 0, 0, 0])
+
+
+# --- Тесты сервисов и кэша ---
+class StoreServiceTests(TestCase):
+
+    def setUp(self):
+        # Локальный кэш живет в процессе и не откатывается вместе с транзакцией теста
+        local_cache.discard_namespaces()
+
+    def test_bestseller_windows(self):
+        """Рейтинги продаж считаются по окнам и категориям из позиций заказов."""
+        recent, old = ProductFactory(), ProductFactory()
+        customer = {'first_name': 'Тест', 'last_name': 'Тестов', 'email': 'test@example.com',
+                    'address': 'ул. Тестовая, 1', 'postal_code': '123456', 'city': 'Тест-сити'}
+        recent_order, old_order = Order.objects.create(**customer), Order.objects.create(**customer)
+        Order.objects.filter(pk=old_order.pk).update(created=timezone.now() - timezone.timedelta(days=60))
+        OrderItem.objects.create(order=recent_order, product=recent, price=recent.final_price, quantity=2)
+        OrderItem.objects.create(order=old_order, product=old, price=old.final_price, quantity=5)
+
+        build_bestsellers()
+        self.assertEqual(get_bestseller_ids('7d'), [recent.id])
+        self.assertEqual(get_bestseller_ids('30d', category_id=old.category_id), [])
+        self.assertEqual(get_bestseller_ids('all')[:2], [old.id, recent.id])
+        self.assertEqual(get_bestseller_ids('all', category_id=old.category_id), [old.id])
+
+    def test_bestsellers_cache_miss_rebuilds_in_background(self):
+        """Промах кэша рейтинга не пересчитывает его в запросе: отдается рейтинг за все время, пересчет — в Celery."""
+        category = CategoryFactory()
+        cache.delete_many([bestsellers_cache_key('7d', category.id), bestsellers_cache_key('all', category.id),
+                           BESTSELLERS_PENDING_KEY])
+        with mock.patch('store.tasks.rebuild_bestsellers.delay') as delay, \
+                mock.patch('store.bestsellers.build_bestsellers') as build:
+            self.assertEqual(get_bestseller_ids('7d', category_id=category.id), [])
+            cache.set(bestsellers_cache_key('all', category.id), [42])
+            self.assertEqual(get_bestseller_ids('7d', category_id=category.id), [42])
+        build.assert_not_called()
+        # Повторный промах, пока задача не началась, новую не ставит
+        delay.assert_called_once_with()
+        cache.delete_many([bestsellers_cache_key('all', category.id), BESTSELLERS_PENDING_KEY])
+
+    def test_similar_products_index(self):
+        """Похожие товары ищутся внутри категории по характеристикам, бренду и цене."""
+        category = CategoryFactory()
+
+        def chars(width, mechanism):
+            return {'Основные параметры': {'Ширина, см': width}, 'Дополнительно': {'Механизм': mechanism}}
+
+        product = ProductFactory(category=category, brand='Орион', collection='Лофт', base_price=Decimal('50000'), discount=0,
+                                 characteristics=chars('200.0', 'Еврокнижка'))
+        twin = ProductFactory(category=category, brand='Орион', collection='Лофт', base_price=Decimal('52000'), discount=0,
+                              characteristics=chars('205.0', 'Еврокнижка'))
+        ProductFactory(category=category, brand='Сканди', collection='Норд', base_price=Decimal('140000'), discount=0,
+                       characteristics=chars('280.0', 'Аккордеон'))
+        other_category = ProductFactory(brand='Орион', collection='Лофт', base_price=Decimal('50000'), discount=0,
+                                        characteristics=chars('200.0', 'Еврокнижка'))
+
+        build_similar_index()
+        product.refresh_from_db()
+        self.assertEqual(product.similar_ids[0], twin.id)
+        self.assertEqual(len(product.similar_ids), 2)
+        self.assertNotIn(other_category.id, product.similar_ids)
+
+        response = self.client.get(product.get_absolute_url())
+        self.assertEqual([p.id for p in response.context['similar_products']][0], twin.id)
+
+    def test_bulk_reprice(self):
+        """Переоценка одним UPDATE: final_price пересчитывает БД, фасеты и карточки сбрасываются."""
+        category = CategoryFactory()
+        sofa = ProductFactory(category=category, brand='Орион', base_price=Decimal('1000.00'), discount=0)
+        chair = ProductFactory(category=category, brand='Вега', base_price=Decimal('333.33'), discount=0)
+        other = ProductFactory(base_price=Decimal('500.00'), discount=0)
+        self.assertEqual(get_category_facets(category)['min_price'], Decimal('333.33'))
+        old_card_key = card_cache_key(sofa)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(bulk_reprice(category=category, discount=15), 2)
+        sofa.refresh_from_db()
+        chair.refresh_from_db()
+        self.assertEqual(sofa.final_price, Decimal('850.00'))
+        self.assertEqual(chair.final_price, Decimal('283.33'))
+        self.assertEqual(Product.objects.get(pk=other.pk).final_price, Decimal('500.00'))
+        self.assertEqual(get_category_facets(category)['min_price'], Decimal('283.33'))
+        self.assertNotEqual(card_cache_key(sofa), old_card_key)
+
+        bulk_reprice(category=category, brand='Орион', base_price_percent=Decimal('10'))
+        sofa.refresh_from_db()
+        self.assertEqual((sofa.base_price, sofa.final_price), (Decimal('1100.00'), Decimal('935.00')))
+        with self.assertRaises(ValueError):
+            bulk_reprice(discount=10)
+
+    def test_facets_invalidated_per_category(self):
+        """Изменение товара сбрасывает фасеты только его старой и новой категории."""
+        sofas, chairs, tables = CategoryFactory(), CategoryFactory(), CategoryFactory()
+        with self.captureOnCommitCallbacks(execute=True):
+            sofa = ProductFactory(category=sofas, available=True)
+            ProductFactory(category=chairs, available=True)
+        build_facet_index([sofas.id, chairs.id])
+
+        with mock.patch('store.facets.build_facet_index', wraps=build_facet_index) as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                ProductFactory(category=tables, available=True)
+            self.assertEqual(get_category_facets(sofas)['total'], 1)
+            self.assertEqual(get_category_facets(chairs)['total'], 1)
+            build.assert_not_called()
+
+            sofa = Product.objects.get(pk=sofa.pk)
+            sofa.category = chairs
+            with self.captureOnCommitCallbacks(execute=True):
+                sofa.save()
+            self.assertEqual(get_category_facets(sofas)['total'], 0)
+            self.assertEqual(get_category_facets(chairs)['total'], 2)
+            self.assertEqual(build.call_count, 2)
+
+    def test_invalidation_collector(self):
+        """Сбросы кэша внутри batch() и транзакции объединяются и выполняются один раз после коммита."""
+        cache.set_many({'test_invalidation_a': 1, 'test_invalidation_b': 1})
+        with mock.patch.object(cache, 'delete_many', wraps=cache.delete_many) as delete_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                with invalidation.batch():
+                    for _ in range(3):
+                        invalidation.delete('test_invalidation_a', 'test_invalidation_b')
+                self.assertEqual(cache.get('test_invalidation_a'), 1)
+            delete_many.assert_called_once()
+        self.assertIsNone(cache.get('test_invalidation_a'))
+
+        # Откат точки сохранения отбрасывает собранное в ней, закоммиченное снаружи применяется
+        cache.set_many({'test_invalidation_a': 1, 'test_invalidation_b': 1})
+        rebuild = mock.Mock(__qualname__='rebuild')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidation.delete('test_invalidation_b')
+            try:
+                with transaction.atomic():
+                    invalidation.delete('test_invalidation_a')
+                    invalidation.call(rebuild, 1)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            invalidation.call(rebuild, 2)
+        rebuild.assert_called_once_with(2)
+        self.assertEqual(cache.get('test_invalidation_a'), 1)
+        self.assertIsNone(cache.get('test_invalidation_b'))
+        invalidation.flush()
+        self.assertEqual(cache.get('test_invalidation_a'), 1)
+
+        with self.captureOnCommitCallbacks(execute=True), invalidation.suspended():
+            invalidation.delete('test_invalidation_a')
+        self.assertEqual(cache.get('test_invalidation_a'), 1)
+        cache.delete('test_invalidation_a')
+
+    def test_cache_namespaces(self):
+        """Сброс пространства имен устаревает все его ключи разом, версия кода отделяет выкладки."""
+        catalog_cache.set_many({'a': 1, 'b': 2})
+        layout_cache.set('a', 3)
+        self.assertEqual(catalog_cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        with override_settings(CACHE_CODE_VERSION='next'):
+            self.assertIsNone(catalog_cache.get('a'))
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidation.touch_tags('catalog')
+        self.assertEqual(catalog_cache.get_many(['a', 'b']), {})
+        self.assertEqual(layout_cache.get('a'), 3)
+
+        self.assertIsNone(layout_cache.get_or_set('none', lambda: None))
+        self.assertIsNone(layout_cache.get_or_set('none', lambda: self.fail('None тоже кэшируется')))
+
+    def test_cache_stampede_protection(self):
+        """Истекший ключ пересчитывает один процесс, остальные получают прежнее значение."""
+        # Redis общий для запусков тестов: новое поколение 'home' убирает значения прошлых прогонов
+        bump_generations('home')
+        compute = mock.Mock(side_effect=[1, 2, 3])
+        self.assertEqual(home_cache.get_or_set('stampede', compute, 60), 1)
+        self.assertEqual(home_cache.get_or_set('stampede', compute, 60), 1)
+        self.assertEqual(compute.call_count, 1)
+
+        expired = time.time() + 120
+        with mock.patch('store.cache_namespaces._now', return_value=expired):
+            # Блокировку держит другой процесс: отдается устаревшее значение без пересчета
+            with mock.patch.object(cache, 'add', return_value=False):
+                self.assertEqual(home_cache.get_or_set('stampede', compute, 60), 1)
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual(home_cache.get_or_set('stampede', compute, 60), 2)
+
+        # Холодный ключ при чужой блокировке: после ожидания значение считается на месте
+        with mock.patch.object(cache, 'add', return_value=False), \
+                mock.patch('store.cache_namespaces.LOCK_WAIT', 0):
+            self.assertEqual(home_cache.get_or_set('stampede_cold', compute, 60), 3)
+
+    def test_layout_cache_local_tier(self):
+        """Данные шапки читаются из памяти процесса, сброс доходит через pub/sub."""
+        compute = mock.Mock(side_effect=['old', 'new'])
+        with mock.patch('store.cache_namespaces.publish_invalidation') as publish:
+            layout_cache.get_or_set('local', compute)
+            with mock.patch.object(cache, 'get') as redis_get:
+                self.assertEqual(layout_cache.get_or_set('local', compute), 'old')
+                redis_get.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidation.touch_tags('layout')
+            publish.assert_called_once_with(('layout',))
+            self.assertEqual(layout_cache.get_or_set('local', compute), 'new')
+
+        # Сообщение о сбросе из другого процесса очищает локальные записи пространства
+        subscriber.handle({'data': json.dumps(['layout'])})
+        self.assertIsNone(local_cache.get((('layout',), 'local')))
+
+        # Сброс пришел, пока значение считалось по старым данным: в память оно не попадает
+        def compute_during_invalidation():
+            subscriber.handle({'data': json.dumps(['layout'])})
+            return 'stale'
+
+        self.assertEqual(layout_cache.get_or_set('racing', compute_during_invalidation), 'stale')
+        self.assertIsNone(local_cache.get((('layout',), 'racing')))
+
+    def test_product_image_manifest(self):
+        """Варианты изображений генерируются заранее, карточка берет srcset из манифеста."""
+        buffer = StringIO()
+        # imagekit помнит в общем Redis, какие варианты уже созданы, по имени исходника:
+        # уникальные имена не дают прошлому прогону выдать файлы из удаленного MEDIA_ROOT за готовые
+        run = uuid.uuid4().hex[:8]
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            def upload(name):
+                data = BytesIO()
+                Image.new('RGB', (1200, 900), 'white').save(data, 'JPEG')
+                return SimpleUploadedFile(f'{run}-{name}', data.getvalue(), content_type='image/jpeg')
+
+            product = ProductFactory(image=upload('sofa.jpg'))
+            gallery = ProductImage.objects.create(product=product, image=upload('sofa-side.jpg'))
+            self.assertIsNone(product.card_image_sources)
+
+            self.assertTrue(generate_product_images(product.id))
+            product.refresh_from_db()
+            sources = product.card_image_sources
+            self.assertRegex(sources['avif'], r'\.avif 400w, .+\.avif 800w$')
+            self.assertRegex(sources['webp'], r'\.webp 400w, .+\.webp 800w$')
+            self.assertEqual((sources['width'], sources['height']), (800, 600))
+            for url in (sources['src'], product.image_thumbnail_url, gallery.thumbnail_url):
+                self.assertTrue(os.path.exists(os.path.join(media_root, url.removeprefix(settings.MEDIA_URL))))
+
+            html = render_product_cards([product])
+            self.assertIn('type="image/avif"', html)
+            self.assertIn(sources['avif'], html)
+
+            # После замены картинки старый манифест не используется, пока не построен новый
+            product.image = upload('sofa-new.jpg')
+            product.save()
+            self.assertIsNone(product.card_image_sources)
+            call_command('generate_images', product_ids=[product.id], workers=1, stdout=buffer)
+            product.refresh_from_db()
+            self.assertEqual(product.image_manifest['source'], product.image.name)
 
 
 # --- Тесты Представлений (Views) ---
 class StoreViewTests(TestCase):
 
     def setUp(self):
+        local_cache.discard_namespaces()
         self.client = Client()
         self.user = UserFactory()
-        self.category = CategoryFactory(name='Категория для вью', slug='view-category')
-        self.product = ProductFactory(category=self.category, name='Тестовый товар', slug='view-product', available=True)
+        # Фоновый поток не видит незакоммиченных данных теста: индекс подсказок перестраивается в запросе
+        background = mock.patch.object(autocomplete, 'background', False)
+        background.start()
+        self.addCleanup(background.stop)
+        # Кэш сбрасывается после коммита (store.invalidation), а TestCase не коммитит — выполняем колбэки явно
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = CategoryFactory(name='Категория для вью', slug='view-category')
+            self.product = ProductFactory(category=self.category, name='Тестовый товар', slug='view-product', available=True)
 
     def test_home_view(self):
         response = self.client.get(reverse('store:home'))
@@ -100,6 +431,275 @@ class StoreViewTests(TestCase):
         prices = [p.final_price for p in products]
         self.assertEqual(prices, sorted(prices))
 
+    def test_product_list_keyset_pagination(self):
+        """Тестирует переход по курсорам вперед и назад без пропусков и дублей."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFactory.create_batch(20, base_price=Decimal('500.00'), discount=0, available=True)
+        url = reverse('store:product_list') + '?ordering=final_price'
+
+        response = self.client.get(url)
+        first_page = list(response.context['products'])
+        self.assertEqual(len(first_page), 15)
+        self.assertFalse(response.context['products'].has_previous())
+
+        next_cursor = response.context['products'].next_cursor
+        response = self.client.get(url + f'&cursor={next_cursor}')
+        second_page = list(response.context['products'])
+        self.assertEqual(len(second_page), 6)
+        self.assertFalse(response.context['products'].has_next())
+        self.assertEqual(len({p.id for p in first_page + second_page}), 21)
+
+        previous_cursor = response.context['products'].previous_cursor
+        response = self.client.get(url + f'&cursor={previous_cursor}')
+        self.assertEqual(list(response.context['products']), first_page)
+
+    def test_search_keyset_pagination_equal_ranks(self):
+        """Курсор по релевантности не теряет и не повторяет товары с одинаковым rank."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFactory.create_batch(12, name='Тумба прикроватная', description='', available=True, stock=5)
+            ProductFactory.create_batch(5, name='Тумба', description='Тумба под телевизор', available=True, stock=5)
+        queryset = Product.objects.available().search('тумба')
+        self.assertLess(len(set(queryset.values_list('rank', flat=True))), 5)
+
+        paginator = KeysetPaginator(queryset, 4, ordering='-rank')
+        page = paginator.page()
+        pages = [list(page)]
+        # Ограничение числа шагов: при неточном сравнении курсор зацикливается на одной странице
+        for _ in range(10):
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+            pages.append(list(page))
+        seen = [product.id for items in pages for product in items]
+        self.assertEqual(sorted(seen), sorted(queryset.values_list('id', flat=True)))
+        self.assertEqual(len(seen), 17)
+
+        # Обратно по курсорам — те же страницы
+        for expected in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(list(page), expected)
+
+    def test_product_list_invalid_cursor(self):
+        """Невалидный курсор или курсор от другой сортировки открывает первую страницу."""
+        response = self.client.get(reverse('store:product_list') + '?cursor=broken')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.product.name)
+
+    def test_product_list_brand_facets(self):
+        """Бренды с количеством товаров берутся из индекса фасетов категории и сбрасываются при изменении товара."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFactory(category=self.category, brand='Орион', base_price=Decimal('900.00'), discount=0)
+            ProductFactory(category=self.category, brand='Орион', base_price=Decimal('100.00'), discount=0)
+
+        facets = get_category_facets(self.category)
+        self.assertIn({'name': 'Орион', 'count': 2}, facets['brands'])
+        self.assertEqual(facets['min_price'], Decimal('100.00'))
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price_buckets']), facets['total'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFactory(category=self.category, brand='Вега')
+        response = self.client.get(reverse('store:product_list_by_category', args=[self.category.slug]))
+        choices = dict(response.context['filter'].filters['brand'].extra['choices'])
+        self.assertEqual(choices['Орион'], 'Орион (2)')
+        self.assertIn('Вега', choices)
+
+    def test_product_list_characteristic_facets(self):
+        """Фасеты характеристик: значения с количеством и диапазоны размеров, фильтрация по ним в каталоге."""
+        with self.captureOnCommitCallbacks(execute=True):
+            velour = ProductFactory(category=self.category, characteristics={
+                'Основные параметры': {'Ширина, см': '180.5'},
+                'Дополнительные характеристики': {'Материал обивки': 'Велюр', 'Гарантия': '18 месяцев'},
+            })
+            leather = ProductFactory(category=self.category, characteristics={
+                'Основные параметры': {'Ширина, см': '240.0'},
+                'Дополнительные характеристики': {'Материал обивки': 'Кожа', 'Гарантия': '18 месяцев'},
+            })
+
+        facets = {facet['name']: facet for facet in get_category_facets(self.category)['characteristics']}
+        # Гарантия одинакова у всех товаров и фильтром не становится
+        self.assertEqual(set(facets), {'Ширина, см', 'Материал обивки'})
+        self.assertEqual(facets['Материал обивки']['values'], [{'value': 'Велюр', 'count': 1}, {'value': 'Кожа', 'count': 1}])
+        width = facets['Ширина, см']
+        self.assertEqual((width['kind'], width['min'], width['max']), ('range', Decimal('180.50'), Decimal('240.00')))
+
+        url = reverse('store:product_list_by_category', args=[self.category.slug])
+        response = self.client.get(url, {facets['Материал обивки']['key']: ['Кожа']})
+        self.assertEqual(list(response.context['products']), [leather])
+        response = self.client.get(url, {width['key'] + '_max': '200'})
+        self.assertEqual(list(response.context['products']), [velour])
+
+        # Изменение характеристик синхронизирует таблицу и сбрасывает фасеты
+        leather.characteristics['Дополнительные характеристики']['Материал обивки'] = 'Рогожка'
+        with self.captureOnCommitCallbacks(execute=True):
+            leather.save()
+        facets = {facet['name']: facet for facet in get_category_facets(self.category)['characteristics']}
+        self.assertIn({'value': 'Рогожка', 'count': 1}, facets['Материал обивки']['values'])
+
+    def test_product_list_full_text_search(self):
+        """Поиск по q= использует полнотекстовый индекс: учитывает словоформы, бренд и артикул."""
+        sofa = ProductFactory(name='Угловой диван Бруклин', brand='Орион', sku='SOF-11111')
+        ProductFactory(name='Кресло-качалка', description='Удобное кресло без дивана рядом')
+        ProductFactory(name='Стеллаж', brand='Вега')
+
+        response = self.client.get(reverse('store:product_list') + '?q=диваны')
+        products = list(response.context['products'])
+        self.assertEqual(products[0], sofa)
+        self.assertEqual(len(products), 2)
+
+        response = self.client.get(reverse('store:product_list') + '?q=орион')
+        self.assertEqual(list(response.context['products']), [sofa])
+
+        response = self.client.get(reverse('store:product_list') + '?q=SOF-11111')
+        self.assertEqual(list(response.context['products']), [sofa])
+
+    def test_product_card_fragment_cache(self):
+        """Карточки берутся из кэша фрагментов, обновляются вместе с товаром и учитывают избранное."""
+        url = reverse('store:product_list')
+        self.client.get(url)
+        self.assertIsNotNone(cache.get(card_cache_key(self.product)))
+
+        self.product.name = 'Переименованный товар'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Переименованный товар')
+
+        self.client.force_login(self.user)
+        session = self.client.session
+        session[settings.WISH_SESSION_ID] = [self.product.id]
+        session.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'fas fa-heart text-sale-pink')
+        self.assertNotContains(response, WISHLIST_SLOT)
+
+    def test_anonymous_page_cache(self):
+        """Анонимная страница отдается из кэша без запросов к БД и сбрасывается сигналами."""
+        url = reverse('store:product_list')
+        first = self.client.get(url)
+        # Просмотр без корзины, избранного и сравнения не создает сессию
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, first.cookies)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, self.product.name)
+        self.assertNotContains(response, CSRF_SLOT)
+
+        self.product.name = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertContains(self.client.get(url), 'Новое название')
+
+    def test_anonymous_page_cache_scoped_tags(self):
+        """Заказ сбрасывает закэшированные страницы только заказанных товаров и их категорий."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ordered = ProductFactory(category=self.category, stock=5, available=True)
+            other = ProductFactory(stock=5, available=True)
+        ordered_urls = [ordered.get_absolute_url(), reverse('store:product_list_by_category', args=[self.category.slug])]
+        other_urls = [other.get_absolute_url(), reverse('store:product_list_by_category', args=[other.category.slug])]
+        # Второй просмотр кэшированной страницы товара заодно кэширует id товара для недавно просмотренных
+        for url in (ordered_urls + other_urls) * 2:
+            self.client.get(url)
+
+        order = Order.objects.create(first_name='Тест', last_name='Тестов', email='test@example.com',
+                                     address='ул. Тестовая, 1', postal_code='123456', city='Тест-сити')
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(order, {ordered.id: 1})
+        for url in other_urls:
+            with self.assertNumQueries(0):
+                self.client.get(url)
+        for url in ordered_urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            self.assertTrue(queries, url)
+
+    def test_anonymous_page_cache_personal_state(self):
+        """Персональные данные закэшированной страницы догружаются через api:session-state."""
+        url = reverse('store:product_list')
+        self.client.get(url)
+        session = self.client.session
+        session[settings.WISH_SESSION_ID] = [self.product.id]
+        session.save()
+
+        response = self.client.get(url)
+        self.assertContains(response, '<meta name="personal-state" content="1">')
+        state = self.client.get(reverse('api:session-state')).json()
+        self.assertEqual(state['wishlist_ids'], [self.product.id])
+        self.assertEqual(state['wishlist_count'], 1)
+
+    def test_recently_viewed_cookie(self):
+        """Просмотры хранятся в подписанной cookie без сессии, список собирается одним запросом."""
+        other = ProductFactory(category=self.category, available=True)
+        self.client.get(self.product.get_absolute_url())
+        response = self.client.get(other.get_absolute_url())
+        self.assertIn(settings.RECENTLY_VIEWED_COOKIE, response.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        # Повторный просмотр того же товара cookie не переписывает
+        self.assertNotIn(settings.RECENTLY_VIEWED_COOKIE, self.client.get(other.get_absolute_url()).cookies)
+
+        request = RequestFactory().get('/')
+        request.COOKIES = {name: morsel.value for name, morsel in self.client.cookies.items()}
+        self.assertEqual(get_recently_viewed_ids(request), [other.id, self.product.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(load_products(get_recently_viewed_ids(request)), [other, self.product])
+
+        # Подделанная cookie игнорируется
+        request.COOKIES[settings.RECENTLY_VIEWED_COOKIE] = f'{self.product.id}:forged'
+        self.assertEqual(get_recently_viewed_ids(request), [])
+
+    def test_contact_message_sent_through_outbox(self):
+        """Форма контактов не ждет SMTP: письмо уходит из outbox пачкой, с повтором после сбоя."""
+        data = {'name': 'Иван', 'email': 'ivan@example.com', 'subject': 'Доставка', 'message': 'Когда привезут диван?'}
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('store:contacts'), data)
+        self.assertRedirects(response, reverse('store:contacts'))
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, OutboxMessage.Status.PENDING)
+        self.assertTrue(callbacks)
+
+        # Повторная постановка с тем же ключом ничего не добавляет
+        enqueue_email('Дубль', 'Дубль', ['admin@example.com'], key=message.key)
+        enqueue_email('Другое письмо', 'Текст', ['admin@example.com'])
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+        with mock.patch.object(EmailMessage, 'send', side_effect=SMTPException('недоступен')):
+            self.assertEqual(drain_outbox(), 2)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.Status.PENDING, 1))
+        self.assertGreater(message.available_at, timezone.now())
+        # До истечения паузы сообщение не берется повторно
+        self.assertEqual(drain_outbox(), 0)
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        with mock.patch('store.outbox.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(drain_outbox(), 2)
+        connect.assert_called_once()
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.Status.SENT).count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, [settings.ADMIN_EMAIL])
+        self.assertEqual(mail.outbox[0].reply_to, ['ivan@example.com'])
+
+    def test_outbox_marks_each_message_after_sending(self):
+        """Письма помечаются по одному: сбой посреди пачки не повторяет уже отправленные."""
+        for number in range(3):
+            enqueue_email(f'Письмо {number}', 'Текст', ['admin@example.com'])
+        send = EmailMessage.send
+
+        def fail_second(email):
+            if email.subject == 'Письмо 1':
+                raise SMTPException('обрыв')
+            return send(email)
+
+        with mock.patch.object(EmailMessage, 'send', fail_second):
+            self.assertEqual(drain_outbox(), 3)
+        statuses = dict(OutboxMessage.objects.values_list('payload__subject', 'status'))
+        self.assertEqual(statuses, {'Письмо 0': 'sent', 'Письмо 1': 'pending', 'Письмо 2': 'sent'})
+        self.assertEqual([email.subject for email in mail.outbox], ['Письмо 0', 'Письмо 2'])
+
+        # Взятое воркером, но не отмеченное письмо скрыто на время аренды
+        OutboxMessage.objects.filter(payload__subject='Письмо 1').update(available_at=timezone.now())
+        self.assertEqual([m.payload['subject'] for m in claim_batch()], ['Письмо 1'])
+        self.assertEqual(claim_batch(), [])
+
     def test_ajax_search_view(self):
         """Тестирует, что API эндпоинт для подсказок возвращает корректный JSON."""
         url = reverse('api:search-suggest') + '?q=Тестовый'
@@ -109,6 +709,51 @@ class StoreViewTests(TestCase):
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['name'], self.product.name)
 
+    def test_search_suggest_typo_tolerance(self):
+        """Подсказки находят товар по бренду, артикулу и с опечаткой в названии."""
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFactory(name='Угловой диван Бруклин', brand='Орион', sku='SOF-12345')
+        url = reverse('api:search-suggest')
+
+        for query in ('Бруклин', 'орио', 'sof-123', 'Бруклн диван', 'углвой'):
+            data = self.client.get(url, {'q': query}).json()
+            self.assertEqual([item['name'] for item in data], ['Угловой диван Бруклин'], query)
+
+    def test_search_suggest_no_db_queries(self):
+        """После построения индекса подсказки отдаются без запросов к БД."""
+        url = reverse('api:search-suggest')
+        self.client.get(url, {'q': 'Тестовый'})
+        with self.assertNumQueries(0):
+            data = self.client.get(url, {'q': 'Тестов'}).json()
+        self.assertEqual(data[0]['name'], self.product.name)
+
+    def test_search_suggest_rebuilds_index_in_background(self):
+        """После изменения каталога подсказки отвечают по прежнему индексу, пока новый строится в фоне."""
+        service = AutocompleteService()
+        service.background = True
+        old_index, new_index = mock.Mock(), mock.Mock()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_build():
+            started.set()
+            release.wait(5)
+            return new_index
+
+        with mock.patch.object(service, 'build', return_value=old_index):
+            self.assertIs(service.get_index(), old_index)
+        with self.captureOnCommitCallbacks(execute=True):
+            service.mark_stale()
+        with mock.patch.object(service, 'build', side_effect=slow_build):
+            self.assertIs(service.get_index(), old_index)
+            self.assertTrue(started.wait(5))
+            self.assertIs(service.get_index(), old_index)
+            release.set()
+            for _ in range(100):
+                if service._index is new_index:
+                    break
+                time.sleep(0.01)
+        self.assertIs(service._index, new_index)
+
     def test_review_submission_authenticated(self):
         """Тестирует отправку отзыва аутентифицированным пользователем."""
         self.client.force_login(self.user)
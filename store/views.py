@@ -1,50 +1,37 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, Sum, F, DecimalField, Prefetch
-from django.db.models.functions import Coalesce
+from django.db import transaction
+from django.db.models import Prefetch
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.generic import TemplateView
-from django.core.mail import send_mail
 from django.conf import settings
 from django.urls import reverse
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
+from django.utils.decorators import method_decorator
 from django.templatetags.static import static
 
 from .models import Product, Category, Review, Subscriber, ContactMessage, Feature, Slide, ProductImage
 from .forms import ReviewForm, ContactForm
 from .filters import ProductFilter
+from .pagination import KeysetPaginator
 from .services import add_review
 from .decorators import track_viewed_product
+from .page_cache import cache_anonymous_page
+from .cache_namespaces import home_cache, catalog_cache, blog_cache, category_namespace
+from .outbox import enqueue_email
+from .similarity import get_similar_products
 from blog.models import Article
-from cart.cart import Cart
+from orders.models import ORDER_LIST_FIELDS
+from cart.cart import get_cart
 from wishlist.wishlist import Wishlist
 
 
+@cache_anonymous_page('layout', 'home', 'catalog', bypass_cookies=(settings.RECENTLY_VIEWED_COOKIE,))
 def home_view(request):
-    slides = cache.get('home_slides')
-    if slides is None:
-        slides = Slide.objects.filter(is_active=True).order_by('display_order')
-        cache.set('home_slides', slides, 60 * 60)
-
-    featured_categories = cache.get('home_featured_categories')
-    if featured_categories is None:
-        featured_categories = Category.objects.filter(is_featured=True)
-        cache.set('home_featured_categories', featured_categories, 60 * 60)
-
-    features = cache.get('home_features')
-    if features is None:
-        features = Feature.objects.all()
-        cache.set('home_features', features, 60 * 60)
-
-    latest_articles = cache.get('home_latest_articles')
-    if latest_articles is None:
-        try:
-            latest_articles = Article.objects.filter(is_published=True, is_featured=True)[:3]
-        except Exception:
-            latest_articles = []
-        cache.set('home_latest_articles', latest_articles, 60 * 60)
+    slides = home_cache.get_or_set('home_slides', lambda: list(Slide.objects.filter(is_active=True).order_by('display_order')), 60 * 60)
+    featured_categories = catalog_cache.get_or_set('home_featured_categories', lambda: list(Category.objects.filter(is_featured=True)), 60 * 60)
+    features = home_cache.get_or_set('home_features', lambda: list(Feature.objects.all()), 60 * 60)
+    latest_articles = blog_cache.get_or_set('home_latest_articles', lambda: list(Article.objects.filter(is_published=True, is_featured=True)[:3]), 60 * 60)
 
     context = {
         'slides': slides,
@@ -55,6 +42,12 @@ def home_view(request):
     return render(request, 'store/home.html', context)
 
 
+def _listing_tag(category_slug=None, **kwargs):
+    """Страница категории зависит только от товаров этой категории, общий список — от всего каталога."""
+    return category_namespace(category_slug) if category_slug else 'catalog'
+
+
+@cache_anonymous_page('layout', _listing_tag)
 def product_list_view(request, category_slug=None):
     category = None
     products_list = Product.objects.available().select_related('category').prefetch_related('images')
@@ -65,31 +58,37 @@ def product_list_view(request, category_slug=None):
 
     query = request.GET.get('q')
     if query:
-        products_list = products_list.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        )
+        products_list = products_list.search(query)
     
-    product_filter = ProductFilter(request.GET, queryset=products_list)
+    product_filter = ProductFilter(request.GET, queryset=products_list, category=category)
     
     filtered_products = product_filter.qs
 
-    if not request.GET.get('ordering'):
-         filtered_products = filtered_products.order_by('-created')
+    if settings.SHOP_KEYSET_PAGINATION:
+        # Курсорная пагинация: без OFFSET и без COUNT(*) на каждой странице
+        default_ordering = '-rank' if query else '-created'
+        ordering = product_filter.form.cleaned_data.get('ordering') or default_ordering
+        paginator = KeysetPaginator(filtered_products, 15, ordering=ordering)
+        products = paginator.page(request.GET.get('cursor'))
+    else:
+        if not request.GET.get('ordering'):
+            filtered_products = filtered_products.order_by('-rank' if query else '-created')
 
-    paginator = Paginator(filtered_products, 15) 
-    page_number = request.GET.get('page')
-    try:
-        products = paginator.page(page_number)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
+        paginator = Paginator(filtered_products, 15)
+        page_number = request.GET.get('page')
+        try:
+            products = paginator.page(page_number)
+        except PageNotAnInteger:
+            products = paginator.page(1)
+        except EmptyPage:
+            products = paginator.page(paginator.num_pages)
 
     context = {
         'category': category,
         'products': products,
         'filter': product_filter,
         'query': query,
+        'keyset_pagination': settings.SHOP_KEYSET_PAGINATION,
     }
     
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
@@ -98,12 +97,15 @@ def product_list_view(request, category_slug=None):
     return render(request, 'store/shop.html', context)
 
 @track_viewed_product
+@cache_anonymous_page('layout', 'product:{product_slug}')
 def product_detail_view(request, product_slug):
     product = get_object_or_404(
         Product.objects.prefetch_related('reviews__author', 'images'), 
         slug=product_slug,
         available=True
     )
+    # Товар загружен один раз: track_viewed_product берет его id отсюда
+    request.viewed_product_id = product.id
     
     reviews = product.reviews.filter(is_active=True)
     
@@ -123,10 +125,7 @@ def product_detail_view(request, product_slug):
             else:
                 review_form = form
     
-    # Получение похожих товаров
-    similar_products = Product.objects.available().filter(
-        category=product.category
-    ).exclude(id=product.id)[:4]
+    similar_products = get_similar_products(product)
 
     context = {
         'product': product,
@@ -138,15 +137,19 @@ def product_detail_view(request, product_slug):
     return render(request, 'store/product_detail.html', context)
 
 def buy_now_view(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id, available=True)
     
-    if product.stock < 1:
+    # Корзина заменяется только если товар доступен с учетом чужих резервов (cart.holds)
+    if cart.hold_stock({product: 1})[product.id] < 1:
         messages.error(request, 'К сожалению, этот товар закончился.')
         return redirect(product.get_absolute_url())
-        
+
     cart.clear()
-    cart.add(product=product, quantity=1)
+    added, _ = cart.try_add(product, 1)
+    if not added:
+        messages.error(request, 'К сожалению, этот товар закончился.')
+        return redirect(product.get_absolute_url())
     return redirect('orders:order_create')
 
 
@@ -164,19 +167,14 @@ def subscribe_view(request):
 
 @login_required
 def account_view(request):
-    total_cost_annotation = Coalesce(
-        Sum(F('items__price') * F('items__quantity')),
-        0,
-        output_field=DecimalField()
-    )
-    orders = request.user.orders.annotate(total_cost=total_cost_annotation) \
-                                .order_by('-created')[:5]
+    orders = request.user.orders.only(*ORDER_LIST_FIELDS).order_by('-created')[:5]
     context = {
         'orders': orders
     }
     return render(request, 'store/account.html', context)
 
 
+@cache_anonymous_page('layout', 'catalog')
 def new_arrivals_view(request):
     products = Product.objects.new_arrivals(days=30)
     context = {
@@ -187,6 +185,7 @@ def new_arrivals_view(request):
     return render(request, 'store/product_listing_base.html', context)
 
 
+@cache_anonymous_page('layout', 'catalog')
 def sale_view(request):
     products = Product.objects.on_sale()
     context = {
@@ -197,6 +196,7 @@ def sale_view(request):
     return render(request, 'store/product_listing_base.html', context)
 
 
+@cache_anonymous_page('layout')
 def about_view(request):
     return render(request, 'store/about.html')
 
@@ -205,17 +205,17 @@ def contact_view(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
         if form.is_valid():
-            contact_message = form.save()
-            try:
-                send_mail(
+            # Письмо уходит через outbox: запрос не ждет SMTP, а сообщение не теряется при его сбое
+            with transaction.atomic():
+                contact_message = form.save()
+                enqueue_email(
                     subject=f"Новое сообщение с сайта: {contact_message.subject}",
-                    message=f"От: {contact_message.name} <{contact_message.email}>\n\n{contact_message.message}",
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[settings.ADMIN_EMAIL],
+                    body=f"От: {contact_message.name} <{contact_message.email}>\n\n{contact_message.message}",
+                    to=[settings.ADMIN_EMAIL],
+                    reply_to=[contact_message.email],
+                    key=f'contact_message:{contact_message.id}',
                 )
-                messages.success(request, 'Ваше сообщение успешно отправлено! Мы свяжемся с вами в ближайшее время.')
-            except Exception as e:
-                messages.error(request, 'Произошла ошибка при отправке сообщения.')
+            messages.success(request, 'Ваше сообщение успешно отправлено! Мы свяжемся с вами в ближайшее время.')
             return redirect('store:contacts')
     else:
         form = ContactForm()
@@ -223,6 +223,7 @@ def contact_view(request):
     return render(request, 'store/contact.html', {'form': form})
 
 
+@method_decorator(cache_anonymous_page('layout'), name='get')
 class StaticPageView(TemplateView):
     def get_template_names(self):
         page_name = self.kwargs['page_name']
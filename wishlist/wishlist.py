@@ -4,10 +4,9 @@ from store.models import Product
 class Wishlist:
     def __init__(self, request):
         self.session = request.session
-        wishlist = self.session.get(settings.WISH_SESSION_ID)
-        if not wishlist:
-            wishlist = self.session[settings.WISH_SESSION_ID] = []
-        self.wishlist = wishlist
+        # Сессия только читается: пустой список в нее не пишется, чтобы просмотр
+        # страниц без добавления в избранное не создавал сессию и cookie
+        self.wishlist = list(self.session.get(settings.WISH_SESSION_ID) or [])
         self.products_cache = None
 
     def add(self, product):
@@ -40,10 +39,12 @@ class Wishlist:
         return self.wishlist
 
     def clear(self):
-        if settings.WISH_SESSION_ID in self.session:
-            del self.session[settings.WISH_SESSION_ID]
-            self.save()
+        self.wishlist = []
+        self.save()
 
     def save(self):
-        self.session.modified = True
+        if self.wishlist:
+            self.session[settings.WISH_SESSION_ID] = self.wishlist
+        elif settings.WISH_SESSION_ID in self.session:
+            del self.session[settings.WISH_SESSION_ID]
         self.products_cache = None
\ No newline at end of file